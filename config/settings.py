@@ -5,16 +5,166 @@ load_dotenv()
 
 # 硅基流动 API 配置
 SILICONFLOW_API_KEY = os.getenv("SILICONFLOW_API_KEY")
-# SILICONFLOW_MODEL = "THUDM/GLM-4.1V-9B-Thinking"  # 或其他合适的多模态模型
+SILICONFLOW_API_URL = os.getenv("SILICONFLOW_API_URL", "https://api.siliconflow.cn/v1/chat/completions")
+SILICONFLOW_MODEL = "THUDM/GLM-4.1V-9B-Thinking"  # 单阶段（vision）模式使用的多模态模型，或其他合适的多模态模型
 
 OCR_MODEL = "deepseek-ai/DeepSeek-OCR" 
 CHAT_MODEL = "deepseek-ai/DeepSeek-R1-0528-Qwen3-8B" 
 
+# 分析方式：two_stage 先OCR再由对话模型提取（可命中本地规则和缓存）；
+# vision 由 SILICONFLOW_MODEL 直接读取截图返回JSON，每张截图一次请求。可用 --mode 按次运行切换
+ANALYSIS_MODE = "two_stage"
+
+
+# 速率限制配置（按模型设置每秒请求数和每分钟token数，遇到429时自动退避）
+RATE_LIMITS = {
+    OCR_MODEL: {"requests_per_second": 2, "tokens_per_minute": 80000},
+    CHAT_MODEL: {"requests_per_second": 2, "tokens_per_minute": 50000},
+    SILICONFLOW_MODEL: {"requests_per_second": 2, "tokens_per_minute": 80000},
+}
+RATE_LIMIT_DEFAULT = {"requests_per_second": 1, "tokens_per_minute": 50000}
+RATE_LIMIT_MAX_RETRIES = 5        # 限流后最多重试次数
+RATE_LIMIT_BACKOFF_BASE = 1.0     # 指数退避基数（秒）
+RATE_LIMIT_BACKOFF_MAX = 60.0     # 单次退避上限（秒）
+
+# HTTP连接池配置（所有阶段和工作线程共用同一个会话）
+HTTP_POOL_SIZE = 16               # 连接池最大连接数，应不小于API阶段的总并发数
+HTTP_CONNECT_TIMEOUT = 10         # 建立连接超时（秒）
+HTTP_READ_TIMEOUT = 180           # 读取响应超时（秒），推理模型响应较慢
+HTTP_MAX_RETRIES = 3              # 连接错误及5xx响应的重试次数
+
+# 异步分析配置
+ASYNC_MAX_CONCURRENCY = 16        # analyze_many 同时处理的截图数上限
+
 
 # 文件路径配置
 SCREENSHOTS_DIR = "data/screenshots"
 OUTPUT_DIR = "output"
 OUTPUT_FILE = os.path.join(OUTPUT_DIR, "running_records.xlsx")
+CACHE_DIR = os.path.join(OUTPUT_DIR, "cache")
+# Excel 每次写盘都会重写整个工作簿，总写盘量约为 行数²/EXCEL_FLUSH_EVERY；程序崩溃时最多丢失
+# 尚未写盘的缓冲行（未启用任务日志时不会自动重新处理）。记录较多时建议使用 --storage sqlite
+EXCEL_FLUSH_EVERY = 200           # Excel 每缓冲多少行写盘一次（结束时总会写出剩余行）
+EXCEL_FLUSH_INTERVAL = 60         # 距上次写盘超过多少秒时，追加新行后立即写盘，None 表示只按行数写盘
+
+
+# 存储后端配置
+STORAGE_BACKEND = "excel"         # 记录存储后端: excel / sqlite / parquet（后两者可用 --export-excel 导出Excel）
+SQLITE_OUTPUT_FILE = os.path.join(OUTPUT_DIR, "running_records.sqlite")
+PARQUET_OUTPUT_DIR = os.path.join(OUTPUT_DIR, "running_records_parquet")  # 每次写盘生成一个分片文件
+STORAGE_FLUSH_EVERY = 500         # SQLite 每多少行提交一次事务 / Parquet 每多少行写一个分片
+EXPORT_EXCEL_FILE = os.path.join(OUTPUT_DIR, "running_records_export.xlsx")  # --export-excel 默认导出路径（不同于Excel后端的记录文件）
+
+
+# 任务日志配置（记录每张截图的处理阶段、状态、尝试次数和耗时，中断后从断点继续）
+JOB_JOURNAL_ENABLED = True
+JOB_JOURNAL_FILE = os.path.join(OUTPUT_DIR, "job_journal.sqlite")
+JOB_CHECKPOINT_EVERY = 100        # 每处理多少张截图写盘一次输出并提交日志
+JOB_MAX_ATTEMPTS = 3              # 单张截图最多尝试次数，超过后需用 --retry-failed 手动重试
+JOB_RETRY_BACKOFF_BASE = 60       # 失败后重试的指数退避基数（秒）
+JOB_RETRY_BACKOFF_MAX = 3600      # 单次退避上限（秒）
+
+
+# 性能指标配置（各阶段耗时、载荷大小、HTTP状态码、重试次数和缓存命中）
+METRICS_ENABLED = True
+METRICS_DIR = os.path.join(OUTPUT_DIR, "metrics")
+METRICS_TRACE_FILE = os.path.join(METRICS_DIR, "trace.jsonl")       # 每个阶段一行JSON，None 表示不输出
+METRICS_TRACE_MAX_SIZE_MB = 20    # 追踪文件超过该大小时轮转为 trace.jsonl.1 等，None 表示不限制（监视模式下会一直增长）
+METRICS_TRACE_BACKUPS = 2         # 轮转时保留的旧追踪文件个数，0 表示直接丢弃
+METRICS_PROMETHEUS_FILE = os.path.join(METRICS_DIR, "metrics.prom")  # Prometheus 文本格式，可由 node_exporter 的 textfile 采集
+METRICS_PORT = None               # 设置后在该端口提供 Prometheus /metrics 接口（适合监视模式）
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)  # 耗时直方图分桶（秒）
+METRICS_MAX_SAMPLES = 10000       # 计算 p50/p95/p99 时每个阶段保留的最近样本数
+
+
+# 图像预处理配置
+PREPROCESS_MAX_SIZE = (1024, 1024)  # 输出图片最大尺寸（等比缩放）
+PREPROCESS_QUALITY = 85           # JPEG 输出质量
+PREPROCESS_RESAMPLE = "LANCZOS"   # 缩放滤波器: LANCZOS / BICUBIC / HAMMING / BILINEAR / BOX / NEAREST
+PREPROCESS_GRAYSCALE = False      # 输出灰度图（JPEG 解码时直接只解码亮度通道）
+PREPROCESS_CROP_BOX = None        # 裁剪到数据区域，按比例 (左, 上, 右, 下)，如 (0, 0.1, 1, 0.6)；None 表示不裁剪
+PREPROCESS_MODE = "default"       # default: 按上述配置缩放; ocr: 按内容优化（灰度、对比度拉伸、裁边、按文字大小选分辨率）
+
+# OCR优化预处理配置（PREPROCESS_MODE = "ocr" 时生效）
+PREPROCESS_OCR_TEXT_HEIGHT = 20   # 缩放后文字行高的目标像素数，文字越大缩得越小
+PREPROCESS_OCR_MIN_SCALE = 0.25   # 最小缩放比例
+PREPROCESS_OCR_QUALITY = 70       # 文字行高达到目标时使用的JPEG质量，文字偏小时使用 PREPROCESS_QUALITY
+PREPROCESS_OCR_CHROME = (0.05, 0.06)  # 竖屏截图顶部状态栏、底部导航栏各裁去的比例
+
+# 图像预处理缓存配置（预处理结果默认只在内存中传递，开启后额外缓存到独立目录）
+PREPROCESS_CACHE_ENABLED = False
+PREPROCESS_CACHE_DIR = os.path.join(CACHE_DIR, "preprocessed")
+
+
+# OCR结果缓存配置（按预处理后图片内容 + OCR引擎/模型/提示词缓存）
+OCR_CACHE_ENABLED = True
+OCR_CACHE_FILE = os.path.join(CACHE_DIR, "ocr_cache.sqlite")
+OCR_CACHE_MAX_SIZE_MB = 200       # 缓存总大小上限，超出时按最近访问时间淘汰
+OCR_CACHE_MAX_AGE_DAYS = 90       # 缓存有效期（天）
+
+# 结构化提取结果缓存配置（按规范化后的OCR文字 + 分析提示词 + 模型缓存）
+CHAT_CACHE_ENABLED = True
+CHAT_CACHE_FILE = os.path.join(CACHE_DIR, "chat_cache.sqlite")
+CHAT_CACHE_MEMORY_ITEMS = 1024    # 内存LRU缓存条目数
+CHAT_CACHE_MAX_SIZE_MB = 50
+CHAT_CACHE_MAX_AGE_DAYS = 90
+
+# 截图内容去重配置（内容相同或只是重新编码的截图在OCR之前拒绝；
+# 感知哈希近似但缩略图像素有明显差异的只记录日志，由记录级去重确认）
+IMAGE_DEDUP_ENABLED = True
+IMAGE_DEDUP_FILE = os.path.join(CACHE_DIR, "image_index.sqlite")
+IMAGE_DEDUP_HASH_SIZE = 16        # dHash 边长，16 即 256 位，越大越能区分同一App版式下的不同记录
+IMAGE_DEDUP_MAX_DISTANCE = 3      # 感知哈希近似的最大汉明距离，近似的截图再比较缩略图像素；None 表示只拒绝内容完全相同的截图
+IMAGE_DEDUP_THUMBNAIL_WIDTH = 256 # 比较像素用的灰度缩略图宽度，需能分辨截图中的数字
+IMAGE_DEDUP_PIXEL_TOLERANCE = 16  # 尺寸相同且缩略图逐像素差值都不超过该值时视为重新编码的副本（0-255）
+
+# 记录级去重配置（同一天、距离和时长相近的记录视为同一次跑步）
+RECORD_DEDUP_ENABLED = True
+RECORD_DEDUP_ACTION = "skip"              # skip: 丢弃; merge: 补全已有记录的空字段; flag: 写入并在日志中标记
+RECORD_DEDUP_DISTANCE_TOLERANCE = 0.05    # 距离容差（公里）
+RECORD_DEDUP_DURATION_TOLERANCE = 30      # 时长容差（秒）
+
+# 本地规则提取配置（命中常见App版式时跳过对话模型）
+RULE_EXTRACTOR_ENABLED = True
+RULE_EXTRACTOR_MIN_CONFIDENCE = 0.85
+RULE_EXTRACTOR_REQUIRED_FIELDS = ("date", "distance_km", "duration", "pace", "calories")
+
+# 批量提取配置（一次请求提取多张截图，均摊提示词开销）
+CHAT_BATCH_SIZE = 4               # 每批最多截图数，1 表示不合并
+CHAT_BATCH_MAX_TOKENS = 4000      # 单批提示词预估token上限
+PIPELINE_CHAT_BATCH_WAIT = 0.5    # 流水线凑批时等待后续截图的最长时间（秒）
+
+# 流式提取配置（边生成边解析，收到字段齐全的JSON对象后立即断开，不等待剩余输出）
+CHAT_STREAM_ENABLED = True        # 单张截图的提取请求使用SSE流式响应，可用 --no-chat-stream 关闭
+CHAT_MAX_TOKENS = None            # 流式提取请求最多生成的token数，None 表示不限制；推理模型的思考内容同样计入，设置过小会在输出JSON前被截断
+
+
+# 本地PaddleOCR配置
+PADDLE_OCR_BATCH_SIZE = 8         # recognize_many 每次送入推理引擎的图片数
+PADDLE_OCR_REC_BATCH_SIZE = 16    # 文字识别模型内部的文本行批大小
+
+# 本地PaddleOCR进程池配置（每个进程常驻一个已加载的模型）
+OCR_POOL_WORKERS = 1              # 进程数，1 表示在主进程中直接使用单个引擎；流水线 OCR 并发数应不小于该值
+OCR_POOL_THREADS_PER_WORKER = None  # 每个进程的推理线程数，None 表示 CPU核数 / 进程数
+OCR_POOL_STARTUP_TIMEOUT = 180    # 等待进程加载模型的超时（秒）
+OCR_POOL_TASK_TIMEOUT = 120       # 单个识别任务超时（秒），超时的进程会被重启
+OCR_POOL_HEALTH_INTERVAL = 30     # 空闲进程健康检查间隔（秒），0 表示不检查
+
+
+# 流水线模式配置（每个阶段独立的并发数与有界队列容量）
+PIPELINE_PREPROCESS_WORKERS = os.cpu_count() or 4  # 预处理进程池大小（顺序模式同样使用）
+PIPELINE_OCR_WORKERS = 4          # OCR 阶段并发数（本地PaddleOCR时内部串行）
+PIPELINE_CHAT_WORKERS = 4         # 对话模型提取阶段并发数
+PIPELINE_OCR_QUEUE_SIZE = 16      # 预处理 -> OCR 队列容量
+PIPELINE_CHAT_QUEUE_SIZE = 16     # OCR -> 提取 队列容量
+PIPELINE_WRITE_QUEUE_SIZE = 64    # 提取 -> 写入 队列容量
+
+
+# 监视模式配置（--watch：常驻运行，截图目录出现新文件时增量处理）
+WATCH_BACKEND = "auto"            # auto: 安装了 watchdog 时使用系统文件通知（Linux 上为 inotify），否则轮询; poll: 始终轮询
+WATCH_POLL_INTERVAL = 1.0         # 轮询目录 / 检查文件是否写完的间隔（秒）
+WATCH_SETTLE_SECONDS = 2.0        # 文件大小和修改时间保持不变多久后视为写入完成（秒）
+WATCH_RESCAN_INTERVAL = 60        # 使用系统通知时的全量扫描间隔（秒），兜底通知丢失的情况
 
 
 # Prompt 模板
@@ -35,6 +185,26 @@ OCR识别的图片信息：
 \{json_format\}
 """
 
+# 单阶段模式的提示词：字段说明和JSON格式与 ANALYSIS_PROMPT 相同，信息来源换成截图本身
+VISION_ANALYSIS_PROMPT = ANALYSIS_PROMPT.replace(
+    "OCR识别的图片信息：\n\{text_content\}\n\n请根据以上OCR识别出的图片信息", "请根据这张跑步记录截图中的信息"
+)
+
+BATCH_ANALYSIS_PROMPT = """
+以下是多张跑步截图的OCR识别信息，每张以 [图片ID] 开头：
+\{batch_content\}
+
+请分别根据每张图片的OCR识别信息，提取以下信息：
+1. 跑步日期 (date) - 格式 YYYY-MM-DD
+2. 距离 (distance_km) - 数字，单位公里
+3. 时间 (duration) - 格式 HH:MM:SS
+4. 平均配速 (pace) - 格式 MM:SS/km
+5. 卡路里消耗 (calories) - 数字，单位千卡
+
+请严格按照以下JSON格式返回结果，results 中每张图片一个元素，image_id 与上面的图片ID一致，不要包含其他内容,如果图片没有相关字段，则为null：
+\{json_format\}
+"""
+
 # JSON格式示例
 JSON_FORMAT_EXAMPLE = """{
   "date": "YYYY-MM-DD",
@@ -42,4 +212,17 @@ JSON_FORMAT_EXAMPLE = """{
   "duration": "HH:MM:SS",
   "pace": "MM:SS/km",
   "calories": 数字
+}"""
+
+BATCH_JSON_FORMAT_EXAMPLE = """{
+  "results": [
+    {
+      "image_id": "图片ID",
+      "date": "YYYY-MM-DD",
+      "distance_km": 数字,
+      "duration": "HH:MM:SS",
+      "pace": "MM:SS/km",
+      "calories": 数字
+    }
+  ]
 }"""
\ No newline at end of file
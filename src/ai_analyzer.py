@@ -2,8 +2,8 @@ import base64
 import json
 import requests
 import re
-import time
 import logging
+import unicodedata
 import os
 import sys
 
@@ -12,91 +12,325 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(current_dir)
 sys.path.insert(0, project_root)
 
-from config.settings import SILICONFLOW_API_KEY, OCR_MODEL, CHAT_MODEL, OCR_PROMPT, ANALYSIS_PROMPT, JSON_FORMAT_EXAMPLE
+from config.settings import (
+    SILICONFLOW_API_KEY, OCR_MODEL, CHAT_MODEL, OCR_PROMPT, ANALYSIS_PROMPT, JSON_FORMAT_EXAMPLE,
+    OCR_CACHE_ENABLED, OCR_CACHE_FILE, OCR_CACHE_MAX_SIZE_MB, OCR_CACHE_MAX_AGE_DAYS,
+    CHAT_CACHE_ENABLED, CHAT_CACHE_FILE, CHAT_CACHE_MEMORY_ITEMS, CHAT_CACHE_MAX_SIZE_MB, CHAT_CACHE_MAX_AGE_DAYS,
+    RULE_EXTRACTOR_ENABLED, RULE_EXTRACTOR_MIN_CONFIDENCE, RULE_EXTRACTOR_REQUIRED_FIELDS,
+    BATCH_ANALYSIS_PROMPT, BATCH_JSON_FORMAT_EXAMPLE, CHAT_BATCH_SIZE, CHAT_BATCH_MAX_TOKENS, OCR_POOL_WORKERS,
+    CHAT_STREAM_ENABLED, CHAT_MAX_TOKENS, SILICONFLOW_MODEL, ANALYSIS_MODE, VISION_ANALYSIS_PROMPT
+)
+from src.api_client import get_client, ResponseTruncatedError
+from src.cache import DiskCache, TieredCache, make_cache_key
+from src.rate_limiter import estimate_tokens
+from src.rule_extractor import RuleBasedExtractor, FIELDS
+from src.image_processor import ProcessedImage, load_image_bytes
+from src.json_stream import JSONObjectScanner
+from src.metrics import get_metrics
 
-# 尝试导入PaddleOCR
-try:
-    from src.paddle_ocr import PaddleOCRWrapper
-    PADDLE_OCR_AVAILABLE = True
-except ImportError:
-    PADDLE_OCR_AVAILABLE = False
-    logging.warning("PaddleOCR 不可用，将使用API方式进行OCR")
+# paddleocr 本身在创建引擎时才导入
+from src.paddle_ocr import PaddleOCRWrapper, PADDLE_OCR_AVAILABLE
+from src.ocr_pool import PaddleOCRPool
+
+# two_stage: OCR + 对话模型；vision: 多模态模型单次请求
+ANALYSIS_MODES = ('two_stage', 'vision')
 
 class AIAnalyzer:
-    def __init__(self, use_paddle_ocr=False):
+    def __init__(self, use_paddle_ocr=False, chat_stream=CHAT_STREAM_ENABLED, analysis_mode=ANALYSIS_MODE):
+        if analysis_mode not in ANALYSIS_MODES:
+            raise ValueError(f"不支持的分析方式: {analysis_mode}，可选 {ANALYSIS_MODES}")
         self.api_key = SILICONFLOW_API_KEY
         self.ocr_model = OCR_MODEL
         self.chat_model = CHAT_MODEL
-        self.api_url = "https://api.siliconflow.cn/v1/chat/completions"
+        self.vision_model = SILICONFLOW_MODEL
+        self.analysis_mode = analysis_mode
+        self.chat_stream = chat_stream
+        self.client = get_client()
+        self.api_url = self.client.api_url
+        # 单阶段模式不做OCR，无需加载本地模型
+        use_paddle_ocr = use_paddle_ocr and analysis_mode == 'two_stage'
         self.use_paddle_ocr = use_paddle_ocr and PADDLE_OCR_AVAILABLE
+        if use_paddle_ocr and not PADDLE_OCR_AVAILABLE:
+            logging.warning("PaddleOCR 不可用，将使用API方式进行OCR")
         
         # 如果选择使用PaddleOCR且可用，则初始化PaddleOCR
         if self.use_paddle_ocr:
-            self.paddle_ocr = PaddleOCRWrapper()
+            # 多进程时每个进程常驻一个模型，否则在当前进程中使用单个引擎
+            self.paddle_ocr = PaddleOCRPool() if OCR_POOL_WORKERS > 1 else PaddleOCRWrapper()
             if not self.paddle_ocr.ocr_engine:
                 logging.warning("PaddleOCR 初始化失败，回退到API方式")
                 self.use_paddle_ocr = False
         else:
             self.paddle_ocr = None
+        
+        # OCR结果缓存
+        self.ocr_cache = None
+        if OCR_CACHE_ENABLED:
+            self.ocr_cache = DiskCache(OCR_CACHE_FILE, OCR_CACHE_MAX_SIZE_MB, OCR_CACHE_MAX_AGE_DAYS, name="OCR缓存")
+        
+        # 结构化提取结果缓存（内存LRU + 磁盘）
+        self.chat_cache = None
+        if CHAT_CACHE_ENABLED:
+            self.chat_cache = TieredCache(
+                DiskCache(CHAT_CACHE_FILE, CHAT_CACHE_MAX_SIZE_MB, CHAT_CACHE_MAX_AGE_DAYS, name="提取缓存"),
+                CHAT_CACHE_MEMORY_ITEMS
+            )
+        
+        # 本地规则提取器
+        self.rule_extractor = RuleBasedExtractor() if RULE_EXTRACTOR_ENABLED else None
     
-    def encode_image(self, image_path):
-        """将图像编码为base64"""
+    def load_image_bytes(self, image_path):
+        """读取图像内容（预处理后的内存图片或文件路径）"""
         try:
-            with open(image_path, "rb") as image_file:
-                encoded = base64.b64encode(image_file.read()).decode('utf-8')
-                logging.info(f"图片编码成功，大小: {len(encoded)} 字符")
-                return encoded
+            return load_image_bytes(image_path)
         except Exception as e:
-            logging.error(f"图片编码失败 {image_path}: {e}")
+            logging.error(f"图片读取失败 {image_path}: {e}")
+            return None
+    
+    def encode_image_bytes(self, image_bytes):
+        """将图像内容编码为base64"""
+        with get_metrics().span('encode', bytes=len(image_bytes)) as span:
+            encoded = base64.b64encode(image_bytes).decode('utf-8')
+            span.set(encoded_bytes=len(encoded))
+        logging.info(f"图片编码成功，大小: {len(encoded)} 字符")
+        return encoded
+    
+    def encode_image(self, image_path):
+        """将图像编码为base64"""
+        image_bytes = self.load_image_bytes(image_path)
+        if image_bytes is None:
             return None
+        return self.encode_image_bytes(image_bytes)
+    
+    def paddle_input(self, image_path):
+        """PaddleOCR 输入：内存图片解码为数组，文件路径原样传入"""
+        # 进程池传给子进程的是JPEG内容，由子进程解码，减少进程间传输的数据量
+        if isinstance(image_path, ProcessedImage) and not isinstance(self.paddle_ocr, PaddleOCRPool):
+            return image_path.to_array()
+        return image_path
+    
+    def close(self):
+        """关闭本地OCR进程池"""
+        if hasattr(self.paddle_ocr, 'close'):
+            self.paddle_ocr.close()
+    
+    def ocr_cache_key(self, image_bytes):
+        """OCR缓存键：图片内容 + OCR引擎 + 模型 + 提示词"""
+        engine = "paddle" if self.use_paddle_ocr else "api"
+        return make_cache_key(image_bytes, engine, self.ocr_model, OCR_PROMPT)
+    
+    def chat_cache_key(self, text_content):
+        """提取缓存键：规范化后的OCR文字 + 分析提示词 + 模型"""
+        # 统一全半角并合并空白，使仅有空白差异的OCR文字命中同一条缓存
+        normalized = unicodedata.normalize("NFKC", text_content)
+        normalized = re.sub(r'\s+', ' ', normalized).strip()
+        prompt_template = ANALYSIS_PROMPT.replace("\{json_format\}", JSON_FORMAT_EXAMPLE)
+        return make_cache_key(normalized, prompt_template, self.chat_model)
+    
+    def vision_cache_key(self, image_bytes):
+        """单阶段提取缓存键：图片内容 + 多模态模型 + 提示词"""
+        return make_cache_key(image_bytes, self.vision_model, VISION_ANALYSIS_PROMPT, JSON_FORMAT_EXAMPLE)
+    
+    def try_rule_extraction(self, text_content):
+        """尝试用本地规则提取，字段齐全且置信度足够时返回跑步数据，否则返回 None"""
+        if not self.rule_extractor:
+            return None
+        running_data, confidence, missing = self.rule_extractor.extract(text_content, RULE_EXTRACTOR_REQUIRED_FIELDS)
+        if missing or confidence < RULE_EXTRACTOR_MIN_CONFIDENCE:
+            return None
+        logging.info(f"规则提取成功（置信度 {confidence}），跳过对话模型调用: {running_data}")
+        return running_data
+    
+    def get_cached_chat_result(self, text_content):
+        """查询提取缓存，返回 (缓存键, 跑步数据或 None)"""
+        if not self.chat_cache:
+            return None, None
+        cache_key = self.chat_cache_key(text_content)
+        cached = self.chat_cache.get(cache_key)
+        if cached is None:
+            return cache_key, None
+        logging.info("提取缓存命中，跳过对话模型调用")
+        return cache_key, json.loads(cached)
+    
+    def cache_stats(self):
+        """返回各缓存的命中统计"""
+        stats = {}
+        if self.ocr_cache:
+            stats['ocr'] = self.ocr_cache.stats()
+        if self.chat_cache:
+            stats['chat'] = self.chat_cache.stats()
+        return stats
+    
+    def build_ocr_payload(self, base64_image):
+        """构建OCR请求载荷"""
+        return {
+            "model": self.ocr_model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": OCR_PROMPT
+                        },
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:image/jpeg;base64,{base64_image}"
+                            }
+                        }
+                    ]
+                }
+            ]
+        }
+    
+    def build_chat_payload(self, text_content):
+        """构建对话模型请求载荷"""
+        # 构建分析提示
+        # 使用 % 格式化避免花括号冲突
+        analysis_prompt = ANALYSIS_PROMPT.replace("\{json_format\}", JSON_FORMAT_EXAMPLE)
+        analysis_prompt = analysis_prompt.replace("\{text_content\}", text_content)
+        
+        payload = {
+            "model": self.chat_model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": analysis_prompt
+                }
+            ],
+            "response_format": {"type": "json_object"}
+        }
+        return payload
+    
+    def build_vision_payload(self, base64_image):
+        """构建单阶段提取请求载荷：截图和 ANALYSIS_PROMPT 的字段格式一起发给多模态模型"""
+        analysis_prompt = VISION_ANALYSIS_PROMPT.replace("\{json_format\}", JSON_FORMAT_EXAMPLE)
+        
+        payload = {
+            "model": self.vision_model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:image/jpeg;base64,{base64_image}"
+                            }
+                        },
+                        {
+                            "type": "text",
+                            "text": analysis_prompt
+                        }
+                    ]
+                }
+            ]
+        }
+        return payload
+    
+    def build_batch_chat_payload(self, batch):
+        """构建批量提取请求载荷，batch 为 [(图片ID, OCR文字), ...]"""
+        batch_content = "\n\n".join(f"[{image_id}]\n{text_content}" for image_id, text_content in batch)
+        analysis_prompt = BATCH_ANALYSIS_PROMPT.replace("\{json_format\}", BATCH_JSON_FORMAT_EXAMPLE)
+        analysis_prompt = analysis_prompt.replace("\{batch_content\}", batch_content)
+        
+        payload = {
+            "model": self.chat_model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": analysis_prompt
+                }
+            ],
+            "response_format": {"type": "json_object"}
+        }
+        return payload
     
     def call_ocr_model(self, image_path):
-        """调用OCR模型识别图片中的文字"""
-        # 如果配置使用PaddleOCR且可用，则优先使用PaddleOCR
-        if self.use_paddle_ocr and self.paddle_ocr:
-            logging.info("使用PaddleOCR进行文字识别")
-            return self.paddle_ocr.recognize_text(image_path)
+        """调用OCR模型识别图片中的文字（结果按图片内容缓存）"""
+        image_bytes = self.load_image_bytes(image_path)
+        if image_bytes is None:
+            return None
         
-        # 否则使用原有的API方式
+        with get_metrics().span('ocr', bytes=len(image_bytes),
+                                engine="paddle" if self.use_paddle_ocr else "api") as span:
+            # 相同内容的图片直接使用缓存结果
+            cache_key = None
+            if self.ocr_cache:
+                cache_key = self.ocr_cache_key(image_bytes)
+                text_content = self.ocr_cache.get(cache_key)
+                span.set(cache='miss' if text_content is None else 'hit')
+                if text_content is not None:
+                    logging.info(f"OCR缓存命中: {image_path}")
+                    return text_content
+            
+            # 如果配置使用PaddleOCR且可用，则优先使用PaddleOCR
+            if self.use_paddle_ocr and self.paddle_ocr:
+                logging.info("使用PaddleOCR进行文字识别")
+                with get_metrics().span('ocr_local', bytes=len(image_bytes)):
+                    text_content = self.paddle_ocr.recognize_text(self.paddle_input(image_path))
+            else:
+                text_content = self.call_ocr_api(image_bytes)
+            if not text_content:
+                span.error = "OCR识别失败"
+        
+        if text_content and cache_key:
+            self.ocr_cache.set(cache_key, text_content)
+        return text_content
+    
+    def call_ocr_model_many(self, image_paths):
+        """
+        批量OCR识别：本地PaddleOCR时未命中缓存的图片按批推理，API方式时逐张调用
+
+        Returns:
+            list: 与输入一一对应的文字内容，失败的位置为 None
+        """
+        image_paths = list(image_paths)
+        if not (self.use_paddle_ocr and self.paddle_ocr):
+            return [self.call_ocr_model(image_path) for image_path in image_paths]
+        
+        results = [None] * len(image_paths)
+        misses = []
+        for position, image_path in enumerate(image_paths):
+            image_bytes = self.load_image_bytes(image_path)
+            if image_bytes is None:
+                continue
+            cache_key = None
+            if self.ocr_cache:
+                cache_key = self.ocr_cache_key(image_bytes)
+                text_content = self.ocr_cache.get(cache_key)
+                if text_content is not None:
+                    logging.info(f"OCR缓存命中: {image_path}")
+                    results[position] = text_content
+                    continue
+            misses.append((position, image_path, cache_key))
+        
+        if misses:
+            logging.info(f"使用PaddleOCR批量识别 {len(misses)} 张图片")
+            with get_metrics().span('ocr_local', images=len(misses), cache_hits=len(image_paths) - len(misses)):
+                # 生成器按需解码，同一时间只有一批图片的数组在内存中
+                texts = self.paddle_ocr.recognize_many(self.paddle_input(image_path) for _, image_path, _ in misses)
+                for (position, _, cache_key), text_content in zip(misses, texts):
+                    results[position] = text_content
+                    if text_content and cache_key:
+                        self.ocr_cache.set(cache_key, text_content)
+        return results
+    
+    def call_ocr_api(self, image_bytes):
+        """通过API方式识别图片中的文字"""
         try:
             # 编码图像
-            base64_image = self.encode_image(image_path)
-            if not base64_image:
-                return None
+            base64_image = self.encode_image_bytes(image_bytes)
             
             # 构建OCR请求载荷
-            payload = {
-                "model": self.ocr_model,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": OCR_PROMPT
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
-                                }
-                            }
-                        ]
-                    }
-                ]
-            }
-            
-            # 设置请求头
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
+            payload = self.build_ocr_payload(base64_image)
             
             logging.info(f"发送OCR请求到 {self.api_url}")
             logging.info(f"使用模型: {self.ocr_model}")
             
-            # 发送OCR请求
-            response = requests.post(self.api_url, headers=headers, json=payload)
+            # 发送OCR请求（复用连接池，受速率限制）
+            response = self.client.chat_completion(payload, stage='ocr_request')
             
             if response.status_code != 200:
                 logging.error(f"OCR请求失败: {response.status_code} - {response.text}")
@@ -117,6 +351,13 @@ class AIAnalyzer:
             return None
     
 
+    def is_truncated(self, result):
+        """finish_reason 为 length 表示输出达到 max_tokens 上限被截断，按失败处理（之后可重试），不解析残缺的内容"""
+        if result['choices'][0].get('finish_reason') != 'length':
+            return False
+        logging.error(f"模型 {result.get('model')} 输出达到 max_tokens 上限被截断，本次按失败处理")
+        return True
+
     def extract_json_from_response(self, content):
         """从模型响应中提取JSON数据"""
         # 移除可能的代码块标记
@@ -141,54 +382,63 @@ class AIAnalyzer:
     
     def clean_and_parse_json(self, content):
         """清理并解析JSON数据"""
-        try:
-            # 提取JSON部分
-            json_str = self.extract_json_from_response(content)
-            logging.info(f"提取的JSON字符串: {json_str}")
-            
-            # 解析JSON
-            running_data = json.loads(json_str)
+        with get_metrics().span('json_parse', bytes=len(content.encode('utf-8'))) as span:
+            try:
+                # 提取JSON部分
+                json_str = self.extract_json_from_response(content)
+                logging.info(f"提取的JSON字符串: {json_str}")
                 
-            return running_data
-        except json.JSONDecodeError as e:
-            logging.error(f"JSON解析失败: {e}")
-            logging.error(f"尝试解析的内容: {content}")
-            return None
-        except Exception as e:
-            logging.error(f"JSON处理过程出错: {e}")
-            return None
+                # 解析JSON
+                running_data = json.loads(json_str)
+                    
+                return running_data
+            except json.JSONDecodeError as e:
+                span.error = "JSONDecodeError"
+                logging.error(f"JSON解析失败: {e}")
+                logging.error(f"尝试解析的内容: {content}")
+                return None
+            except Exception as e:
+                span.error = type(e).__name__
+                logging.error(f"JSON处理过程出错: {e}")
+                return None
 
     def call_chat_model(self, text_content):
-        """调用对话模型分析OCR识别的文字并提取结构化信息"""
-        try:
-            # 构建分析提示
-            # 使用 % 格式化避免花括号冲突
-            analysis_prompt = ANALYSIS_PROMPT.replace("\{json_format\}", JSON_FORMAT_EXAMPLE)
-            analysis_prompt = analysis_prompt.replace("\{text_content\}", text_content)
+        """调用对话模型分析OCR识别的文字并提取结构化信息（优先使用本地规则，结果按文字内容缓存）"""
+        with get_metrics().span('chat', bytes=len(text_content.encode('utf-8'))) as span:
+            running_data = self.try_rule_extraction(text_content)
+            if running_data:
+                span.set(source='rule')
+                return running_data
+            
+            cache_key, running_data = self.get_cached_chat_result(text_content)
+            if cache_key:
+                span.set(cache='miss' if running_data is None else 'hit')
+            if running_data is not None:
+                span.set(source='cache')
+                return running_data
             
+            span.set(source='api')
+            running_data = self.call_chat_api(text_content)
+            if not running_data:
+                span.error = "结构化信息提取失败"
+        if running_data and cache_key:
+            self.chat_cache.set(cache_key, json.dumps(running_data, ensure_ascii=False))
+        return running_data
+    
+    def call_chat_api(self, text_content):
+        """通过API调用对话模型提取结构化信息"""
+        try:
             # 构建对话模型请求载荷
-            payload = {
-                "model": self.chat_model,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": analysis_prompt
-                    }
-                ],
-                "response_format": {"type": "json_object"}
-            }
-            
-            # 设置请求头
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
+            payload = self.build_chat_payload(text_content)
             
             logging.info(f"发送分析请求到 {self.api_url}")
             logging.info(f"使用模型: {self.chat_model}")
             
-            # 发送分析请求
-            response = requests.post(self.api_url, headers=headers, json=payload)
+            if self.chat_stream:
+                return self.stream_chat_result(payload)
+            
+            # 发送分析请求（复用连接池，受速率限制）
+            response = self.client.chat_completion(payload, stage='chat_request')
             
             if response.status_code != 200:
                 logging.error(f"分析请求失败: {response.status_code} - {response.text}")
@@ -196,6 +446,8 @@ class AIAnalyzer:
                 
             # 解析分析响应
             result = response.json()
+            if self.is_truncated(result):
+                return None
             content = result['choices'][0]['message']['content']
             print("响应数据：", content)
             
@@ -215,17 +467,235 @@ class AIAnalyzer:
             logging.error(f"分析过程出错: {e}")
             return None
     
+    def stream_chat_result(self, payload, stage='chat_request'):
+        """流式读取提取结果，收到字段齐全的JSON对象后立即断开，不等待剩余的输出"""
+        if CHAT_MAX_TOKENS:
+            payload = dict(payload, max_tokens=CHAT_MAX_TOKENS)
+        scanner = JSONObjectScanner()
+        reasoning_chars = 0
+        deltas = self.client.stream_chat_completion(payload, stage=stage)
+        try:
+            for content, reasoning_content in deltas:
+                # 推理模型的思考内容单独下发，不参与解析
+                reasoning_chars += len(reasoning_content)
+                for running_data in scanner.feed(content):
+                    if self.is_valid_running_data(running_data):
+                        logging.info(f"流式解析到完整结果，提前结束（已输出 {len(scanner.text)} 字，"
+                                     f"思考 {reasoning_chars} 字）: {running_data}")
+                        return running_data
+        except ResponseTruncatedError as e:
+            logging.error(f"{e}（已输出 {len(scanner.text)} 字，思考 {reasoning_chars} 字），本次按失败处理")
+            return None
+        finally:
+            deltas.close()
+        
+        # 输出结束仍没有字段齐全的对象（如模型漏掉了某些字段），按完整内容解析
+        logging.info(f"流式响应结束（输出 {len(scanner.text)} 字，思考 {reasoning_chars} 字）")
+        running_data = self.clean_and_parse_json(scanner.text) if scanner.text.strip() else None
+        if running_data:
+            logging.info(f"成功解析跑步数据: {running_data}")
+        else:
+            logging.error("JSON数据解析失败")
+        return running_data
+    
+    def call_vision_model(self, image_path):
+        """单阶段：把截图直接交给多模态模型提取结构化信息（结果按图片内容缓存）"""
+        image_bytes = self.load_image_bytes(image_path)
+        if image_bytes is None:
+            return None
+        
+        with get_metrics().span('vision', bytes=len(image_bytes)) as span:
+            cache_key = None
+            if self.chat_cache:
+                cache_key = self.vision_cache_key(image_bytes)
+                cached = self.chat_cache.get(cache_key)
+                span.set(cache='miss' if cached is None else 'hit')
+                if cached is not None:
+                    logging.info(f"提取缓存命中: {image_path}")
+                    return json.loads(cached)
+            
+            running_data = self.call_vision_api(image_bytes)
+            if not running_data:
+                span.error = "结构化信息提取失败"
+        if running_data and cache_key:
+            self.chat_cache.set(cache_key, json.dumps(running_data, ensure_ascii=False))
+        return running_data
+    
+    def call_vision_api(self, image_bytes):
+        """通过API调用多模态模型，一次请求从截图中提取结构化信息"""
+        try:
+            payload = self.build_vision_payload(self.encode_image_bytes(image_bytes))
+            logging.info(f"发送单阶段分析请求，使用模型: {self.vision_model}")
+            
+            if self.chat_stream:
+                return self.stream_chat_result(payload, stage='vision_request')
+            
+            response = self.client.chat_completion(payload, stage='vision_request')
+            if response.status_code != 200:
+                logging.error(f"单阶段分析请求失败: {response.status_code} - {response.text}")
+                return None
+            
+            result = response.json()
+            if self.is_truncated(result):
+                return None
+            content = result['choices'][0]['message']['content']
+            running_data = self.clean_and_parse_json(content)
+            if running_data:
+                logging.info(f"成功解析跑步数据: {running_data}")
+                return running_data
+            logging.error("JSON数据解析失败")
+            return None
+            
+        except requests.RequestException as e:
+            logging.error(f"单阶段分析请求失败: {e}")
+            return None
+        except Exception as e:
+            logging.error(f"单阶段分析过程出错: {e}")
+            return None
+    
+    def split_into_batches(self, items, batch_size=CHAT_BATCH_SIZE, max_tokens=CHAT_BATCH_MAX_TOKENS):
+        """按条数和提示词token预算把 [(图片ID, OCR文字), ...] 拆分为多批"""
+        base_tokens = estimate_tokens(self.build_batch_chat_payload([]))
+        batches = []
+        current, current_tokens = [], base_tokens
+        for image_id, text_content in items:
+            item_tokens = len(image_id) + len(text_content) + 4
+            if current and (len(current) >= batch_size or current_tokens + item_tokens > max_tokens):
+                batches.append(current)
+                current, current_tokens = [], base_tokens
+            current.append((image_id, text_content))
+            current_tokens += item_tokens
+        if current:
+            batches.append(current)
+        return batches
+    
+    def parse_batch_response(self, content):
+        """解析批量提取响应，返回 {图片ID: 跑步数据}，无法解析时返回空字典"""
+        cleaned_content = content.strip()
+        fence_match = re.search(r'```(?:json)?\s*(.*?)\s*```', cleaned_content, re.DOTALL)
+        if fence_match:
+            cleaned_content = fence_match.group(1)
+        
+        # 从第一个 { 或 [ 开始解码，忽略前后多余内容
+        start = min((i for i in (cleaned_content.find('{'), cleaned_content.find('[')) if i >= 0), default=-1)
+        if start < 0:
+            return {}
+        try:
+            parsed, _ = json.JSONDecoder().raw_decode(cleaned_content[start:])
+        except json.JSONDecodeError as e:
+            logging.error(f"批量结果JSON解析失败: {e}")
+            return {}
+        
+        # 兼容 {"results": [...]}、[...] 以及 {图片ID: {...}} 三种形式
+        if isinstance(parsed, dict) and isinstance(parsed.get("results"), list):
+            parsed = parsed["results"]
+        results = {}
+        if isinstance(parsed, list):
+            for record in parsed:
+                if isinstance(record, dict) and record.get("image_id") is not None:
+                    results[str(record["image_id"])] = record
+        elif isinstance(parsed, dict):
+            for image_id, record in parsed.items():
+                if isinstance(record, dict):
+                    results[str(image_id)] = record
+        return results
+    
+    def is_valid_running_data(self, running_data):
+        """校验提取结果包含所有字段"""
+        return isinstance(running_data, dict) and all(field in running_data for field in FIELDS)
+    
+    def call_chat_batch_api(self, batch):
+        """一次请求提取一批截图，返回 {图片ID: 跑步数据}，仅包含校验通过的条目"""
+        try:
+            payload = self.build_batch_chat_payload(batch)
+            logging.info(f"发送批量分析请求，共 {len(batch)} 张截图")
+            response = self.client.chat_completion(payload, stage='chat_request')
+            
+            if response.status_code != 200:
+                logging.error(f"批量分析请求失败: {response.status_code} - {response.text}")
+                return {}
+            
+            result = response.json()
+            if self.is_truncated(result):
+                return {}
+            content = result['choices'][0]['message']['content']
+            with get_metrics().span('json_parse', bytes=len(content.encode('utf-8')), images=len(batch)) as span:
+                records = self.parse_batch_response(content)
+                span.set(parsed=len(records))
+        except requests.RequestException as e:
+            logging.error(f"批量分析请求失败: {e}")
+            return {}
+        except Exception as e:
+            logging.error(f"批量分析过程出错: {e}")
+            return {}
+        
+        valid = {}
+        for image_id, _ in batch:
+            record = records.get(image_id)
+            if self.is_valid_running_data(record):
+                valid[image_id] = {field: record.get(field) for field in FIELDS}
+        return valid
+    
+    def call_chat_model_batch(self, text_contents, batch_size=CHAT_BATCH_SIZE):
+        """
+        批量提取多张截图的结构化信息
+        
+        先走本地规则和缓存，剩余的按 batch_size 和token预算合并请求；
+        批量结果中缺失或校验失败的截图单独重试。
+        
+        Args:
+            text_contents (list): OCR识别出的文字列表
+            batch_size (int): 每批最多截图数
+            
+        Returns:
+            list: 与输入顺序一致的跑步数据（失败为 None）
+        """
+        results = [None] * len(text_contents)
+        pending = []
+        cache_keys = {}
+        for index, text_content in enumerate(text_contents):
+            running_data = self.try_rule_extraction(text_content)
+            if not running_data:
+                cache_key, running_data = self.get_cached_chat_result(text_content)
+                cache_keys[index] = cache_key
+            if running_data:
+                results[index] = running_data
+            else:
+                pending.append((str(index + 1), text_content))
+        
+        for batch in self.split_into_batches(pending, batch_size):
+            if len(batch) == 1:
+                records = {}
+            else:
+                records = self.call_chat_batch_api(batch)
+            for image_id, text_content in batch:
+                index = int(image_id) - 1
+                running_data = records.get(image_id)
+                if running_data is None:
+                    # 批量结果缺失或校验失败，单独重试
+                    running_data = self.call_chat_api(text_content)
+                if running_data and cache_keys.get(index):
+                    self.chat_cache.set(cache_keys[index], json.dumps(running_data, ensure_ascii=False))
+                results[index] = running_data
+        return results
+    
     def analyze_running_screenshot(self, image_path):
-        """分析跑步截图并提取信息（两阶段处理）"""
+        """分析跑步截图并提取信息（默认两阶段处理，vision 模式下由多模态模型单次完成）"""
         logging.info(f"开始分析跑步截图: {image_path}")
         
+        if self.analysis_mode == 'vision':
+            running_data = self.call_vision_model(image_path)
+            if not running_data:
+                logging.error(f"单阶段分析失败: {image_path}")
+                return None
+            logging.info(f"成功完成图片分析: {image_path}")
+            return running_data
+        
         # 第一阶段：OCR识别图片中的文字
         text_content = self.call_ocr_model(image_path)
         if not text_content:
             logging.error(f"OCR识别失败: {image_path}")
             return None
-        
-        time.sleep(3)
 
         # 第二阶段：使用对话模型分析OCR识别的文字并提取结构化信息
         running_data = self.call_chat_model(text_content)
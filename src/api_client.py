@@ -0,0 +1,235 @@
+import os
+import sys
+import json
+import logging
+import threading
+import importlib.util
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.insert(0, project_root)
+
+from config.settings import (
+    SILICONFLOW_API_KEY, SILICONFLOW_API_URL, HTTP_POOL_SIZE,
+    HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_MAX_RETRIES
+)
+from src.rate_limiter import get_rate_limiter, estimate_tokens, response_tokens
+from src.metrics import get_metrics
+
+# 异步客户端依赖 httpx（可选），只检查是否已安装，创建异步客户端时才导入
+HTTPX_AVAILABLE = importlib.util.find_spec("httpx") is not None
+
+
+class ResponseTruncatedError(Exception):
+    """模型输出达到 max_tokens 上限被截断（finish_reason 为 length）"""
+
+
+class SiliconFlowClient:
+    """
+    硅基流动API客户端
+
+    使用带连接池的 requests.Session 复用TLS连接和认证头，
+    连接错误和5xx响应由urllib3重试，429限流交给速率限制器处理。
+    同一实例可在多个线程间共享。
+    """
+
+    def __init__(self, api_key=SILICONFLOW_API_KEY, api_url=SILICONFLOW_API_URL,
+                 pool_size=HTTP_POOL_SIZE, connect_timeout=HTTP_CONNECT_TIMEOUT,
+                 read_timeout=HTTP_READ_TIMEOUT, max_retries=HTTP_MAX_RETRIES, rate_limiter=None):
+        self.api_url = api_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        })
+
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=0.5,
+            status_forcelist=(500, 502, 504),
+            allowed_methods=frozenset(["POST"]),
+            respect_retry_after_header=False,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def post(self, payload, stream=False):
+        """直接发送一次请求（不经过速率限制）"""
+        return self.session.post(self.api_url, json=payload, timeout=self.timeout, stream=stream)
+
+    def chat_completion(self, payload, stream=False, stage="api_request"):
+        """
+        发送对话补全请求，受速率限制并在限流时自动退避重试
+
+        Args:
+            payload (dict): 请求载荷，必须包含 model 字段
+            stream (bool): 是否以流式方式读取响应
+            stage (str): 指标中的阶段名（如 ocr_request / chat_request）
+
+        Returns:
+            requests.Response: 最后一次请求的响应
+        """
+        model = payload["model"]
+        estimated = estimate_tokens(payload)
+        attempts = [0]
+
+        def send():
+            attempts[0] += 1
+            return self.post(payload, stream=stream)
+
+        with get_metrics().span(stage, model=model) as span:
+            response = self.rate_limiter.request(model, send, estimated)
+            # 限流退避的重试次数 + urllib3 对连接错误和5xx的重试次数
+            transport_retries = len(getattr(getattr(response.raw, 'retries', None), 'history', None) or ())
+            span.set(status=response.status_code, retries=attempts[0] - 1 + transport_retries,
+                     bytes=len(response.request.body or b''))
+            if not stream:
+                span.set(response_bytes=len(response.content))
+
+        # 非流式响应可直接读取实际用量，修正token预估
+        if response.status_code == 200 and not stream:
+            try:
+                self.rate_limiter.record_usage(model, estimated, response_tokens(response.json()))
+            except ValueError:
+                pass
+        return response
+
+    def stream_chat_completion(self, payload, stage="api_request"):
+        """
+        以SSE流式方式发送对话补全请求，逐个返回增量 (content, reasoning_content)
+
+        调用方提前关闭生成器时立即断开连接，服务端随之停止生成；结束后按实际输出修正token预估。
+        响应状态码不是200时抛出 requests.HTTPError；输出达到 max_tokens 上限被截断时，
+        在返回全部增量后抛出 ResponseTruncatedError。
+
+        Args:
+            payload (dict): 请求载荷，必须包含 model 字段（stream 字段会被自动设置）
+            stage (str): 指标中的阶段名，读取流的耗时记为 <stage>_stream
+        """
+        payload = dict(payload, stream=True)
+        model = payload["model"]
+        estimated = estimate_tokens(payload)
+        response = self.chat_completion(payload, stream=True, stage=stage)
+        if response.status_code != 200:
+            message = f"{response.status_code} - {response.text}"
+            response.close()
+            raise requests.HTTPError(message, response=response)
+
+        usage = None
+        chars = reasoning_chars = 0
+        finish_reason = None
+        finished = False
+        with get_metrics().span(f"{stage}_stream", model=model) as span:
+            try:
+                # chunk_size=None：分块传输时每收到一块就处理，不等待凑满缓冲区
+                for line in response.iter_lines(chunk_size=None):
+                    if not line.startswith(b"data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == b"[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    usage = chunk.get("usage") or usage
+                    for choice in chunk.get("choices") or []:
+                        finish_reason = choice.get("finish_reason") or finish_reason
+                        delta = choice.get("delta") or {}
+                        content = delta.get("content") or ""
+                        reasoning = delta.get("reasoning_content") or ""
+                        chars += len(content)
+                        reasoning_chars += len(reasoning)
+                        if content or reasoning:
+                            yield content, reasoning
+                finished = True
+            except GeneratorExit:
+                # 调用方已拿到所需内容，不再读取剩余输出
+                pass
+            finally:
+                response.close()
+                span.set(chars=chars, reasoning_chars=reasoning_chars, early_stop=not finished)
+                # 提前断开时响应中没有最终用量，按提示词预估加已输出字数修正
+                actual = usage.get("total_tokens") if usage and finished else None
+                if actual is None:
+                    actual = estimated - payload.get("max_tokens", 0) + chars + reasoning_chars
+                self.rate_limiter.record_usage(model, estimated, actual)
+        if finished and finish_reason == "length":
+            raise ResponseTruncatedError(f"模型 {model} 输出达到 max_tokens 上限被截断")
+
+    def close(self):
+        """关闭连接池"""
+        self.session.close()
+
+
+class AsyncSiliconFlowClient:
+    """
+    基于 httpx.AsyncClient 的异步API客户端
+
+    与同步客户端共用速率限制器，需在同一个事件循环中使用，用完调用 aclose()。
+    """
+
+    def __init__(self, api_key=SILICONFLOW_API_KEY, api_url=SILICONFLOW_API_URL,
+                 pool_size=HTTP_POOL_SIZE, connect_timeout=HTTP_CONNECT_TIMEOUT,
+                 read_timeout=HTTP_READ_TIMEOUT, max_retries=HTTP_MAX_RETRIES, rate_limiter=None):
+        if not HTTPX_AVAILABLE:
+            raise ImportError("异步客户端需要 httpx，请运行 'pip install httpx' 安装")
+        import httpx
+
+        self.api_url = api_url
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+        # httpx 的传输层重试只覆盖连接错误
+        self.client = httpx.AsyncClient(
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json"
+            },
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            transport=httpx.AsyncHTTPTransport(retries=max_retries)
+        )
+
+    async def chat_completion(self, payload, stage="api_request"):
+        """异步发送对话补全请求，受速率限制并在限流时自动退避重试"""
+        model = payload["model"]
+        estimated = estimate_tokens(payload)
+        attempts = [0]
+
+        def send():
+            attempts[0] += 1
+            return self.client.post(self.api_url, json=payload)
+
+        with get_metrics().span(stage, model=model) as span:
+            response = await self.rate_limiter.request_async(model, send, estimated)
+            span.set(status=response.status_code, retries=attempts[0] - 1,
+                     bytes=len(response.request.content), response_bytes=len(response.content))
+        if response.status_code == 200:
+            try:
+                self.rate_limiter.record_usage(model, estimated, response_tokens(response.json()))
+            except ValueError:
+                pass
+        return response
+
+    async def aclose(self):
+        """关闭连接池"""
+        await self.client.aclose()
+
+
+_shared_client = None
+_shared_lock = threading.Lock()
+
+
+def get_client():
+    """获取进程内共享的API客户端"""
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            _shared_client = SiliconFlowClient()
+            logging.info(f"初始化API客户端，连接池大小: {HTTP_POOL_SIZE}")
+        return _shared_client
@@ -0,0 +1,236 @@
+import os
+import sys
+import json
+import asyncio
+import logging
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.insert(0, project_root)
+
+from config.settings import ASYNC_MAX_CONCURRENCY, ANALYSIS_MODE
+from src.ai_analyzer import AIAnalyzer
+from src.api_client import AsyncSiliconFlowClient
+
+
+class AsyncAIAnalyzer(AIAnalyzer):
+    """
+    基于 asyncio 的AI分析器
+
+    OCR和对话模型请求以协程方式发送，复用 AIAnalyzer 的载荷构建和JSON解析逻辑。
+    本地PaddleOCR在线程池中串行执行。建议以 async with 方式使用::
+
+        async with AsyncAIAnalyzer() as analyzer:
+            async for image_path, running_data in analyzer.analyze_many(paths):
+                ...
+    """
+
+    def __init__(self, use_paddle_ocr=False, max_concurrency=ASYNC_MAX_CONCURRENCY, analysis_mode=ANALYSIS_MODE):
+        # 异步客户端不读取流式响应
+        super().__init__(use_paddle_ocr=use_paddle_ocr, chat_stream=False, analysis_mode=analysis_mode)
+        self.max_concurrency = max_concurrency
+        self.async_client = AsyncSiliconFlowClient(api_url=self.api_url)
+        self._paddle_lock = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def aclose(self):
+        """关闭异步HTTP连接池和本地OCR进程池"""
+        await self.async_client.aclose()
+        self.close()
+
+    async def _run_blocking(self, func, *args):
+        """在默认线程池中执行阻塞函数（图片读取、本地OCR、SQLite缓存读写等）"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, func, *args)
+
+    async def call_ocr_model_async(self, image_path):
+        """异步调用OCR模型识别图片中的文字（结果按图片内容缓存）"""
+        image_bytes = await self._run_blocking(self.load_image_bytes, image_path)
+        if image_bytes is None:
+            return None
+
+        cache_key = None
+        if self.ocr_cache:
+            cache_key = self.ocr_cache_key(image_bytes)
+            text_content = await self._run_blocking(self.ocr_cache.get, cache_key)
+            if text_content is not None:
+                logging.info(f"OCR缓存命中: {image_path}")
+                return text_content
+
+        if self.use_paddle_ocr and getattr(self.paddle_ocr, 'thread_safe', False):
+            # 进程池可以并发调用
+            text_content = await self._run_blocking(
+                lambda: self.paddle_ocr.recognize_text(self.paddle_input(image_path)))
+        elif self.use_paddle_ocr and self.paddle_ocr:
+            # 单个 PaddleOCR 引擎不是线程安全的，串行执行（锁需在事件循环内创建）
+            if self._paddle_lock is None:
+                self._paddle_lock = asyncio.Lock()
+            async with self._paddle_lock:
+                text_content = await self._run_blocking(
+                    lambda: self.paddle_ocr.recognize_text(self.paddle_input(image_path)))
+        else:
+            text_content = await self.call_ocr_api_async(image_bytes)
+
+        if text_content and cache_key:
+            await self._run_blocking(self.ocr_cache.set, cache_key, text_content)
+        return text_content
+
+    async def call_ocr_api_async(self, image_bytes):
+        """通过API方式异步识别图片中的文字"""
+        try:
+            payload = self.build_ocr_payload(self.encode_image_bytes(image_bytes))
+            response = await self.async_client.chat_completion(payload, stage='ocr_request')
+
+            if response.status_code != 200:
+                logging.error(f"OCR请求失败: {response.status_code} - {response.text}")
+                return None
+
+            result = response.json()
+            text_content = result['choices'][0]['message']['content']
+            logging.info(f"OCR识别成功，文字长度: {len(text_content)} 字符")
+            return text_content
+
+        except Exception as e:
+            logging.error(f"OCR处理过程出错: {e}")
+            return None
+
+    async def call_chat_model_async(self, text_content):
+        """异步调用对话模型分析OCR识别的文字并提取结构化信息（优先使用本地规则，结果按文字内容缓存）"""
+        running_data = self.try_rule_extraction(text_content)
+        if running_data:
+            return running_data
+
+        cache_key, running_data = await self._run_blocking(self.get_cached_chat_result, text_content)
+        if running_data is not None:
+            return running_data
+
+        running_data = await self.call_chat_api_async(text_content)
+        if running_data and cache_key:
+            await self._run_blocking(
+                self.chat_cache.set, cache_key, json.dumps(running_data, ensure_ascii=False))
+        return running_data
+
+    async def call_chat_api_async(self, text_content):
+        """通过API异步调用对话模型提取结构化信息"""
+        try:
+            payload = self.build_chat_payload(text_content)
+            response = await self.async_client.chat_completion(payload, stage='chat_request')
+
+            if response.status_code != 200:
+                logging.error(f"分析请求失败: {response.status_code} - {response.text}")
+                return None
+
+            result = response.json()
+            if self.is_truncated(result):
+                return None
+            content = result['choices'][0]['message']['content']
+
+            running_data = self.clean_and_parse_json(content)
+            if running_data:
+                logging.info(f"成功解析跑步数据: {running_data}")
+                return running_data
+            else:
+                logging.error("JSON数据解析失败")
+                return None
+
+        except Exception as e:
+            logging.error(f"分析过程出错: {e}")
+            return None
+
+    async def call_vision_model_async(self, image_path):
+        """单阶段：异步调用多模态模型从截图中提取结构化信息（结果按图片内容缓存）"""
+        image_bytes = await self._run_blocking(self.load_image_bytes, image_path)
+        if image_bytes is None:
+            return None
+
+        cache_key = None
+        if self.chat_cache:
+            cache_key = self.vision_cache_key(image_bytes)
+            cached = await self._run_blocking(self.chat_cache.get, cache_key)
+            if cached is not None:
+                logging.info(f"提取缓存命中: {image_path}")
+                return json.loads(cached)
+
+        try:
+            payload = self.build_vision_payload(self.encode_image_bytes(image_bytes))
+            response = await self.async_client.chat_completion(payload, stage='vision_request')
+
+            if response.status_code != 200:
+                logging.error(f"单阶段分析请求失败: {response.status_code} - {response.text}")
+                return None
+
+            result = response.json()
+            if self.is_truncated(result):
+                return None
+            content = result['choices'][0]['message']['content']
+            running_data = self.clean_and_parse_json(content)
+        except Exception as e:
+            logging.error(f"单阶段分析过程出错: {e}")
+            return None
+
+        if running_data and cache_key:
+            await self._run_blocking(
+                self.chat_cache.set, cache_key, json.dumps(running_data, ensure_ascii=False))
+        return running_data
+
+    async def analyze_running_screenshot_async(self, image_path):
+        """异步分析跑步截图并提取信息（默认两阶段处理，vision 模式下由多模态模型单次完成）"""
+        logging.info(f"开始分析跑步截图: {image_path}")
+
+        if self.analysis_mode == 'vision':
+            running_data = await self.call_vision_model_async(image_path)
+            if not running_data:
+                logging.error(f"单阶段分析失败: {image_path}")
+            return running_data
+
+        text_content = await self.call_ocr_model_async(image_path)
+        if not text_content:
+            logging.error(f"OCR识别失败: {image_path}")
+            return None
+
+        running_data = await self.call_chat_model_async(text_content)
+        if not running_data:
+            logging.error(f"结构化信息提取失败: {image_path}")
+            return None
+
+        logging.info(f"成功完成图片分析: {image_path}")
+        return running_data
+
+    async def analyze_many(self, image_paths, image_processor=None, max_concurrency=None):
+        """
+        并发分析多张截图，按完成顺序逐个产出结果
+
+        Args:
+            image_paths (iterable): 截图路径
+            image_processor (ImageProcessor): 可选，提供时先在线程池中预处理原始截图
+            max_concurrency (int): 同时处理的截图数上限，默认使用 ASYNC_MAX_CONCURRENCY
+
+        Yields:
+            tuple: (原始截图路径, 跑步数据字典或 None)
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or self.max_concurrency)
+
+        async def analyze_one(image_path):
+            async with semaphore:
+                target_path = image_path
+                if image_processor:
+                    target_path = await self._run_blocking(image_processor.preprocess_image, image_path)
+                    if not target_path:
+                        logging.error(f"图像处理失败: {image_path}")
+                        return image_path, None
+                return image_path, await self.analyze_running_screenshot_async(target_path)
+
+        tasks = [asyncio.ensure_future(analyze_one(image_path)) for image_path in image_paths]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # 调用方提前停止迭代时取消剩余任务
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,181 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+# 每写入多少条执行一次淘汰检查
+_EVICT_INTERVAL = 100
+
+
+def make_cache_key(*parts):
+    """由多个部分（bytes 或 str）计算 SHA-256 缓存键"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        # 写入长度前缀，避免不同拆分方式产生相同的键
+        digest.update(len(part).to_bytes(8, 'big'))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """
+    基于 SQLite 的键值缓存
+
+    - 超过 max_age_days 的条目视为过期
+    - 总大小超过 max_size_mb 时按最近访问时间淘汰
+    - 记录本进程内的命中/未命中次数
+    同一实例可在多个线程间共享。
+    """
+
+    def __init__(self, db_path, max_size_mb=None, max_age_days=None, name="cache"):
+        self.db_path = db_path
+        self.name = name
+        self.max_bytes = int(max_size_mb * 1024 * 1024) if max_size_mb else None
+        self.max_age = max_age_days * 86400 if max_age_days else None
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries(accessed_at)")
+        self._conn.commit()
+        self.evict()
+
+    def get(self, key):
+        """读取缓存，未命中或已过期时返回 None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.max_age and now - row[1] > self.max_age):
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def set(self, key, value):
+        """写入缓存"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode('utf-8')), now, now)
+            )
+            self._conn.commit()
+            self._writes += 1
+            should_evict = self._writes % _EVICT_INTERVAL == 0
+        if should_evict:
+            self.evict()
+
+    def evict(self):
+        """删除过期条目，并按最近访问时间淘汰超出容量的条目"""
+        with self._lock:
+            removed = 0
+            if self.max_age:
+                cursor = self._conn.execute("DELETE FROM entries WHERE created_at < ?", (time.time() - self.max_age,))
+                removed += cursor.rowcount
+            if self.max_bytes:
+                total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+                if total > self.max_bytes:
+                    rows = self._conn.execute("SELECT key, size FROM entries ORDER BY accessed_at").fetchall()
+                    stale = []
+                    for key, size in rows:
+                        if total <= self.max_bytes:
+                            break
+                        stale.append((key,))
+                        total -= size
+                    self._conn.executemany("DELETE FROM entries WHERE key = ?", stale)
+                    removed += len(stale)
+            self._conn.commit()
+        if removed:
+            logging.info(f"{self.name} 淘汰 {removed} 条缓存")
+        return removed
+
+    def stats(self):
+        """返回命中统计和当前条目数"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': entries
+        }
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+class TieredCache:
+    """
+    内存LRU + 磁盘缓存的两级缓存
+
+    先查内存（亚毫秒级），未命中时查磁盘并回填内存；写入时同时写两级。
+    """
+
+    def __init__(self, disk_cache, max_memory_items=1024):
+        self.disk_cache = disk_cache
+        self.name = disk_cache.name
+        self.max_memory_items = max_memory_items
+        self.memory_hits = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """读取缓存，未命中时返回 None"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+        value = self.disk_cache.get(key)
+        if value is not None:
+            with self._lock:
+                self._remember(key, value)
+        return value
+
+    def set(self, key, value):
+        """同时写入内存和磁盘"""
+        with self._lock:
+            self._remember(key, value)
+        self.disk_cache.set(key, value)
+
+    def stats(self):
+        """返回两级缓存合并后的命中统计"""
+        stats = self.disk_cache.stats()
+        stats['memory_hits'] = self.memory_hits
+        stats['hits'] += self.memory_hits
+        total = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / total if total else 0.0
+        return stats
+
+    def close(self):
+        """关闭磁盘缓存"""
+        self.disk_cache.close()
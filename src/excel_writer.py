@@ -1,58 +1,240 @@
 import os
-import pandas as pd
-from openpyxl import load_workbook
+import sys
+import tempfile
+import threading
+import time
+import logging
 from datetime import datetime
 
-class ExcelWriter:
-    def __init__(self, output_file):
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.insert(0, project_root)
+
+from config.settings import EXCEL_FLUSH_EVERY, EXCEL_FLUSH_INTERVAL
+from src.record_writer import RecordWriter
+
+class ExcelWriter(RecordWriter):
+    def __init__(self, output_file, flush_every=EXCEL_FLUSH_EVERY, flush_interval=EXCEL_FLUSH_INTERVAL):
         self.output_file = output_file
-        # 调整列顺序为：文件名、公里数、时长、平均配速、日期等
-        self.columns = ['Image File', 'Distance (km)', 'Duration', 'Pace', 'Date', 'Calories']
-        
+        # 缓冲待写入的行，每 flush_every 行或距上次写盘超过 flush_interval 秒时写盘一次
+        # 每次写盘都重写整个工作簿，flush_every 越小总写盘量越大
+        self.flush_every = max(1, flush_every)
+        self.flush_interval = flush_interval
+        self._last_flush = time.monotonic()
+        self._buffer = []
+        self._workbook = None
+        self._dirty = False
+        self._lock = threading.RLock()
+        # 已写入（含缓冲中）的文件名集合，用于O(1)去重
+        self._known_files = None
+
     def create_or_load_excel(self):
-        """创建或加载Excel文件"""
+        """创建或加载Excel文件，并加载已有文件名索引"""
+        # openpyxl（连同 numpy）导入较慢，用到时才导入
+        from openpyxl import Workbook
         if not os.path.exists(self.output_file):
             # 创建新的Excel文件
-            df = pd.DataFrame(columns=self.columns)
-            df.to_excel(self.output_file, index=False)
+            workbook = Workbook()
+            workbook.active.append(self.columns)
+            self._save_atomic(workbook)
+            with self._lock:
+                self._known_files = set()
             return True
+        self._load_known_files()
         return False
-    
+
+    def _load_known_files(self):
+        """以只读模式扫描一次 Image File 列，建立文件名索引"""
+        from openpyxl import load_workbook
+        known_files = set()
+        if os.path.exists(self.output_file):
+            workbook = load_workbook(self.output_file, read_only=True)
+            try:
+                rows = workbook.active.iter_rows(values_only=True)
+                header = next(rows, None) or ()
+                column = list(header).index('Image File') if 'Image File' in header else 0
+                for row in rows:
+                    if len(row) > column and row[column]:
+                        known_files.add(str(row[column]))
+            finally:
+                workbook.close()
+        with self._lock:
+            # 合并尚未写盘的缓冲行
+            known_files.update(row[0] for row in self._buffer if row[0])
+            self._known_files = known_files
+        logging.info(f"已加载 {len(known_files)} 条已处理文件名")
+
+    def _ensure_known_files(self):
+        if self._known_files is None:
+            self._load_known_files()
+
+    def _save_atomic(self, workbook):
+        """先写临时文件再重命名，避免写入中途崩溃损坏原文件"""
+        output_dir = os.path.dirname(os.path.abspath(self.output_file))
+        fd, temp_path = tempfile.mkstemp(suffix='.xlsx', prefix='.tmp_', dir=output_dir)
+        os.close(fd)
+        try:
+            workbook.save(temp_path)
+            # mkstemp 创建的文件仅所有者可读写，沿用原文件权限
+            mode = os.stat(self.output_file).st_mode if os.path.exists(self.output_file) else 0o644
+            os.chmod(temp_path, mode)
+            os.replace(temp_path, self.output_file)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
     def append_to_excel(self, running_data, image_filename=None):
-        """将跑步数据追加到Excel文件"""
+        """将跑步数据追加到写入缓冲，缓冲满时写盘"""
         try:
-            # 加载现有数据
-            existing_df = pd.read_excel(self.output_file)
-            
-            # 创建新数据DataFrame，按照新的列顺序排列
-            new_row = pd.DataFrame([[
-                image_filename,                           # Image File
-                running_data.get('distance_km'),         # Distance (km)
-                running_data.get('duration'),            # Duration
-                running_data.get('pace'),                # Pace
-                running_data.get('date'),                # Date
-                running_data.get('calories')             # Calories
-            ]], columns=self.columns)
-            
-            # 合并数据
-            updated_df = pd.concat([existing_df, new_row], ignore_index=True)
-            
-            # 保存到Excel
-            updated_df.to_excel(self.output_file, index=False)
-            return True
+            # 按照列顺序排列：文件名、公里数、时长、平均配速、日期、卡路里
+            row = self.record_to_row(running_data, image_filename)
         except Exception as e:
             print(f"写入Excel失败: {e}")
             return False
-    
+
+        with self._lock:
+            self._buffer.append(row)
+            if image_filename and self._known_files is not None:
+                self._known_files.add(image_filename)
+            if len(self._buffer) >= self.flush_every or self._flush_due():
+                return self.flush()
+        return True
+
+    def _flush_due(self):
+        """距上次写盘是否已超过 flush_interval，限制崩溃时丢失的时间窗口"""
+        return self.flush_interval is not None and time.monotonic() - self._last_flush >= self.flush_interval
+
+    def _load_workbook(self):
+        """工作簿只在首次需要时读取一次，之后在内存中修改"""
+        from openpyxl import Workbook, load_workbook
+        if self._workbook is None:
+            if os.path.exists(self.output_file):
+                self._workbook = load_workbook(self.output_file)
+            else:
+                self._workbook = Workbook()
+                self._workbook.active.append(self.columns)
+        return self._workbook
+
+    def flush(self):
+        """把缓冲中的行追加到工作表并原子写盘"""
+        with self._lock:
+            if not self._buffer and not self._dirty:
+                return True
+            try:
+                workbook = self._load_workbook()
+                worksheet = workbook.active
+                for row in self._buffer:
+                    worksheet.append(row)
+                self._save_atomic(workbook)
+                self._buffer = []
+                self._dirty = False
+                self._last_flush = time.monotonic()
+                return True
+            except Exception as e:
+                # 出错时丢弃内存中的工作簿，下次从磁盘重新加载，缓冲保留待重试
+                self._workbook = None
+                print(f"写入Excel失败: {e}")
+                return False
+
+    def iter_records(self):
+        """遍历已有记录（含缓冲中的行），以字段名字典形式返回"""
+        from openpyxl import load_workbook
+        if os.path.exists(self.output_file):
+            workbook = load_workbook(self.output_file, read_only=True)
+            try:
+                rows = workbook.active.iter_rows(values_only=True)
+                header = list(next(rows, None) or ())
+                positions = [header.index(c) if c in header else None for c in self.columns]
+                for row in rows:
+                    yield {
+                        field: row[pos] if pos is not None and pos < len(row) else None
+                        for field, pos in zip(self.fields, positions)
+                    }
+            finally:
+                workbook.close()
+        with self._lock:
+            buffered = [list(row) for row in self._buffer]
+        for row in buffered:
+            yield dict(zip(self.fields, row))
+
+    def update_record(self, image_filename, running_data):
+        """
+        用新数据补全已有记录中为空的字段
+
+        Returns:
+            bool: 是否有字段被更新
+        """
+        def fill(values, set_value):
+            updated = False
+            for position, field in enumerate(self.fields):
+                if field == 'image_file':
+                    continue
+                if values[position] in (None, '') and running_data.get(field) is not None:
+                    set_value(position, running_data.get(field))
+                    updated = True
+            return updated
+
+        with self._lock:
+            for row in self._buffer:
+                if row[0] == image_filename:
+                    return fill(row, row.__setitem__)
+            try:
+                # 合并很少发生，直接扫描工作表
+                worksheet = self._load_workbook().active
+                for cells in worksheet.iter_rows(min_row=2, max_col=len(self.columns)):
+                    if cells[0].value == image_filename:
+                        values = [cell.value for cell in cells]
+                        updated = fill(values, lambda position, value: setattr(cells[position], 'value', value))
+                        self._dirty = self._dirty or updated
+                        return updated
+            except Exception as e:
+                self._workbook = None
+                print(f"更新Excel记录失败: {e}")
+        return False
+
+    def close(self):
+        """写出剩余缓冲"""
+        return self.flush()
+
+    # RecordWriter 接口
+    def create_or_load(self):
+        return self.create_or_load_excel()
+
+    def append_record(self, running_data, image_filename=None):
+        return self.append_to_excel(running_data, image_filename)
+
     def is_duplicate_record(self, image_filename):
         """检查是否为重复记录（基于文件名判断）"""
         try:
-            if os.path.exists(self.output_file) and image_filename:
-                df = pd.read_excel(self.output_file)
-                # 检查相同文件名的记录是否已存在
-                if image_filename in df['Image File'].values:
-                    return True
-            return False
+            if not image_filename:
+                return False
+            self._ensure_known_files()
+            with self._lock:
+                return image_filename in self._known_files
         except Exception as e:
             print(f"检查重复记录失败: {e}")
-            return False
\ No newline at end of file
+            return False
+
+    def filter_new(self, paths):
+        """
+        批量过滤出尚未处理的截图
+
+        Args:
+            paths (iterable): 截图路径
+
+        Returns:
+            list: 文件名不在已有记录中的路径（同名文件只保留第一个）
+        """
+        self._ensure_known_files()
+        new_paths = []
+        seen = set()
+        with self._lock:
+            for path in paths:
+                image_filename = os.path.basename(path)
+                if image_filename in self._known_files or image_filename in seen:
+                    continue
+                seen.add(image_filename)
+                new_paths.append(path)
+        return new_paths
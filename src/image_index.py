@@ -0,0 +1,251 @@
+import os
+import io
+import sys
+import time
+import zlib
+import sqlite3
+import hashlib
+import logging
+import threading
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.insert(0, project_root)
+
+from config.settings import (
+    IMAGE_DEDUP_FILE, IMAGE_DEDUP_HASH_SIZE, IMAGE_DEDUP_MAX_DISTANCE,
+    IMAGE_DEDUP_THUMBNAIL_WIDTH, IMAGE_DEDUP_PIXEL_TOLERANCE
+)
+from src.image_processor import load_image_bytes
+
+
+def dhash(image, hash_size=IMAGE_DEDUP_HASH_SIZE):
+    """计算差值哈希（dHash），返回 hash_size * hash_size 位整数"""
+    from PIL import Image
+    gray = image.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = gray.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def thumbnail(image, width=IMAGE_DEDUP_THUMBNAIL_WIDTH):
+    """按固定宽度缩小的灰度图，返回 (原图尺寸, 缩略图像素)"""
+    from PIL import Image
+    height = max(1, round(image.height * width / image.width))
+    gray = image.convert('L').resize((width, height), Image.Resampling.BOX)
+    return image.size, gray.tobytes()
+
+
+def max_pixel_difference(a, b):
+    """两张同尺寸缩略图逐像素差值的最大值"""
+    from PIL import Image, ImageChops
+    size = (IMAGE_DEDUP_THUMBNAIL_WIDTH, len(a) // IMAGE_DEDUP_THUMBNAIL_WIDTH)
+    difference = ImageChops.difference(Image.frombytes('L', size, a), Image.frombytes('L', size, b))
+    return difference.getextrema()[1]
+
+
+def hamming_distance(a, b):
+    """两个哈希值之间的汉明距离"""
+    return bin(a ^ b).count('1')
+
+
+class BKTree:
+    """按汉明距离组织的BK树，支持在给定距离内快速查找相似哈希"""
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, value, item):
+        node = self.root
+        if node is None:
+            self.root = [value, item, {}]
+            return
+        while True:
+            distance = hamming_distance(value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, item, {}]
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """返回距离不超过 max_distance 的 [(距离, item), ...]，按距离升序"""
+        if self.root is None:
+            return []
+        results = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(value, node[0])
+            if distance <= max_distance:
+                results.append((distance, node[1]))
+            # 三角不等式剪枝
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        results.sort(key=lambda r: r[0])
+        return results
+
+
+class ImageDedupIndex:
+    """
+    截图内容去重索引
+
+    对预处理后的图片记录精确内容哈希（SHA-256）、感知哈希（dHash）和灰度缩略图。
+    内容完全相同（含重命名）的截图直接拒绝；感知哈希近似的截图再比较缩略图像素，尺寸相同且
+    逐像素差值都在 pixel_tolerance 内的（如PNG另存为JPEG）同样在OCR之前拒绝。
+    同一App版式下不同日期、距离的两次跑步截图dHash可能只差一两位，但数字处的像素差异明显，
+    只记录日志、照常处理，是否重复交给提取后的记录级去重（RecordDeduplicator）确认。
+
+    处理流程：check_and_reserve 预占 -> 成功写入后 commit 确认（失败时 release 释放）
+    -> 输出文件写盘后 persist 持久化。
+    """
+
+    def __init__(self, db_path=IMAGE_DEDUP_FILE, max_distance=IMAGE_DEDUP_MAX_DISTANCE,
+                 hash_size=IMAGE_DEDUP_HASH_SIZE, pixel_tolerance=IMAGE_DEDUP_PIXEL_TOLERANCE):
+        self.db_path = db_path
+        self.max_distance = max_distance
+        self.hash_size = hash_size
+        self.pixel_tolerance = pixel_tolerance
+        self._lock = threading.Lock()
+        # sha256 -> (dhash, 文件名, 原图尺寸, 压缩后的缩略图)，包含已持久化和预占中的条目
+        self._entries = {}
+        self._pending = set()
+        self._committed = []
+        self._tree = BKTree()
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS images ("
+            " sha256 TEXT PRIMARY KEY,"
+            " dhash TEXT NOT NULL,"
+            " hash_size INTEGER NOT NULL,"
+            " image_file TEXT,"
+            " created_at REAL NOT NULL,"
+            " width INTEGER,"
+            " height INTEGER,"
+            " thumbnail BLOB)"
+        )
+        # 旧版本创建的索引没有尺寸和缩略图列，这些条目只参与精确匹配
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(images)")}
+        for column, column_type in (('width', 'INTEGER'), ('height', 'INTEGER'), ('thumbnail', 'BLOB')):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE images ADD COLUMN {column} {column_type}")
+        self._conn.commit()
+
+        rows = self._conn.execute(
+            "SELECT sha256, dhash, image_file, width, height, thumbnail FROM images WHERE hash_size = ?", (hash_size,)
+        ).fetchall()
+        for sha, hex_hash, image_file, width, height, compressed in rows:
+            size = (width, height) if width and height else None
+            self._index(sha, int(hex_hash, 16), image_file, size, compressed)
+        logging.info(f"图片去重索引已加载 {len(rows)} 条记录")
+
+    def _index(self, sha, perceptual_hash, image_file, size=None, compressed=None):
+        self._entries[sha] = (perceptual_hash, image_file, size, compressed)
+        self._tree.add(perceptual_hash, sha)
+
+    def compute_hashes(self, image_path):
+        """读取图片（预处理后的内存图片或文件路径），返回 (SHA-256, dHash, 原图尺寸, 缩略图像素)"""
+        from PIL import Image
+        image_bytes = load_image_bytes(image_path)
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            perceptual_hash = dhash(img, self.hash_size)
+            size, pixels = thumbnail(img)
+        return hashlib.sha256(image_bytes).hexdigest(), perceptual_hash, size, pixels
+
+    def _find_similar(self, perceptual_hash, size, pixels):
+        """
+        查找感知哈希距离不超过 max_distance 的截图
+
+        Returns:
+            tuple: (文件名, 汉明距离, 是否为重新编码的副本)，按距离最近的优先；没有近似截图时返回 None
+        """
+        if self.max_distance is None:
+            return None
+        nearest = None
+        for distance, match_sha in self._tree.search(perceptual_hash, self.max_distance):
+            # BK树不支持删除，已释放的条目在此过滤
+            if match_sha not in self._entries:
+                continue
+            _, image_file, match_size, compressed = self._entries[match_sha]
+            if match_size == size and compressed is not None \
+                    and max_pixel_difference(pixels, zlib.decompress(compressed)) <= self.pixel_tolerance:
+                return image_file, distance, True
+            if nearest is None:
+                nearest = (image_file, distance, False)
+        return nearest
+
+    def check_and_reserve(self, image_path, image_file):
+        """
+        检查图片是否与已有截图重复，不重复时预占索引
+
+        Args:
+            image_path (ProcessedImage | str): 预处理后的图片
+            image_file (str): 原始截图文件名
+
+        Returns:
+            tuple: (预占键, 重复来源) —— 内容相同或为重新编码的副本时预占键为 None，
+                   重复来源为 (文件名, 汉明距离)；否则重复来源为 None
+        """
+        sha, perceptual_hash, size, pixels = self.compute_hashes(image_path)
+        with self._lock:
+            if sha in self._entries:
+                return None, (self._entries[sha][1], 0)
+            similar = self._find_similar(perceptual_hash, size, pixels)
+            if similar and similar[2]:
+                return None, similar[:2]
+            self._index(sha, perceptual_hash, image_file, size, zlib.compress(pixels))
+            self._pending.add(sha)
+        if similar:
+            logging.info(f"截图与 {similar[0]} 近似（距离 {similar[1]}），继续处理，提取后按记录内容判断是否重复: "
+                         f"{image_file}")
+        return sha, None
+
+    def commit(self, key):
+        """截图处理成功后确认预占的条目，待 persist 时写入磁盘"""
+        with self._lock:
+            if key in self._pending:
+                self._pending.discard(key)
+                self._committed.append(key)
+
+    def persist(self):
+        """
+        持久化已确认的条目
+
+        应在输出文件写盘之后调用：进程中途退出时索引只会缺少条目（截图会被重新处理），
+        而不会出现索引已记录、输出文件却没有对应记录的情况。
+        """
+        with self._lock:
+            rows = []
+            for key in self._committed:
+                if key in self._entries:
+                    perceptual_hash, image_file, size, compressed = self._entries[key]
+                    width, height = size or (None, None)
+                    rows.append((key, format(perceptual_hash, 'x'), self.hash_size, image_file, time.time(),
+                                 width, height, compressed))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO images (sha256, dhash, hash_size, image_file, created_at, width, height, thumbnail) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+            self._committed = []
+        return len(rows)
+
+    def release(self, key):
+        """截图处理失败时释放预占，允许之后重新处理"""
+        with self._lock:
+            if key in self._pending:
+                self._pending.discard(key)
+                self._entries.pop(key, None)
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
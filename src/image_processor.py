@@ -1,47 +1,293 @@
 import os
-from PIL import Image
+import io
+import sys
+import math
+import time
+import tempfile
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import logging
 
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.insert(0, project_root)
+
+from config.settings import (
+    PREPROCESS_CACHE_ENABLED, PREPROCESS_CACHE_DIR, PREPROCESS_MAX_SIZE, PREPROCESS_QUALITY,
+    PREPROCESS_RESAMPLE, PREPROCESS_GRAYSCALE, PREPROCESS_CROP_BOX, PREPROCESS_MODE,
+    PREPROCESS_OCR_TEXT_HEIGHT, PREPROCESS_OCR_MIN_SCALE, PREPROCESS_OCR_QUALITY, PREPROCESS_OCR_CHROME,
+    PIPELINE_PREPROCESS_WORKERS
+)
+from src.cache import make_cache_key
+
+# Pillow 在首次预处理时才导入，不处理图片的命令无需加载
+
+PREPROCESS_MODES = ('default', 'ocr')
+
+# 边缘强度超过该值的像素视为文字/图形边缘
+_EDGE_THRESHOLD = 40
+# 边缘像素占比超过该值的行视为文字行
+_TEXT_ROW_RATIO = 0.01
+
+
+class ProcessedImage:
+    """预处理后的图片：JPEG内容保存在内存中，直接交给OCR阶段，不再写临时文件"""
+
+    __slots__ = ('data', 'source_path', 'elapsed')
+
+    def __init__(self, data, source_path, elapsed=0.0):
+        self.data = data
+        self.source_path = source_path
+        # 预处理耗时（秒）
+        self.elapsed = elapsed
+
+    def __str__(self):
+        return f"{self.source_path} (预处理后 {len(self.data)} 字节)"
+
+    def to_array(self):
+        """解码为 BGR 排列的 numpy 数组（与 PaddleOCR/OpenCV 一致）"""
+        import numpy as np
+        from PIL import Image
+        with Image.open(io.BytesIO(self.data)) as img:
+            return np.array(img.convert('RGB'))[:, :, ::-1]
+
+
+def load_image_bytes(image):
+    """读取图片内容，支持 ProcessedImage 和文件路径"""
+    if isinstance(image, ProcessedImage):
+        return image.data
+    with open(image, 'rb') as image_file:
+        return image_file.read()
+
+
 class ImageProcessor:
-    def __init__(self, screenshots_dir):
+    def __init__(self, screenshots_dir, cache_dir=PREPROCESS_CACHE_DIR if PREPROCESS_CACHE_ENABLED else None,
+                 max_size=PREPROCESS_MAX_SIZE, quality=PREPROCESS_QUALITY, resample=PREPROCESS_RESAMPLE,
+                 grayscale=PREPROCESS_GRAYSCALE, crop_box=PREPROCESS_CROP_BOX, mode=PREPROCESS_MODE,
+                 ocr_quality=PREPROCESS_OCR_QUALITY):
+        if mode not in PREPROCESS_MODES:
+            raise ValueError(f"不支持的预处理模式: {mode}，可选 {PREPROCESS_MODES}")
         self.screenshots_dir = screenshots_dir
         self.supported_formats = ('.png', '.jpg', '.jpeg')
-        
+        # 预处理结果的磁盘缓存目录，为 None 时不缓存
+        self.cache_dir = cache_dir
+        self.max_size = tuple(max_size)
+        self.quality = quality
+        self.resample = resample
+        self.grayscale = grayscale
+        self.crop_box = tuple(crop_box) if crop_box else None
+        self.mode = mode
+        self.ocr_quality = ocr_quality
+        # OCR优化模式总是输出灰度图
+        self.grayscale = grayscale or mode == 'ocr'
+
     def get_screenshot_files(self):
         """获取所有截图文件"""
         files = []
         for file in os.listdir(self.screenshots_dir):
-            # 跳过已处理的文件
-            if file.lower().endswith('_processed.jpg'):
-                continue
-                
-            if file.lower().endswith(self.supported_formats):
+            if self.is_screenshot_file(file):
                 files.append(os.path.join(self.screenshots_dir, file))
         return files
-    
-    def preprocess_image(self, image_path, max_size=(1024, 1024)):
-        """预处理图像，调整大小以减少API调用成本"""
-        # 生成处理后的文件路径
-        processed_path = f"{image_path}_processed.jpg"
-        
-        # 如果已处理的文件已存在，直接返回路径
-        if os.path.exists(processed_path):
-            logging.info(f"使用已存在的处理文件: {processed_path}")
-            return processed_path
-            
+
+    def is_screenshot_file(self, filename):
+        """按文件名判断是否为待处理的截图"""
+        filename = filename.lower()
+        # 跳过旧版本在截图目录中生成的处理文件，以及上传/复制工具写入中的隐藏临时文件
+        if filename.endswith('_processed.jpg') or filename.startswith('.'):
+            return False
+        return filename.endswith(self.supported_formats)
+
+    def _cache_path(self, image_path, max_size, quality):
+        """缓存文件路径：按原图路径、大小、修改时间和预处理参数区分"""
+        stat = os.stat(image_path)
+        params = (f"{stat.st_size}:{stat.st_mtime_ns}:{max_size}:{quality}:{self.resample}:{self.grayscale}:"
+                  f"{self.crop_box}:{self.mode}:{self.ocr_quality}")
+        key = make_cache_key(os.path.abspath(image_path), params)
+        return os.path.join(self.cache_dir, f"{key}.jpg")
+
+    def _save_cache(self, cache_path, data):
+        """先写临时文件再重命名，并发写入同一缓存文件时不会读到半个文件"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix='.jpg', prefix='.tmp_', dir=self.cache_dir)
         try:
+            with os.fdopen(fd, 'wb') as cache_file:
+                cache_file.write(data)
+            os.replace(temp_path, cache_path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _crop_pixels(self, size):
+        """把按比例给出的裁剪区域换算为像素坐标"""
+        width, height = size
+        left, top, right, bottom = self.crop_box
+        return (round(left * width), round(top * height), round(right * width), round(bottom * height))
+
+    def _draft(self, img, max_size):
+        """
+        JPEG 按 1/2、1/4、1/8 缩小解码，解码尺寸不小于最终输出所需尺寸
+
+        其他格式不支持 draft，原样解码。
+        """
+        if img.format != 'JPEG':
+            return
+        width, height = img.size
+        # 裁剪后的区域需要缩放到 max_size 以内，按该比例反推整图所需的解码尺寸
+        crop_width, crop_height = width, height
+        if self.crop_box:
+            left, top, right, bottom = self.crop_box
+            crop_width, crop_height = width * (right - left), height * (bottom - top)
+        scale = min(1.0, max_size[0] / max(crop_width, 1), max_size[1] / max(crop_height, 1))
+        if scale < 1.0:
+            img.draft('L' if self.grayscale else 'RGB', (math.ceil(width * scale), math.ceil(height * scale)))
+
+    def _estimate_line_height(self, edges):
+        """
+        估计文字行高（像素）
+
+        按行统计边缘像素占比，连续的文字行构成一行文字，取各行文字高度的中位数。
+        """
+        from PIL import Image
+        width, height = edges.size
+        # 缩放到单列即得到每行的边缘像素平均强度
+        profile = list(edges.resize((1, height), Image.Resampling.BOX).getdata())
+        threshold = 255 * _TEXT_ROW_RATIO
+        runs = []
+        run = 0
+        for value in profile + [0]:
+            if value > threshold:
+                run += 1
+            elif run:
+                # 过滤分隔线等过细的横向图形
+                if run >= 3:
+                    runs.append(run)
+                run = 0
+        if not runs:
+            return None
+        runs.sort()
+        return runs[len(runs) // 2]
+
+    def _optimize_for_ocr(self, img, max_size):
+        """
+        按内容优化灰度图：对比度拉伸、裁去状态栏/导航栏和空白边距，按文字大小选择输出尺寸和质量
+
+        Returns:
+            tuple: (处理后的图片, 输出尺寸上限, JPEG质量)
+        """
+        from PIL import ImageFilter, ImageOps
+        img = ImageOps.autocontrast(img, cutoff=1)
+
+        # 竖屏手机截图裁去顶部状态栏和底部导航栏
+        width, height = img.size
+        if height > width * 1.6:
+            top, bottom = PREPROCESS_OCR_CHROME
+            img = img.crop((0, round(height * top), width, round(height * (1 - bottom))))
+
+        # 按边缘裁去空白边距（与背景颜色无关，深色主题同样适用）
+        edges = img.filter(ImageFilter.FIND_EDGES).point(lambda v: 255 if v > _EDGE_THRESHOLD else 0)
+        # 滤波在图片边界上会产生伪边缘，不参与计算
+        edges = ImageOps.expand(edges.crop((1, 1, edges.width - 1, edges.height - 1)), border=1, fill=0)
+        bbox = edges.getbbox()
+        if bbox:
+            padding = max(4, min(img.size) // 50)
+            bbox = (max(0, bbox[0] - padding), max(0, bbox[1] - padding),
+                    min(img.width, bbox[2] + padding), min(img.height, bbox[3] + padding))
+            img = img.crop(bbox)
+            edges = edges.crop(bbox)
+
+        # 文字越大可以缩得越小，文字已经偏小时保持分辨率并提高质量
+        quality = self.ocr_quality
+        line_height = self._estimate_line_height(edges)
+        if line_height:
+            scale = min(1.0, max(PREPROCESS_OCR_TEXT_HEIGHT / line_height, PREPROCESS_OCR_MIN_SCALE))
+            if line_height * scale < PREPROCESS_OCR_TEXT_HEIGHT:
+                quality = max(quality, self.quality)
+            max_size = (min(max_size[0], math.ceil(img.width * scale)),
+                        min(max_size[1], math.ceil(img.height * scale)))
+        return img, max_size, quality
+
+    def preprocess_image(self, image_path, max_size=None, quality=None):
+        """
+        预处理图像，调整大小以减少API调用成本
+
+        Returns:
+            ProcessedImage: 内存中的JPEG图片，失败时返回 None
+        """
+        from PIL import Image
+        max_size = tuple(max_size or self.max_size)
+        quality = quality or self.quality
+        started = time.perf_counter()
+        try:
+            cache_path = None
+            if self.cache_dir:
+                cache_path = self._cache_path(image_path, max_size, quality)
+                if os.path.exists(cache_path):
+                    with open(cache_path, 'rb') as cache_file:
+                        logging.info(f"使用已缓存的处理结果: {image_path}")
+                        return ProcessedImage(cache_file.read(), image_path, time.perf_counter() - started)
+
             with Image.open(image_path) as img:
-                # 转换为RGB（如果是RGBA或其他模式）
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
+                self._draft(img, max_size)
+
+                # 转换为RGB或灰度（如果是RGBA或其他模式）
+                mode = 'L' if self.grayscale else 'RGB'
+                if img.mode != mode:
+                    img = img.convert(mode)
+
+                # 裁剪到数据区域
+                if self.crop_box:
+                    img = img.crop(self._crop_pixels(img.size))
+
+                # 按内容优化，输出尺寸和质量由文字大小决定
+                if self.mode == 'ocr':
+                    img, max_size, quality = self._optimize_for_ocr(img, max_size)
+
                 # 调整图像大小
-                img.thumbnail(max_size, Image.Resampling.LANCZOS)
-                
-                # 保存处理后的图像
-                img.save(processed_path, 'JPEG', quality=85)
-                logging.info(f"创建新的处理文件: {processed_path}")
-                return processed_path
+                img.thumbnail(max_size, getattr(Image.Resampling, self.resample))
+
+                # 编码到内存，直接交给OCR阶段
+                buffer = io.BytesIO()
+                img.save(buffer, 'JPEG', quality=quality)
+
+            data = buffer.getvalue()
+            if cache_path:
+                self._save_cache(cache_path, data)
+            elapsed = time.perf_counter() - started
+            logging.info(f"图像预处理完成: {image_path} ({len(data)} 字节, 耗时 {elapsed * 1000:.0f} ms)")
+            return ProcessedImage(data, image_path, elapsed)
         except Exception as e:
             logging.error(f"图像处理失败 {image_path}: {e}")
-            return None
\ No newline at end of file
+            return None
+
+    def preprocess_many(self, image_paths, workers=PIPELINE_PREPROCESS_WORKERS):
+        """
+        用进程池并行预处理，按输入顺序逐个返回 (路径, ProcessedImage 或 None)
+
+        同时在途的任务不超过 workers 的两倍，调用方处理较慢时不会在内存中堆积大量图片。
+        """
+        workers = max(1, workers)
+        paths = iter(image_paths)
+        count = 0
+        cpu_time = 0.0
+        started = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = deque(
+                (path, executor.submit(self.preprocess_image, path)) for path in itertools.islice(paths, workers * 2)
+            )
+            while pending:
+                path, future = pending.popleft()
+                for next_path in itertools.islice(paths, 1):
+                    pending.append((next_path, executor.submit(self.preprocess_image, next_path)))
+                processed_image = future.result()
+                count += 1
+                if processed_image:
+                    cpu_time += processed_image.elapsed
+                yield path, processed_image
+
+        if count:
+            wall_time = time.perf_counter() - started
+            logging.info(f"预处理完成 {count} 张图片: 总耗时 {wall_time:.2f} s, "
+                         f"平均每张 {cpu_time / count * 1000:.0f} ms, 吞吐 {count / max(wall_time, 1e-9):.1f} 张/秒")
@@ -0,0 +1,224 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.insert(0, project_root)
+
+from config.settings import JOB_JOURNAL_FILE, JOB_MAX_ATTEMPTS, JOB_RETRY_BACKOFF_BASE, JOB_RETRY_BACKOFF_MAX
+
+# 任务状态：running 处理中（启动时仍为 running 说明上次运行中断）、done 已写入、
+# skipped 重复而跳过（所重复的截图最终失败时重新处理）、failed 失败（退避后重试）
+JOB_STATUSES = ('running', 'done', 'skipped', 'failed')
+
+
+class JobJournal:
+    """
+    批处理任务日志
+
+    每张截图一行，记录最后所处阶段、状态、尝试次数、各阶段耗时和最近一次错误。
+    下次运行时已完成的截图直接跳过，中断的截图继续处理，失败的截图按指数退避重试，
+    超过最大尝试次数后不再自动重试。
+
+    与 ImageDedupIndex 相同，状态变更先保留在未提交的事务中，输出文件写盘后调用
+    checkpoint 提交：进程中途退出时日志只会缺少最近的变更（对应截图会被重新处理），
+    而不会出现日志已标记完成、输出文件却没有对应记录的情况。
+    """
+
+    def __init__(self, db_path=JOB_JOURNAL_FILE, max_attempts=JOB_MAX_ATTEMPTS,
+                 backoff_base=JOB_RETRY_BACKOFF_BASE, backoff_max=JOB_RETRY_BACKOFF_MAX):
+        self.db_path = db_path
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.RLock()
+        # 处理中任务的各阶段耗时：文件名 -> {阶段: 秒}
+        self._timings = {}
+
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " image_file TEXT PRIMARY KEY,"
+            " path TEXT NOT NULL,"
+            " stage TEXT,"
+            " status TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " error TEXT,"
+            " timings TEXT,"
+            " next_attempt_at REAL,"
+            " started_at REAL,"
+            " updated_at REAL NOT NULL,"
+            " duplicate_of TEXT)"
+        )
+        # 旧版本创建的日志没有 duplicate_of 列，其中跳过的截图保持跳过
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if 'duplicate_of' not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN duplicate_of TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, next_attempt_at)")
+        self._conn.commit()
+
+    def _retryable(self, status, attempts, next_attempt_at, now, retry_failed):
+        if retry_failed or status == 'done':
+            return True
+        if attempts >= self.max_attempts:
+            return False
+        return status != 'failed' or not next_attempt_at or next_attempt_at <= now
+
+    def plan(self, screenshot_files, record_writer, retry_failed=False):
+        """
+        根据日志和输出存储筛选本次需要处理的截图
+
+        已完成但输出存储中找不到对应记录的截图（如删除了输出文件）会重新处理；
+        输出存储中已有记录、日志中却没有完成标记的截图（如旧版本处理的或提交前中断的）直接补记为完成；
+        因与另一截图重复而跳过、而那张截图最终失败的截图会重新处理。
+
+        Args:
+            screenshot_files (list): 截图路径列表
+            record_writer: 输出存储，用于检查是否已有记录
+            retry_failed (bool): 忽略退避时间和最大尝试次数，立即重试所有失败的截图
+
+        Returns:
+            list: 需要处理的截图路径
+        """
+        now = time.time()
+        with self._lock:
+            rows = {
+                row[0]: row[1:] for row in self._conn.execute(
+                    "SELECT image_file, status, attempts, next_attempt_at, duplicate_of FROM jobs"
+                )
+            }
+
+        counts = {'done': 0, 'skipped': 0, 'waiting': 0, 'exhausted': 0, 'resumed': 0, 'retry': 0, 'new': 0}
+        planned = []
+        for path in screenshot_files:
+            image_file = os.path.basename(path)
+            status, attempts, next_attempt_at, duplicate_of = rows.get(image_file, (None, 0, None, None))
+            if status == 'skipped':
+                if duplicate_of in rows and rows[duplicate_of][0] == 'failed':
+                    counts['retry'] += 1
+                    planned.append(path)
+                else:
+                    counts['skipped'] += 1
+                continue
+            if record_writer.is_duplicate_record(image_file):
+                counts['done'] += 1
+                if status != 'done':
+                    self.finish(image_file, 'done', path=path)
+                continue
+            if status is not None and not self._retryable(status, attempts, next_attempt_at, now, retry_failed):
+                counts['exhausted' if attempts >= self.max_attempts else 'waiting'] += 1
+                continue
+            if status == 'running':
+                counts['resumed'] += 1
+            elif status == 'failed':
+                counts['retry'] += 1
+            else:
+                counts['new'] += 1
+            planned.append(path)
+
+        logging.info(f"任务日志: 新增 {counts['new']} 个, 中断后继续 {counts['resumed']} 个, 重试 {counts['retry']} 个, "
+                     f"已完成 {counts['done']} 个, 重复跳过 {counts['skipped']} 个")
+        if counts['waiting'] or counts['exhausted']:
+            logging.warning(f"任务日志: {counts['waiting']} 个失败截图等待退避后重试, "
+                            f"{counts['exhausted']} 个超过 {self.max_attempts} 次尝试不再自动重试（可用 --retry-failed 重试）")
+        return planned
+
+    def due_retries(self):
+        """返回退避时间已到、可以重试的失败截图，以及所重复的截图已失败的跳过截图的路径"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM jobs WHERE status = 'failed' AND attempts < ? AND next_attempt_at <= ? "
+                "UNION SELECT skipped.path FROM jobs AS skipped JOIN jobs AS original "
+                "ON original.image_file = skipped.duplicate_of "
+                "WHERE skipped.status = 'skipped' AND original.status = 'failed' "
+                "ORDER BY path", (self.max_attempts, time.time())
+            ).fetchall()
+        return [row[0] for row in rows if os.path.exists(row[0])]
+
+    def start(self, screenshot_path):
+        """开始处理一张截图，尝试次数加一"""
+        image_file = os.path.basename(screenshot_path)
+        now = time.time()
+        with self._lock:
+            self._timings[image_file] = {}
+            self._conn.execute(
+                "INSERT INTO jobs (image_file, path, status, attempts, started_at, updated_at) "
+                "VALUES (?, ?, 'running', 1, ?, ?) "
+                "ON CONFLICT (image_file) DO UPDATE SET path = excluded.path, stage = NULL, status = 'running', "
+                "attempts = attempts + 1, error = NULL, timings = NULL, next_attempt_at = NULL, duplicate_of = NULL, "
+                "started_at = excluded.started_at, updated_at = excluded.updated_at",
+                (image_file, screenshot_path, now, now)
+            )
+
+    def record_stage(self, image_file, stage, elapsed):
+        """记录一个阶段的耗时（秒）"""
+        with self._lock:
+            self._timings.setdefault(image_file, {})[stage] = round(elapsed, 4)
+            self._conn.execute(
+                "UPDATE jobs SET stage = ?, updated_at = ? WHERE image_file = ?", (stage, time.time(), image_file)
+            )
+
+    def finish(self, image_file, status, error=None, path=None, stage=None, timings=None, duplicate_of=None):
+        """
+        记录处理结果
+
+        Args:
+            status (str): done / skipped / failed
+            error (str): 失败或跳过的原因
+            path (str): 日志中还没有该截图时使用的路径
+            stage (str): 最后所处的阶段，不提供时保留 record_stage 记录的阶段
+            timings (dict): 各阶段耗时（秒），与 record_stage 记录的耗时合并
+            duplicate_of (str): 跳过时所重复的截图文件名，该截图最终失败时重新处理本截图
+        """
+        now = time.time()
+        with self._lock:
+            timings = dict(self._timings.pop(image_file, None) or {},
+                           **{name: round(elapsed, 4) for name, elapsed in (timings or {}).items()})
+            attempts = self._conn.execute(
+                "SELECT attempts FROM jobs WHERE image_file = ?", (image_file,)
+            ).fetchone()
+            next_attempt_at = None
+            if status == 'failed' and attempts:
+                # 指数退避：第 n 次失败后等待 base * 2^(n-1) 秒
+                next_attempt_at = now + min(self.backoff_base * 2 ** (attempts[0] - 1), self.backoff_max)
+            if attempts is None:
+                self._conn.execute(
+                    "INSERT INTO jobs (image_file, path, status, error, updated_at, duplicate_of) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (image_file, path or image_file, status, error, now, duplicate_of)
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE jobs SET stage = COALESCE(?, stage), status = ?, error = ?, timings = COALESCE(?, timings), "
+                    "next_attempt_at = ?, updated_at = ?, duplicate_of = ? WHERE image_file = ?",
+                    (stage, status, error, json.dumps(timings, ensure_ascii=False) if timings else None,
+                     next_attempt_at, now, duplicate_of, image_file)
+                )
+
+    def checkpoint(self):
+        """提交尚未持久化的状态变更，应在输出文件写盘之后调用"""
+        with self._lock:
+            self._conn.commit()
+
+    def summary(self):
+        """
+        按状态统计任务数
+
+        Returns:
+            dict: 状态 -> 数量
+        """
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def close(self):
+        """关闭数据库连接（未调用 checkpoint 的变更会被丢弃）"""
+        with self._lock:
+            self._conn.close()
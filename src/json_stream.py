@@ -0,0 +1,54 @@
+import json
+
+
+class JSONObjectScanner:
+    """
+    增量扫描流式输出的文本，每当一个顶层JSON对象的括号闭合时解析并返回
+
+    只在对象内部跟踪字符串和转义，对象之外的文字（说明、代码块标记等）直接跳过；
+    括号闭合但无法解析的片段被忽略，继续扫描后续内容。
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._depth = 0
+        self._start = None
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk):
+        """
+        追加一段文本
+
+        Returns:
+            list: 本段文本中闭合的JSON对象（dict）
+        """
+        self.text += chunk
+        objects = []
+        for index in range(self._pos, len(self.text)):
+            char = self.text[index]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"' and self._depth:
+                self._in_string = True
+            elif char == '{':
+                if self._depth == 0:
+                    self._start = index
+                self._depth += 1
+            elif char == '}' and self._depth:
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        parsed = json.loads(self.text[self._start:index + 1])
+                    except json.JSONDecodeError:
+                        parsed = None
+                    if isinstance(parsed, dict):
+                        objects.append(parsed)
+        self._pos = len(self.text)
+        return objects
@@ -1,17 +1,25 @@
 import os
 import sys
 import time
+import signal
 import logging
+import argparse
 
 # 获取当前文件所在目录，然后添加项目根目录到Python路径
 current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(current_dir)
 sys.path.insert(0, project_root)
 
-from config.settings import SCREENSHOTS_DIR, OUTPUT_DIR, OUTPUT_FILE
+from config.settings import SCREENSHOTS_DIR, OUTPUT_DIR, OUTPUT_FILE, IMAGE_DEDUP_ENABLED, RECORD_DEDUP_ENABLED, STORAGE_BACKEND, WATCH_BACKEND, JOB_JOURNAL_ENABLED, JOB_CHECKPOINT_EVERY, METRICS_PORT, CHAT_STREAM_ENABLED, ANALYSIS_MODE, EXPORT_EXCEL_FILE
 from src.image_processor import ImageProcessor
-from src.ai_analyzer import AIAnalyzer
-from src.excel_writer import ExcelWriter
+from src.ai_analyzer import AIAnalyzer, ANALYSIS_MODES
+from src.storage import STORAGE_BACKENDS, create_writer, export_to_excel
+from src.pipeline import ScreenshotPipeline
+from src.image_index import ImageDedupIndex
+from src.record_dedup import RecordDeduplicator
+from src.watcher import ScreenshotWatcher, WATCH_BACKENDS
+from src.job_journal import JobJournal
+from src.metrics import get_metrics, image_scope
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -21,66 +29,308 @@ def setup_directories():
     os.makedirs(SCREENSHOTS_DIR, exist_ok=True)
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-def process_running_screenshots():
-    """主处理流程"""
-    # 初始化组件
-    image_processor = ImageProcessor(SCREENSHOTS_DIR)
-    ai_analyzer = AIAnalyzer(use_paddle_ocr=True)
-    excel_writer = ExcelWriter(OUTPUT_FILE)
-    
-    # 创建或加载Excel文件
-    excel_writer.create_or_load_excel()
-    
-    # 获取截图文件
-    screenshot_files = image_processor.get_screenshot_files()
-    
-    if not screenshot_files:
-        logging.info("未找到截图文件，请将跑步截图放入 data/screenshots 目录")
-        return
-    
-    logging.info(f"找到 {len(screenshot_files)} 个截图文件")
-    
-    # 处理每个截图
-    for screenshot_path in screenshot_files:
+def log_cache_stats(ai_analyzer):
+    """输出缓存命中统计和各阶段耗时，并写出指标文件"""
+    cache_stats = ai_analyzer.cache_stats()
+    for name, stats in cache_stats.items():
+        logging.info(f"{name} 缓存: 命中 {stats['hits']} 次, 未命中 {stats['misses']} 次, "
+                     f"命中率 {stats['hit_rate']:.1%}, 条目数 {stats['entries']}")
+    metrics = get_metrics()
+    metrics.set_cache_stats(cache_stats)
+    metrics.log_summary()
+    metrics.flush()
+
+def checkpoint(record_writer, image_index=None, job_journal=None):
+    """输出写盘后依次持久化去重索引和任务日志，返回是否成功"""
+    if not record_writer.flush():
+        logging.error("写入记录失败，将在下次写盘时重试")
+        return False
+    if image_index:
+        image_index.persist()
+    if job_journal:
+        job_journal.checkpoint()
+    get_metrics().flush()
+    return True
+
+def finish_run(record_writer, image_index=None, job_journal=None):
+    """写出缓冲中剩余的记录，之后再持久化去重索引和任务日志"""
+    if not record_writer.close():
+        logging.error("写入记录失败，剩余记录未保存")
+    else:
+        if image_index:
+            image_index.persist()
+        if job_journal:
+            job_journal.checkpoint()
+    if job_journal:
+        logging.info(f"任务日志状态统计: {job_journal.summary()}")
+        job_journal.close()
+
+def process_screenshot_files(new_files, image_processor, ai_analyzer, record_writer, image_index=None,
+                             record_deduplicator=None, job_journal=None):
+    """逐个分析截图并写入存储（顺序模式和监视模式共用）"""
+    # 处理每个截图（预处理在进程池中提前进行，与分析并行）
+    for count, (screenshot_path, processed_image) in enumerate(image_processor.preprocess_many(new_files), 1):
         logging.info(f"处理文件: {screenshot_path}")
         
         # 提取图片文件名（不含路径）
         image_filename = os.path.basename(screenshot_path)
-        
-        # 检查是否为重复记录
-        if excel_writer.is_duplicate_record(image_filename):
-            logging.warning(f"发现重复记录，跳过: {image_filename}")
-            continue
+        if job_journal:
+            job_journal.start(screenshot_path)
+            # 定期写盘并提交任务日志，中断后从最近的检查点继续
+            if count % JOB_CHECKPOINT_EVERY == 0:
+                checkpoint(record_writer, image_index, job_journal)
         
         # 预处理图像
-        processed_image = image_processor.preprocess_image(screenshot_path)
         if not processed_image:
             logging.error(f"图像处理失败: {screenshot_path}")
+            if job_journal:
+                job_journal.finish(image_filename, 'failed', "图像处理失败")
             continue
+        if job_journal:
+            job_journal.record_stage(image_filename, '预处理', processed_image.elapsed)
+        get_metrics().record('preprocess', processed_image.elapsed, image=image_filename,
+                             bytes=len(processed_image.data))
+        
+        # 内容重复（含重命名、重新编码）的截图在OCR之前拒绝
+        dedup_key = None
+        if image_index:
+            with get_metrics().span('dedup', image=image_filename) as span:
+                dedup_key, duplicate_of = image_index.check_and_reserve(processed_image, image_filename)
+                span.set(duplicate=bool(duplicate_of))
+            if duplicate_of:
+                logging.warning(f"发现重复截图，跳过: {image_filename} (与 {duplicate_of[0]} 相同，距离 {duplicate_of[1]})")
+                if job_journal:
+                    job_journal.finish(image_filename, 'skipped', f"与 {duplicate_of[0]} 内容重复",
+                                       duplicate_of=duplicate_of[0])
+                continue
         
         # AI分析
-        running_data = ai_analyzer.analyze_running_screenshot(processed_image)
+        started = time.perf_counter()
+        with image_scope(image_filename):
+            running_data = ai_analyzer.analyze_running_screenshot(processed_image)
+        if job_journal:
+            job_journal.record_stage(image_filename, '分析', time.perf_counter() - started)
         if not running_data:
             logging.error(f"AI分析失败: {screenshot_path}")
+            if dedup_key:
+                image_index.release(dedup_key)
+            if job_journal:
+                job_journal.finish(image_filename, 'failed', "AI分析失败")
             continue
 
-        # 写入Excel
-        if excel_writer.append_to_excel(running_data, image_filename):
+        # 记录级去重：同一次跑步的不同截图
+        if record_deduplicator and not record_deduplicator.should_write(running_data, image_filename):
+            if dedup_key:
+                image_index.commit(dedup_key)
+            if job_journal:
+                job_journal.finish(image_filename, 'skipped', "与已有记录重复")
+            continue
+
+        # 写入存储
+        started = time.perf_counter()
+        if record_writer.append_record(running_data, image_filename):
+            elapsed = time.perf_counter() - started
+            get_metrics().record('write', elapsed, image=image_filename)
             logging.info(f"成功添加记录: {running_data.get('date')} (来自 {image_filename})")
+            if record_deduplicator:
+                record_deduplicator.record_written(running_data, image_filename)
+            if dedup_key:
+                image_index.commit(dedup_key)
+            if job_journal:
+                job_journal.record_stage(image_filename, '写入', elapsed)
+                job_journal.finish(image_filename, 'done')
         else:
-            logging.error(f"写入Excel失败: {screenshot_path}")
-        
-        time.sleep(2)  # 避免请求过快
+            logging.error(f"写入记录失败: {screenshot_path}")
+            if dedup_key:
+                image_index.release(dedup_key)
+            if job_journal:
+                job_journal.finish(image_filename, 'failed', "写入记录失败")
+
+def process_running_screenshots(record_writer, retry_failed=False, analyzer_options=None):
+    """主处理流程"""
+    # 初始化组件
+    image_processor = ImageProcessor(SCREENSHOTS_DIR)
+    
+    # 获取截图文件（没有截图时不初始化OCR引擎、缓存等组件）
+    screenshot_files = image_processor.get_screenshot_files()
+    
+    if not screenshot_files:
+        logging.info("未找到截图文件，请将跑步截图放入 data/screenshots 目录")
+        return
+    
+    logging.info(f"找到 {len(screenshot_files)} 个截图文件")
+    
+    ai_analyzer = AIAnalyzer(use_paddle_ocr=True, **(analyzer_options or {}))
+    image_index = ImageDedupIndex() if IMAGE_DEDUP_ENABLED else None
+    
+    # 创建或加载输出存储
+    record_writer.create_or_load()
+    record_deduplicator = RecordDeduplicator(record_writer) if RECORD_DEDUP_ENABLED else None
+    
+    # 按任务日志跳过已完成、等待重试的截图，只处理新增、中断和到期重试的截图
+    job_journal = JobJournal() if JOB_JOURNAL_ENABLED else None
+    if job_journal:
+        new_files = job_journal.plan(screenshot_files, record_writer, retry_failed)
+    else:
+        # 检查是否为重复记录
+        new_files = []
+        for screenshot_path in screenshot_files:
+            if record_writer.is_duplicate_record(os.path.basename(screenshot_path)):
+                logging.warning(f"发现重复记录，跳过: {os.path.basename(screenshot_path)}")
+                continue
+            new_files.append(screenshot_path)
+    
+    process_screenshot_files(new_files, image_processor, ai_analyzer, record_writer, image_index,
+                             record_deduplicator, job_journal)
+    
+    finish_run(record_writer, image_index, job_journal)
+    log_cache_stats(ai_analyzer)
+    ai_analyzer.close()
+
+def process_running_screenshots_pipelined(record_writer, retry_failed=False, analyzer_options=None):
+    """流水线处理流程：各阶段并发执行，输出顺序与文件顺序一致"""
+    # 初始化组件
+    image_processor = ImageProcessor(SCREENSHOTS_DIR)
+    
+    # 获取截图文件（没有截图时不初始化OCR引擎、缓存等组件）
+    screenshot_files = image_processor.get_screenshot_files()
+    
+    if not screenshot_files:
+        logging.info("未找到截图文件，请将跑步截图放入 data/screenshots 目录")
+        return
+    
+    logging.info(f"找到 {len(screenshot_files)} 个截图文件")
+    
+    ai_analyzer = AIAnalyzer(use_paddle_ocr=True, **(analyzer_options or {}))
+    image_index = ImageDedupIndex() if IMAGE_DEDUP_ENABLED else None
+    
+    # 创建或加载输出存储
+    record_writer.create_or_load()
+    record_deduplicator = RecordDeduplicator(record_writer) if RECORD_DEDUP_ENABLED else None
+    
+    # 提前过滤重复记录和无需重试的截图，避免无用的预处理和API调用
+    job_journal = JobJournal() if JOB_JOURNAL_ENABLED else None
+    if job_journal:
+        new_files = job_journal.plan(screenshot_files, record_writer, retry_failed)
+    else:
+        new_files = record_writer.filter_new(screenshot_files)
+        if len(new_files) < len(screenshot_files):
+            logging.warning(f"发现 {len(screenshot_files) - len(new_files)} 条重复记录，已跳过")
+    
+    pipeline = ScreenshotPipeline(image_processor, ai_analyzer, record_writer, image_index=image_index,
+                                  record_deduplicator=record_deduplicator, job_journal=job_journal)
+    pipeline.run(new_files)
+    
+    finish_run(record_writer, image_index, job_journal)
+    log_cache_stats(ai_analyzer)
+    ai_analyzer.close()
+
+def watch_running_screenshots(record_writer, use_pipeline=False, watch_backend=WATCH_BACKEND, retry_failed=False,
+                              analyzer_options=None):
+    """监视模式：常驻运行，截图目录中出现新文件时增量处理"""
+    image_processor = ImageProcessor(SCREENSHOTS_DIR)
+    
+    # OCR模型、HTTP会话、缓存和去重索引只初始化一次，每批新截图都复用
+    ai_analyzer = AIAnalyzer(use_paddle_ocr=True, **(analyzer_options or {}))
+    image_index = ImageDedupIndex() if IMAGE_DEDUP_ENABLED else None
+    record_writer.create_or_load()
+    record_deduplicator = RecordDeduplicator(record_writer) if RECORD_DEDUP_ENABLED else None
+    job_journal = JobJournal() if JOB_JOURNAL_ENABLED else None
+    
+    watcher = ScreenshotWatcher(image_processor, backend=watch_backend)
+    # 被 kill / systemctl stop 时与 Ctrl+C 一样正常退出，写出剩余记录
+    signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+    batches = watcher.watch()
+    try:
+        for ready_files in batches:
+            if job_journal:
+                # 空闲时同样检查退避时间已到的失败截图；--retry-failed 只作用于启动时的第一批
+                ready_files += [path for path in job_journal.due_retries() if path not in ready_files]
+                if not ready_files:
+                    continue
+                new_files = job_journal.plan(ready_files, record_writer, retry_failed)
+                retry_failed = False
+            else:
+                new_files = record_writer.filter_new(ready_files)
+            if not new_files:
+                continue
+            logging.info(f"发现 {len(new_files)} 个新截图")
+            try:
+                if use_pipeline:
+                    pipeline = ScreenshotPipeline(image_processor, ai_analyzer, record_writer, image_index=image_index,
+                                                  record_deduplicator=record_deduplicator, job_journal=job_journal)
+                    pipeline.run(new_files)
+                else:
+                    process_screenshot_files(new_files, image_processor, ai_analyzer, record_writer, image_index,
+                                             record_deduplicator, job_journal)
+            except Exception as e:
+                # 常驻运行时单批的意外错误不应导致退出，已写入缓冲的记录照常写盘
+                logging.exception(f"处理新截图时出错: {e}")
+            
+            # 每批处理完立即写盘，新记录几秒内即可在输出文件中看到
+            checkpoint(record_writer, image_index, job_journal)
+    except KeyboardInterrupt:
+        logging.info("收到中断信号，停止监视")
+    finally:
+        watcher.stop()
+        batches.close()
+        finish_run(record_writer, image_index, job_journal)
+        log_cache_stats(ai_analyzer)
+        ai_analyzer.close()
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="Runflow AI Tracker")
+    parser.add_argument("--pipeline", action="store_true", help="使用并发流水线模式处理截图")
+    parser.add_argument("--storage", choices=STORAGE_BACKENDS, default=STORAGE_BACKEND,
+                        help=f"记录存储后端（默认 {STORAGE_BACKEND}）")
+    parser.add_argument("--export-excel", nargs="?", const=EXPORT_EXCEL_FILE, default=None, metavar="PATH",
+                        help=f"处理完成后把存储中的全部记录导出到 PATH（默认 {EXPORT_EXCEL_FILE}，不会覆盖非导出生成的文件）")
+    parser.add_argument("--watch", action="store_true",
+                        help="常驻运行，监视截图目录并增量处理新截图（可与 --pipeline 同时使用，Ctrl+C 退出）")
+    parser.add_argument("--watch-backend", choices=WATCH_BACKENDS, default=WATCH_BACKEND,
+                        help=f"监视方式（默认 {WATCH_BACKEND}）：auto 安装了 watchdog 时使用系统文件通知，否则轮询")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="忽略退避时间和最大尝试次数，立即重试任务日志中所有失败的截图")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help="在该端口提供 Prometheus /metrics 接口（适合与 --watch 同时使用）")
+    parser.add_argument("--mode", choices=ANALYSIS_MODES, default=ANALYSIS_MODE,
+                        help=f"分析方式（默认 {ANALYSIS_MODE}）：two_stage 先OCR再由对话模型提取，vision 由多模态模型单次请求直接提取")
+    parser.add_argument("--chat-stream", action=argparse.BooleanOptionalAction, default=CHAT_STREAM_ENABLED,
+                        help="单张截图的结构化提取使用流式响应，收到完整JSON后立即结束（--no-chat-stream 关闭）")
+    return parser.parse_args()
 
 def main():
     """主函数"""
+    args = parse_args()
     logging.info("Runflow AI Tracker 启动")
     
     # 创建必要目录
     setup_directories()
+    if args.metrics_port:
+        get_metrics().serve(args.metrics_port)
     
     # 处理跑步截图
-    process_running_screenshots()
+    record_writer = create_writer(args.storage)
+    analyzer_options = {'chat_stream': args.chat_stream, 'analysis_mode': args.mode}
+    if args.watch:
+        watch_running_screenshots(record_writer, use_pipeline=args.pipeline, watch_backend=args.watch_backend,
+                                  retry_failed=args.retry_failed, analyzer_options=analyzer_options)
+    elif args.pipeline:
+        process_running_screenshots_pipelined(record_writer, retry_failed=args.retry_failed,
+                                              analyzer_options=analyzer_options)
+    else:
+        process_running_screenshots(record_writer, retry_failed=args.retry_failed, analyzer_options=analyzer_options)
+    
+    # 按需导出Excel（excel后端本身就是Excel文件，无需导出）
+    if args.export_excel:
+        if args.storage == 'excel':
+            logging.info(f"当前存储后端即为Excel: {OUTPUT_FILE}")
+        else:
+            try:
+                export_to_excel(record_writer, args.export_excel)
+            except FileExistsError as e:
+                logging.error(f"导出Excel失败: {e}")
     
     logging.info("处理完成")
 
@@ -0,0 +1,372 @@
+import os
+import sys
+import json
+import time
+import logging
+import tempfile
+import threading
+import contextvars
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.insert(0, project_root)
+
+from config.settings import (
+    METRICS_ENABLED, METRICS_TRACE_FILE, METRICS_PROMETHEUS_FILE, METRICS_BUCKETS, METRICS_MAX_SAMPLES,
+    METRICS_TRACE_MAX_SIZE_MB, METRICS_TRACE_BACKUPS
+)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# 当前正在处理的截图文件名，阶段记录未显式给出 image 时使用（线程和协程各自独立）
+_current_image = contextvars.ContextVar('current_image', default=None)
+
+
+@contextmanager
+def image_scope(image_file):
+    """在此范围内记录的阶段都归属于该截图"""
+    token = _current_image.set(image_file)
+    try:
+        yield
+    finally:
+        _current_image.reset(token)
+
+
+def percentile(sorted_values, q):
+    """最近秩法计算分位数，sorted_values 需已排序"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(q * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+class Span:
+    """一次阶段记录，可在执行过程中用 set 补充属性（载荷大小、HTTP状态码等）"""
+
+    __slots__ = ('name', 'image', 'attrs', 'error')
+
+    def __init__(self, name, image, attrs):
+        self.name = name
+        self.image = image
+        self.attrs = attrs
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+class _StageStats:
+    """单个阶段的累计统计：直方图分桶计数为全量累计，分位数按最近的样本计算"""
+
+    __slots__ = ('count', 'total', 'bucket_counts', 'samples', 'errors', 'bytes', 'retries', 'statuses',
+                 'cache_hits', 'cache_misses')
+
+    def __init__(self, buckets, max_samples):
+        self.count = 0
+        self.total = 0.0
+        self.bucket_counts = [0] * len(buckets)
+        self.samples = deque(maxlen=max_samples)
+        self.errors = 0
+        self.bytes = 0
+        self.retries = 0
+        self.statuses = defaultdict(int)
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+class Metrics:
+    """
+    各阶段耗时与请求指标
+
+    每次阶段记录（span）追加一行到 JSONL 追踪文件，同时按阶段累计耗时直方图、载荷字节数、
+    HTTP状态码、重试次数和缓存命中，可输出为 Prometheus 文本格式并汇总 p50/p95/p99。
+    追踪文件超过 trace_max_size_mb 时轮转，保留 trace_backups 个旧文件。
+    同一实例可在多个线程间共享。
+    """
+
+    def __init__(self, enabled=METRICS_ENABLED, trace_file=METRICS_TRACE_FILE,
+                 prometheus_file=METRICS_PROMETHEUS_FILE, buckets=METRICS_BUCKETS,
+                 max_samples=METRICS_MAX_SAMPLES, trace_max_size_mb=METRICS_TRACE_MAX_SIZE_MB,
+                 trace_backups=METRICS_TRACE_BACKUPS):
+        self.enabled = enabled
+        self.trace_file = trace_file
+        self.trace_max_bytes = trace_max_size_mb * 1024 * 1024 if trace_max_size_mb else None
+        self.trace_backups = max(0, trace_backups)
+        self.prometheus_file = prometheus_file
+        self.buckets = tuple(sorted(buckets))
+        self.max_samples = max_samples
+        # 区分同一追踪文件中的多次运行
+        self.run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self._stages = {}
+        self._cache_stats = {}
+        self._trace_buffer = []
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def span(self, name, image=None, **attrs):
+        """
+        记录一个阶段的耗时
+
+        用法:
+            with metrics.span('ocr_request', bytes=len(body)) as span:
+                ...
+                span.set(status=response.status_code)
+        """
+        span = Span(name, image, attrs)
+        if not self.enabled:
+            yield span
+            return
+        started_at = time.time()
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = span.error or type(e).__name__
+            raise
+        finally:
+            self.record(name, time.perf_counter() - started, image=span.image, started_at=started_at,
+                        error=span.error, **span.attrs)
+
+    def record(self, name, duration, image=None, started_at=None, error=None, **attrs):
+        """
+        直接记录一个已知耗时（秒）的阶段，用于在其他进程中执行的阶段（如预处理）
+
+        识别的属性：bytes（载荷字节数）、status（HTTP状态码）、retries（重试次数）、
+        cache（hit / miss）
+        """
+        if not self.enabled:
+            return
+        image = image or _current_image.get()
+        with self._lock:
+            stats = self._stages.get(name)
+            if stats is None:
+                stats = self._stages[name] = _StageStats(self.buckets, self.max_samples)
+            stats.count += 1
+            stats.total += duration
+            stats.samples.append(duration)
+            for index, bound in enumerate(self.buckets):
+                if duration <= bound:
+                    stats.bucket_counts[index] += 1
+            if error:
+                stats.errors += 1
+            stats.bytes += attrs.get('bytes') or 0
+            stats.retries += attrs.get('retries') or 0
+            if attrs.get('status') is not None:
+                stats.statuses[attrs['status']] += 1
+            if attrs.get('cache') == 'hit':
+                stats.cache_hits += 1
+            elif attrs.get('cache') == 'miss':
+                stats.cache_misses += 1
+
+            if self.trace_file:
+                event = {
+                    'run': self.run_id,
+                    'ts': round(started_at if started_at is not None else time.time() - duration, 6),
+                    'span': name,
+                    'image': image,
+                    'duration_ms': round(duration * 1000, 3),
+                }
+                if error:
+                    event['error'] = error
+                event.update(attrs)
+                self._trace_buffer.append(json.dumps(event, ensure_ascii=False, default=str))
+                if len(self._trace_buffer) >= 200:
+                    self._flush_trace()
+
+    def set_cache_stats(self, cache_stats):
+        """记录各结果缓存的命中统计（AIAnalyzer.cache_stats() 的返回值），导出时一并输出"""
+        with self._lock:
+            self._cache_stats = dict(cache_stats)
+
+    def _flush_trace(self):
+        if not self._trace_buffer:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.trace_file)), exist_ok=True)
+            self._rotate_trace()
+            with open(self.trace_file, 'a', encoding='utf-8') as trace_file:
+                trace_file.write('\n'.join(self._trace_buffer) + '\n')
+        except OSError as e:
+            logging.error(f"写入追踪文件失败: {e}")
+        self._trace_buffer = []
+
+    def _rotate_trace(self):
+        """追踪文件超过大小上限时依次改名为 .1、.2 ...，超出保留个数的最旧文件被丢弃"""
+        if not self.trace_max_bytes or not os.path.exists(self.trace_file) \
+                or os.path.getsize(self.trace_file) < self.trace_max_bytes:
+            return
+        for index in range(self.trace_backups - 1, 0, -1):
+            backup = f"{self.trace_file}.{index}"
+            if os.path.exists(backup):
+                os.replace(backup, f"{self.trace_file}.{index + 1}")
+        if self.trace_backups:
+            os.replace(self.trace_file, f"{self.trace_file}.1")
+        else:
+            os.remove(self.trace_file)
+        logging.info(f"追踪文件超过 {self.trace_max_bytes // (1024 * 1024)} MB，已轮转: {self.trace_file}")
+
+    def summary(self):
+        """
+        按阶段汇总
+
+        Returns:
+            dict: 阶段 -> {count, errors, total_s, mean_ms, p50_ms, p95_ms, p99_ms, bytes, retries, statuses}
+        """
+        result = {}
+        with self._lock:
+            for name, stats in self._stages.items():
+                samples = sorted(stats.samples)
+                item = {
+                    'count': stats.count,
+                    'errors': stats.errors,
+                    'total_s': round(stats.total, 3),
+                    'mean_ms': round(stats.total / stats.count * 1000, 2),
+                }
+                for q in QUANTILES:
+                    item[f'p{int(q * 100)}_ms'] = round(percentile(samples, q) * 1000, 2)
+                if stats.bytes:
+                    item['bytes'] = stats.bytes
+                if stats.retries:
+                    item['retries'] = stats.retries
+                if stats.statuses:
+                    item['statuses'] = dict(stats.statuses)
+                if stats.cache_hits or stats.cache_misses:
+                    item['cache_hits'] = stats.cache_hits
+                    item['cache_misses'] = stats.cache_misses
+                result[name] = item
+        return result
+
+    def render_prometheus(self):
+        """生成 Prometheus 文本格式"""
+        with self._lock:
+            return self._render_prometheus()
+
+    def _render_prometheus(self):
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        stages = sorted(self._stages.items())
+        quantiles = {name: sorted(stats.samples) for name, stats in stages}
+        cache_stats = self._cache_stats
+
+        family("runlog_stage_duration_seconds", "histogram", "各阶段耗时（秒）")
+        for name, stats in stages:
+            for bound, count in zip(self.buckets, stats.bucket_counts):
+                lines.append(f'runlog_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+            lines.append(f'runlog_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {stats.count}')
+            lines.append(f'runlog_stage_duration_seconds_sum{{stage="{name}"}} {stats.total:.6f}')
+            lines.append(f'runlog_stage_duration_seconds_count{{stage="{name}"}} {stats.count}')
+
+        family("runlog_stage_duration_quantile_seconds", "gauge", "各阶段最近样本的耗时分位数（秒）")
+        for name, _ in stages:
+            for q in QUANTILES:
+                lines.append(f'runlog_stage_duration_quantile_seconds{{stage="{name}",quantile="{q}"}} '
+                             f'{percentile(quantiles[name], q):.6f}')
+
+        family("runlog_stage_errors_total", "counter", "各阶段出错次数")
+        for name, stats in stages:
+            lines.append(f'runlog_stage_errors_total{{stage="{name}"}} {stats.errors}')
+
+        family("runlog_stage_bytes_total", "counter", "各阶段处理的载荷字节数")
+        for name, stats in stages:
+            if stats.bytes:
+                lines.append(f'runlog_stage_bytes_total{{stage="{name}"}} {stats.bytes}')
+
+        family("runlog_http_responses_total", "counter", "API响应数（按HTTP状态码）")
+        for name, stats in stages:
+            for status, count in sorted(stats.statuses.items()):
+                lines.append(f'runlog_http_responses_total{{stage="{name}",status="{status}"}} {count}')
+
+        family("runlog_http_retries_total", "counter", "API请求重试次数（限流退避与连接/5xx重试）")
+        for name, stats in stages:
+            if stats.statuses or stats.retries:
+                lines.append(f'runlog_http_retries_total{{stage="{name}"}} {stats.retries}')
+
+        family("runlog_cache_requests_total", "counter", "结果缓存查询次数")
+        for cache, stats in sorted(cache_stats.items()):
+            lines.append(f'runlog_cache_requests_total{{cache="{cache}",result="hit"}} {stats["hits"]}')
+            lines.append(f'runlog_cache_requests_total{{cache="{cache}",result="miss"}} {stats["misses"]}')
+
+        family("runlog_stage_cache_total", "counter", "各阶段记录的缓存命中情况")
+        for name, stats in stages:
+            if stats.cache_hits or stats.cache_misses:
+                lines.append(f'runlog_stage_cache_total{{stage="{name}",result="hit"}} {stats.cache_hits}')
+                lines.append(f'runlog_stage_cache_total{{stage="{name}",result="miss"}} {stats.cache_misses}')
+        return '\n'.join(lines) + '\n'
+
+    def flush(self):
+        """写出追踪缓冲，并原子更新 Prometheus 文件"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self.trace_file:
+                self._flush_trace()
+        if not self.prometheus_file:
+            return
+        directory = os.path.dirname(os.path.abspath(self.prometheus_file))
+        os.makedirs(directory, exist_ok=True)
+        # textfile 采集器可能随时读取，先写临时文件再重命名
+        fd, temp_path = tempfile.mkstemp(suffix='.prom', prefix='.tmp_', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as prometheus_file:
+                prometheus_file.write(self.render_prometheus())
+            os.replace(temp_path, self.prometheus_file)
+        except OSError as e:
+            logging.error(f"写入指标文件失败: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def log_summary(self):
+        """在日志中输出各阶段耗时分位数"""
+        for name, item in self.summary().items():
+            extra = ''
+            if 'bytes' in item:
+                extra += f", 载荷 {item['bytes'] / item['count'] / 1024:.1f} KB/次"
+            if 'statuses' in item:
+                extra += f", 状态码 {item['statuses']}, 重试 {item.get('retries', 0)} 次"
+            logging.info(f"阶段 {name}: {item['count']} 次, 出错 {item['errors']} 次, 合计 {item['total_s']} s, "
+                         f"p50 {item['p50_ms']} ms, p95 {item['p95_ms']} ms, p99 {item['p99_ms']} ms{extra}")
+
+    def serve(self, port, host='0.0.0.0'):
+        """在后台线程中提供 Prometheus /metrics 接口"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="指标接口", daemon=True).start()
+        logging.info(f"指标接口已启动: http://{host}:{port}/metrics")
+        return server
+
+
+_shared_metrics = None
+_shared_lock = threading.Lock()
+
+
+def get_metrics():
+    """获取进程内共享的指标记录器"""
+    global _shared_metrics
+    with _shared_lock:
+        if _shared_metrics is None:
+            _shared_metrics = Metrics()
+        return _shared_metrics
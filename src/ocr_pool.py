@@ -0,0 +1,263 @@
+import os
+import sys
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.insert(0, project_root)
+
+from config.settings import (
+    OCR_POOL_WORKERS, OCR_POOL_THREADS_PER_WORKER, OCR_POOL_STARTUP_TIMEOUT, OCR_POOL_TASK_TIMEOUT,
+    OCR_POOL_HEALTH_INTERVAL, PADDLE_OCR_BATCH_SIZE
+)
+
+# 推理库读取的线程数环境变量，需在导入 paddle 之前设置
+_THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'FLAGS_cpu_math_library_num_threads')
+
+
+def _worker_main(conn, threads):
+    """OCR工作进程：加载模型后循环处理主进程发来的任务"""
+    for name in _THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    from src.paddle_ocr import PaddleOCRWrapper
+    from src.image_processor import ProcessedImage
+
+    def to_input(image):
+        return image.to_array() if isinstance(image, ProcessedImage) else image
+
+    wrapper = PaddleOCRWrapper(cpu_threads=threads)
+    conn.send(('ready', wrapper.ocr_engine is not None))
+    if wrapper.ocr_engine is None:
+        return
+
+    while True:
+        try:
+            kind, payload = conn.recv()
+        except (EOFError, OSError):
+            break
+        if kind == 'stop':
+            break
+        if kind == 'ping':
+            conn.send(('pong', None))
+        elif kind == 'recognize':
+            conn.send(('result', wrapper.recognize_text(to_input(payload))))
+        elif kind == 'recognize_many':
+            conn.send(('result', list(wrapper.recognize_many((to_input(image) for image in payload), len(payload)))))
+
+
+class WorkerCrashed(Exception):
+    """OCR工作进程异常退出或任务超时"""
+
+
+class _Worker:
+    """单个OCR工作进程及其通信管道"""
+
+    def __init__(self, context, index, threads):
+        self.context = context
+        self.index = index
+        self.threads = threads
+        self.process = None
+        self.conn = None
+        self.restarts = -1
+
+    def start(self):
+        parent_conn, child_conn = self.context.Pipe()
+        self.process = self.context.Process(
+            target=_worker_main, args=(child_conn, self.threads), name=f"PaddleOCR-{self.index}", daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.restarts += 1
+
+    def wait_ready(self, timeout):
+        """等待模型加载完成，返回是否可用"""
+        try:
+            kind, ok = self._receive(timeout)
+        except WorkerCrashed as e:
+            logging.error(f"OCR工作进程 {self.index} 启动失败: {e}")
+            return False
+        if kind != 'ready' or not ok:
+            logging.error(f"OCR工作进程 {self.index} 初始化PaddleOCR失败")
+            return False
+        return True
+
+    def _receive(self, timeout):
+        """等待进程回复，期间进程退出或超时时抛出 WorkerCrashed"""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                if self.conn.poll(min(1.0, max(0.0, deadline - time.monotonic()))):
+                    return self.conn.recv()
+            except (EOFError, OSError) as e:
+                raise WorkerCrashed(f"通信中断: {e}")
+            if not self.process.is_alive():
+                raise WorkerCrashed(f"进程已退出，退出码 {self.process.exitcode}")
+            if time.monotonic() >= deadline:
+                raise WorkerCrashed(f"超过 {timeout} 秒未响应")
+
+    def call(self, kind, payload, timeout):
+        try:
+            self.conn.send((kind, payload))
+        except (BrokenPipeError, OSError) as e:
+            raise WorkerCrashed(f"通信中断: {e}")
+        return self._receive(timeout)[1]
+
+    def alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def stop(self, timeout=5):
+        if self.process is None:
+            return
+        try:
+            self.conn.send(('stop', None))
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class PaddleOCRPool:
+    """
+    本地PaddleOCR多进程池
+
+    每个进程启动时加载一次模型并常驻，限定推理线程数避免多进程间CPU超额订阅。
+    接口与 PaddleOCRWrapper 一致（recognize_text / recognize_many / ocr_engine），可以被多个线程同时调用，
+    调用方线程在空闲进程上执行任务；进程崩溃或任务超时时自动重启进程并重试一次。
+    """
+
+    # 可被多个线程同时调用，流水线无需对OCR阶段加锁
+    thread_safe = True
+
+    def __init__(self, workers=OCR_POOL_WORKERS, threads_per_worker=OCR_POOL_THREADS_PER_WORKER,
+                 startup_timeout=OCR_POOL_STARTUP_TIMEOUT, task_timeout=OCR_POOL_TASK_TIMEOUT,
+                 health_interval=OCR_POOL_HEALTH_INTERVAL):
+        workers = max(1, workers)
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        self.startup_timeout = startup_timeout
+        self.task_timeout = task_timeout
+        # paddle 不支持 fork 后继续使用，统一以 spawn 方式启动
+        self._context = multiprocessing.get_context('spawn')
+        self._idle = queue.Queue()
+        self._workers = []
+        self._closed = threading.Event()
+
+        started = time.perf_counter()
+        candidates = [_Worker(self._context, index, self.threads_per_worker) for index in range(workers)]
+        # 并行启动，模型加载时间不随进程数累加
+        for worker in candidates:
+            worker.start()
+        for worker in candidates:
+            if worker.wait_ready(startup_timeout):
+                self._workers.append(worker)
+                self._idle.put(worker)
+            else:
+                worker.stop()
+        logging.info(f"PaddleOCR 进程池已启动 {len(self._workers)}/{workers} 个进程，"
+                     f"每进程 {self.threads_per_worker} 线程，耗时 {time.perf_counter() - started:.1f} 秒")
+
+        if self._workers and health_interval:
+            threading.Thread(target=self._health_loop, args=(health_interval,), name="OCR健康检查",
+                             daemon=True).start()
+
+    @property
+    def ocr_engine(self):
+        """有可用进程时为真，与 PaddleOCRWrapper.ocr_engine 的判断方式一致"""
+        return bool(self._workers) and not self._closed.is_set()
+
+    def _restart(self, worker):
+        """重启崩溃的进程，返回是否成功"""
+        worker.stop(timeout=1)
+        worker.start()
+        if worker.wait_ready(self.startup_timeout):
+            logging.warning(f"OCR工作进程 {worker.index} 已重启（累计 {worker.restarts} 次）")
+            return True
+        return False
+
+    def _run(self, kind, payload, failed_result):
+        """在一个空闲进程上执行任务，进程崩溃时重启并重试一次"""
+        if not self.ocr_engine:
+            logging.error("PaddleOCR 进程池不可用")
+            return failed_result
+        worker = self._idle.get()
+        try:
+            for attempt in range(2):
+                if not worker.alive() and not self._restart(worker):
+                    break
+                try:
+                    return worker.call(kind, payload, self.task_timeout)
+                except WorkerCrashed as e:
+                    logging.error(f"OCR工作进程 {worker.index} 异常（第 {attempt + 1} 次）: {e}")
+                    worker.stop(timeout=1)
+            return failed_result
+        finally:
+            self._idle.put(worker)
+
+    def recognize_text(self, image):
+        """
+        识别单张图片中的文字
+
+        Args:
+            image: 图片文件路径、BGR 图像数组或 ProcessedImage
+        """
+        return self._run('recognize', image, None)
+
+    def recognize_many(self, images, batch_size=PADDLE_OCR_BATCH_SIZE):
+        """按批在空闲进程上识别，按输入顺序逐张返回结果"""
+        batch_size = max(1, batch_size)
+        batch = []
+        for image in images:
+            batch.append(image)
+            if len(batch) >= batch_size:
+                yield from self._run('recognize_many', batch, [None] * len(batch))
+                batch = []
+        if batch:
+            yield from self._run('recognize_many', batch, [None] * len(batch))
+
+    def health_check(self):
+        """
+        检查当前空闲的进程，无响应或已退出的进程会被重启
+
+        Returns:
+            dict: 进程序号 -> 是否健康（忙碌中的进程不检查）
+        """
+        status = {}
+        idle = []
+        while True:
+            try:
+                idle.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            for worker in idle:
+                try:
+                    worker.call('ping', None, timeout=10)
+                    status[worker.index] = True
+                except WorkerCrashed as e:
+                    logging.error(f"OCR工作进程 {worker.index} 健康检查失败: {e}")
+                    status[worker.index] = self._restart(worker)
+        finally:
+            for worker in idle:
+                self._idle.put(worker)
+        return status
+
+    def _health_loop(self, interval):
+        while not self._closed.wait(interval):
+            self.health_check()
+
+    def close(self):
+        """停止所有进程"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        for worker in self._workers:
+            worker.stop()
+        logging.info("PaddleOCR 进程池已关闭")
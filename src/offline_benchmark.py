@@ -0,0 +1,462 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.insert(0, project_root)
+
+from config.settings import SCREENSHOTS_DIR, SQLITE_OUTPUT_FILE, METRICS_TRACE_FILE, OCR_MODEL
+from src.metrics import QUANTILES, percentile
+
+# 参与对比的运行方式：名称 -> main.py 的额外参数
+MODES = {
+    'sequential': [],
+    'sequential_no_stream': ['--no-chat-stream'],
+    'pipeline': ['--pipeline'],
+    'vision': ['--mode', 'vision'],
+    'pipeline_vision': ['--pipeline', '--mode', 'vision'],
+}
+
+# 合成截图中使用的App名称（与本地规则的版式模板对应）
+APP_NAMES = ('Keep', 'Nike Run Club', 'Garmin Connect', 'Codoon', 'Joyrun')
+
+
+def random_run(rng):
+    """生成一条随机但自洽的跑步记录"""
+    distance = round(rng.uniform(2.0, 25.0), 2)
+    pace_seconds = rng.randint(270, 420)
+    total = int(distance * pace_seconds)
+    return {
+        'date': f"{rng.randint(2019, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        'distance_km': distance,
+        'duration': f"{total // 3600:02d}:{total % 3600 // 60:02d}:{total % 60:02d}",
+        'pace': f"{pace_seconds // 60:02d}:{pace_seconds % 60:02d}/km",
+        'calories': int(distance * rng.uniform(55, 75)),
+    }
+
+
+def ocr_text(run, rng, clean=True):
+    """
+    模拟OCR识别结果
+
+    clean 为 True 时字段标签齐全，本地规则即可提取；否则打乱、缺少标签，需要调用对话模型
+    """
+    minutes, seconds = run['pace'][:-3].split(':')
+    if clean:
+        return (f"{rng.choice(APP_NAMES)}\n{run['date']} 08:{rng.randint(0, 59):02d}\n"
+                f"距离 {run['distance_km']} 公里\n用时 {run['duration']}\n"
+                f"配速 {int(minutes)}'{seconds}\"\n消耗 {run['calories']} 千卡")
+    return (f"{run['distance_km']}\n{run['duration']}\n{int(minutes)} {seconds}\n"
+            f"{run['calories']}\n{run['date'].replace('-', ' ')}\n户外跑 完成")
+
+
+class MockSiliconFlowServer:
+    """
+    本地模拟的 /v1/chat/completions 接口
+
+    OCR模型的请求返回模拟的识别文字；其余（对话模型、单阶段的多模态模型）按提取请求处理，返回随机的
+    跑步记录JSON（批量提示词中的每个 [图片ID] 各返回一条）。可注入延迟、429限流和5xx错误，不消耗API额度。
+    提取请求可模拟推理模型的思考内容（reasoning_content）和JSON之后的多余说明，按 token_delay
+    逐字生成；请求中 stream 为 true 时以SSE分块返回，客户端提前断开后停止生成。
+    """
+
+    def __init__(self, latency=0.3, jitter=0.1, rate_429=0.0, error_rate=0.0, rule_hit_rate=0.5, seed=0,
+                 reasoning_chars=0, trailing_chars=0, token_delay=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.error_rate = error_rate
+        self.rule_hit_rate = rule_hit_rate
+        self.reasoning_chars = reasoning_chars
+        self.trailing_chars = trailing_chars
+        self.token_delay = token_delay
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        # 模型 -> {状态码: 次数}
+        self.stats = defaultdict(lambda: defaultdict(int))
+        # 流式响应被客户端提前断开的次数
+        self.disconnects = 0
+        self._server = None
+
+    def _draw(self):
+        """在锁内抽取本次请求的随机数，保证多线程下结果可复现"""
+        with self._lock:
+            return self._rng.random(), self._rng.random(), self._rng.uniform(-1, 1), random.Random(self._rng.random())
+
+    def handle(self, payload):
+        """
+        生成模拟响应
+
+        Returns:
+            tuple: (HTTP状态码, 响应头, 响应JSON, 首字节前的模拟延迟秒数)
+        """
+        model = payload.get('model')
+        fault, hit, jitter, rng = self._draw()
+        delay = max(0.0, self.latency + jitter * self.jitter)
+        if fault < self.rate_429:
+            status, headers, body = 429, {'Retry-After': '1'}, {'error': {'message': 'Rate limit exceeded'}}
+        elif fault < self.rate_429 + self.error_rate:
+            status, headers, body = 500, {}, {'error': {'message': 'Internal server error'}}
+        else:
+            messages = payload.get('messages') or [{}]
+            content = messages[-1].get('content')
+            if isinstance(content, list):
+                content = ''.join(part.get('text', '') for part in content if isinstance(part, dict))
+            message = {'role': 'assistant'}
+            if model == OCR_MODEL:
+                text = ocr_text(random_run(rng), rng, clean=hit < self.rule_hit_rate)
+            else:
+                image_ids = re.findall(r'^\[([^\]\n]+)\]', content or '', re.MULTILINE)
+                if image_ids:
+                    text = json.dumps({'results': [dict(random_run(rng), image_id=image_id) for image_id in image_ids]})
+                else:
+                    text = json.dumps(random_run(rng), indent=2)
+                if self.reasoning_chars:
+                    message['reasoning_content'] = ('先找出日期、距离和用时，再核对配速。' * self.reasoning_chars)[:self.reasoning_chars]
+                if self.trailing_chars:
+                    text += '\n\n' + ('以上字段均取自OCR文字，缺失的字段为null。' * self.trailing_chars)[:self.trailing_chars]
+            message['content'] = text
+            status, headers = 200, {}
+            generated = len(text) + len(message.get('reasoning_content', ''))
+            body = {
+                'model': model,
+                'choices': [{'index': 0, 'message': message, 'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': len(json.dumps(payload)) // 4, 'completion_tokens': generated,
+                          'total_tokens': len(json.dumps(payload)) // 4 + generated},
+            }
+        with self._lock:
+            self.stats[model][status] += 1
+        return status, headers, body, delay
+
+    def stream_events(self, body, piece_size=8):
+        """把完整响应拆分为SSE增量事件，返回 [(事件数据, 生成该段的模拟耗时秒数), ...]"""
+        message = body['choices'][0]['message']
+        events = []
+        for field in ('reasoning_content', 'content'):
+            text = message.get(field) or ''
+            for start in range(0, len(text), piece_size):
+                piece = text[start:start + piece_size]
+                chunk = {'model': body['model'], 'choices': [{'index': 0, 'delta': {field: piece}}]}
+                events.append((json.dumps(chunk, ensure_ascii=False), len(piece) * self.token_delay))
+        done = {'model': body['model'], 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+                'usage': body['usage']}
+        events.append((json.dumps(done, ensure_ascii=False), 0.0))
+        events.append(('[DONE]', 0.0))
+        return events
+
+    def start(self, host='127.0.0.1', port=0):
+        """在后台线程中启动服务，返回接口地址"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                if not self.path.startswith('/v1/chat/completions'):
+                    self.send_error(404)
+                    return
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                status, headers, body, delay = mock.handle(payload)
+                time.sleep(delay)
+                if status == 200 and payload.get('stream'):
+                    self.send_stream(body)
+                    return
+                if status == 200:
+                    # 非流式响应在全部内容生成后才返回
+                    message = body['choices'][0]['message']
+                    time.sleep(mock.token_delay * (len(message['content']) + len(message.get('reasoning_content', ''))))
+                body = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def send_stream(self, body):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                try:
+                    for data, generation_time in mock.stream_events(body):
+                        time.sleep(generation_time)
+                        event = f"data: {data}\n\n".encode('utf-8')
+                        self.wfile.write(f"{len(event):X}\r\n".encode('ascii') + event + b"\r\n")
+                        self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端已拿到完整结果并断开，停止生成
+                    with mock._lock:
+                        mock.disconnects += 1
+                    self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+
+            def handle_error(self, request, client_address):
+                # 客户端断开空闲连接或拿到结果后提前断开属于正常情况
+                if not isinstance(sys.exc_info()[1], ConnectionError):
+                    super().handle_error(request, client_address)
+
+        self._server = Server((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="模拟API", daemon=True).start()
+        return f"http://{host}:{self._server.server_address[1]}/v1/chat/completions"
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def generate_screenshots(directory, count, seed=0, size=(1080, 2340)):
+    """
+    用 Pillow 生成合成的跑步App截图（PNG）
+
+    每张截图的配色、路线和数字各不相同，不会被内容去重当作重复截图。
+
+    Returns:
+        list: 生成的截图路径
+    """
+    from PIL import Image, ImageDraw
+
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    width, height = size
+    paths = []
+    for index in range(count):
+        run = random_run(rng)
+        background = tuple(rng.randint(200, 255) for _ in range(3))
+        accent = tuple(rng.randint(0, 160) for _ in range(3))
+        image = Image.new('RGB', size, background)
+        draw = ImageDraw.Draw(image)
+        # 状态栏和标题
+        draw.rectangle((0, 0, width, 90), fill=accent)
+        draw.text((40, 30), f"{rng.choice(APP_NAMES)}  {run['date']}", fill='white')
+        # 地图区域：随机路线
+        map_bottom = height // 2
+        draw.rectangle((0, 90, width, map_bottom), fill=tuple(max(0, c - 40) for c in background))
+        point = (rng.randint(100, width - 100), rng.randint(200, map_bottom - 100))
+        for _ in range(rng.randint(20, 40)):
+            nxt = (min(width - 40, max(40, point[0] + rng.randint(-160, 160))),
+                   min(map_bottom - 40, max(130, point[1] + rng.randint(-120, 120))))
+            draw.line((point, nxt), fill=accent, width=12)
+            point = nxt
+        # 数据区域
+        lines = [
+            ('Distance', f"{run['distance_km']} km"),
+            ('Time', run['duration']),
+            ('Avg Pace', run['pace']),
+            ('Calories', f"{run['calories']} kcal"),
+        ]
+        for row, (label, value) in enumerate(lines):
+            top = map_bottom + 80 + row * 220
+            draw.rectangle((40, top, width - 40, top + 180), outline=accent, width=4)
+            draw.text((80, top + 40), label, fill=accent)
+            draw.text((80, top + 100), value, fill='black')
+        path = os.path.join(directory, f"bench_{index:05d}.png")
+        image.save(path)
+        paths.append(path)
+    return paths
+
+
+def summarize_trace(trace_file):
+    """
+    按阶段汇总追踪文件中的耗时
+
+    Returns:
+        dict: 阶段 -> {count, errors, p50_ms, p95_ms, p99_ms, mean_ms}
+    """
+    durations = defaultdict(list)
+    errors = defaultdict(int)
+    if not os.path.exists(trace_file):
+        return {}
+    with open(trace_file, encoding='utf-8') as trace:
+        for line in trace:
+            event = json.loads(line)
+            durations[event['span']].append(event['duration_ms'])
+            if event.get('error'):
+                errors[event['span']] += 1
+    stages = {}
+    for name, values in sorted(durations.items()):
+        values.sort()
+        stages[name] = {
+            'count': len(values),
+            'errors': errors[name],
+            'mean_ms': round(sum(values) / len(values), 2),
+        }
+        for q in QUANTILES:
+            stages[name][f'p{int(q * 100)}_ms'] = round(percentile(values, q), 2)
+    return stages
+
+
+def count_records(db_path):
+    if not os.path.exists(db_path):
+        return 0
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+
+def run_mode(name, extra_args, screenshots, api_url, timeout):
+    """
+    在临时目录中运行一次 main.py（SQLite存储，缓存和任务日志均为空），返回测量结果
+    """
+    work_dir = tempfile.mkdtemp(prefix=f'offline_benchmark_{name}_')
+    try:
+        target_dir = os.path.join(work_dir, SCREENSHOTS_DIR)
+        os.makedirs(target_dir)
+        for path in screenshots:
+            os.symlink(os.path.abspath(path), os.path.join(target_dir, os.path.basename(path)))
+        env = dict(os.environ, SILICONFLOW_API_URL=api_url, SILICONFLOW_API_KEY='offline-benchmark')
+        command = [sys.executable, os.path.join(current_dir, 'main.py'), '--storage', 'sqlite'] + extra_args
+        log_path = os.path.join(work_dir, 'run.log')
+
+        started = time.perf_counter()
+        with open(log_path, 'w', encoding='utf-8') as log_file:
+            process = subprocess.Popen(command, cwd=work_dir, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+            # wait4 返回子进程（含其已回收的子进程）的资源占用
+            deadline = started + timeout
+            while True:
+                pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+                if pid:
+                    break
+                if time.perf_counter() > deadline:
+                    process.kill()
+                    pid, status, usage = os.wait4(process.pid, 0)
+                    break
+                time.sleep(0.05)
+            process.returncode = os.waitstatus_to_exitcode(status)
+        elapsed = time.perf_counter() - started
+
+        records = count_records(os.path.join(work_dir, SQLITE_OUTPUT_FILE))
+        result = {
+            'args': extra_args,
+            'exit_code': process.returncode,
+            'images': len(screenshots),
+            'records': records,
+            'wall_s': round(elapsed, 3),
+            'images_per_s': round(len(screenshots) / elapsed, 3),
+            'cpu_s': round(usage.ru_utime + usage.ru_stime, 3),
+            # Linux 上 ru_maxrss 单位为KB
+            'peak_rss_mb': round(usage.ru_maxrss / 1024, 1),
+            'stages': summarize_trace(os.path.join(work_dir, METRICS_TRACE_FILE)),
+        }
+        if process.returncode != 0:
+            with open(log_path, encoding='utf-8', errors='replace') as log_file:
+                result['log_tail'] = log_file.read()[-2000:]
+        return result
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def compare(results, baseline):
+    """与基准结果对比吞吐量和各阶段 p50"""
+    print("\n与基准结果对比:")
+    for name, result in results['modes'].items():
+        base = baseline.get('modes', {}).get(name)
+        if not base:
+            print(f"  {name}: 基准结果中没有该模式")
+            continue
+        change = (result['images_per_s'] / base['images_per_s'] - 1) if base['images_per_s'] else 0
+        print(f"  {name}: {base['images_per_s']} -> {result['images_per_s']} 张/秒 ({change:+.1%}), "
+              f"峰值内存 {base['peak_rss_mb']} -> {result['peak_rss_mb']} MB")
+        for stage, item in result['stages'].items():
+            base_item = base.get('stages', {}).get(stage)
+            if base_item:
+                print(f"    {stage:<14} p50 {base_item['p50_ms']:>9} -> {item['p50_ms']:>9} ms, "
+                      f"p95 {base_item['p95_ms']:>9} -> {item['p95_ms']:>9} ms")
+
+
+def main():
+    """用本地模拟API和合成截图测量各运行方式的吞吐量、阶段耗时和内存"""
+    parser = argparse.ArgumentParser(description="离线性能测试工具（不调用真实API）")
+    parser.add_argument("--images", type=int, default=50, help="合成截图数量")
+    parser.add_argument("--modes", nargs='+', choices=list(MODES), default=list(MODES), help="参与测试的运行方式")
+    parser.add_argument("--latency", type=float, default=0.3, help="模拟API的平均响应延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.1, help="响应延迟的随机波动（秒）")
+    parser.add_argument("--rate-429", type=float, default=0.05, help="返回429限流的请求比例")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="返回500错误的请求比例")
+    parser.add_argument("--rule-hit-rate", type=float, default=0.5,
+                        help="OCR结果可由本地规则直接提取的比例，其余需要调用对话模型")
+    parser.add_argument("--reasoning-chars", type=int, default=300,
+                        help="每个提取请求模拟的思考内容字数（reasoning_content）")
+    parser.add_argument("--trailing-chars", type=int, default=150,
+                        help="每个提取请求在JSON之后模拟的多余说明字数，流式提取可提前断开跳过")
+    parser.add_argument("--token-delay", type=float, default=0.002, help="模拟API每生成一个字的耗时（秒）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子，相同参数下生成相同的截图和响应")
+    parser.add_argument("--timeout", type=float, default=1800, help="单个运行方式的超时时间（秒）")
+    parser.add_argument("--output", help="结果JSON文件路径，不提供时只输出到终端")
+    parser.add_argument("--baseline", help="之前保存的结果JSON，用于对比")
+    args = parser.parse_args()
+
+    results = {
+        'python': sys.version.split()[0],
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'config': {key: getattr(args, key) for key in
+                   ('images', 'latency', 'jitter', 'rate_429', 'error_rate', 'rule_hit_rate',
+                    'reasoning_chars', 'trailing_chars', 'token_delay', 'seed')},
+        'modes': {},
+    }
+
+    image_dir = tempfile.mkdtemp(prefix='offline_benchmark_images_')
+    try:
+        print(f"正在生成 {args.images} 张合成截图 ...")
+        screenshots = generate_screenshots(image_dir, args.images, seed=args.seed)
+        for name in args.modes:
+            # 每种方式使用相同种子的新模拟服务，注入的错误序列一致
+            server = MockSiliconFlowServer(args.latency, args.jitter, args.rate_429, args.error_rate,
+                                           args.rule_hit_rate, seed=args.seed, reasoning_chars=args.reasoning_chars,
+                                           trailing_chars=args.trailing_chars, token_delay=args.token_delay)
+            api_url = server.start()
+            print(f"正在测试 {name} ...")
+            try:
+                result = run_mode(name, MODES[name], screenshots, api_url, args.timeout)
+            finally:
+                server.stop()
+            result['api_responses'] = {model: dict(statuses) for model, statuses in server.stats.items()}
+            result['stream_disconnects'] = server.disconnects
+            results['modes'][name] = result
+    finally:
+        shutil.rmtree(image_dir, ignore_errors=True)
+
+    print(f"\n{'运行方式':<12}{'张/秒':>10}{'耗时s':>10}{'CPU s':>10}{'峰值MB':>10}{'记录数':>8}")
+    for name, result in results['modes'].items():
+        print(f"{name:<16}{result['images_per_s']:>10}{result['wall_s']:>10}{result['cpu_s']:>10}"
+              f"{result['peak_rss_mb']:>10}{result['records']:>8}")
+        if result['exit_code'] != 0:
+            print(f"  运行失败（退出码 {result['exit_code']}）:\n{result.get('log_tail', '')}")
+        for stage, item in result['stages'].items():
+            print(f"  {stage:<14}{item['count']:>6} 次  p50 {item['p50_ms']:>9} ms  p95 {item['p95_ms']:>9} ms  "
+                  f"p99 {item['p99_ms']:>9} ms")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            compare(results, json.load(baseline_file))
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(results, output_file, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
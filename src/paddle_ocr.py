@@ -3,38 +3,44 @@ import logging
 import os
 import sys
 import argparse
+import importlib.util
 
 # 添加项目根目录到Python路径
 current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(current_dir)
 sys.path.insert(0, project_root)
 
-try:
-    from paddleocr import PaddleOCR
-    PADDLE_OCR_AVAILABLE = True
-except ImportError:
-    PADDLE_OCR_AVAILABLE = False
-    print("警告: 未安装 PaddleOCR，相关功能不可用")
-    print("请运行 'pip install paddlepaddle paddleocr' 安装")
+from config.settings import PADDLE_OCR_BATCH_SIZE, PADDLE_OCR_REC_BATCH_SIZE
+
+# 只检查是否已安装，paddleocr 导入需要数秒，推迟到创建引擎时
+PADDLE_OCR_AVAILABLE = importlib.util.find_spec("paddleocr") is not None
 
 class PaddleOCRWrapper:
-    def __init__(self):
+    def __init__(self, cpu_threads=None):
         """
         初始化 PaddleOCR 实例
+        
+        Args:
+            cpu_threads (int): CPU推理线程数，None 表示使用 PaddleOCR 默认值
         """
         if not PADDLE_OCR_AVAILABLE:
+            logging.warning("未安装 PaddleOCR，相关功能不可用，请运行 'pip install paddlepaddle paddleocr' 安装")
             self.ocr_engine = None
             return
             
         try:
+            from paddleocr import PaddleOCR
             # 在初始化前保存当前日志级别
             original_level = logging.root.level
+            options = {"cpu_threads": cpu_threads} if cpu_threads else {}
             # 初始化 PaddleOCR，使用文档优化参数
             self.ocr_engine = PaddleOCR(
                 use_doc_orientation_classify=False,
                 use_doc_unwarping=False,
                 use_textline_orientation=False,
-                lang="ch"
+                text_recognition_batch_size=PADDLE_OCR_REC_BATCH_SIZE,
+                lang="ch",
+                **options
             )
             # 恢复原来的日志级别
             logging.root.setLevel(original_level)
@@ -48,7 +54,7 @@ class PaddleOCRWrapper:
         使用 PaddleOCR 识别图片中的文字
         
         Args:
-            image_path (str): 图片文件路径 或 URL
+            image_path (str | numpy.ndarray): 图片文件路径、URL 或 BGR 图像数组
             
         Returns:
             str: 识别出的文字内容，如果失败则返回 None
@@ -59,7 +65,7 @@ class PaddleOCRWrapper:
 
         try:
             # 如果是本地文件，检查文件是否存在
-            if not image_path.startswith('http'):
+            if isinstance(image_path, str) and not image_path.startswith('http'):
                 if not os.path.exists(image_path):
                     logging.error(f"图片文件不存在: {image_path}")
                     return None
@@ -77,11 +83,7 @@ class PaddleOCRWrapper:
                 # 打印结果
                 # res.print()
                 
-                # 提取文本内容 - 使用 rec_texts 而不是 boxes
-                if hasattr(res, 'rec_texts'):
-                    text_results.extend(res.rec_texts)
-                elif isinstance(res, dict) and 'rec_texts' in res:
-                    text_results.extend(res['rec_texts'])
+                text_results.extend(self._extract_texts(res))
             
             # 将所有识别出的文字拼接成一个字符串
             full_text = "\n".join(text_results)
@@ -89,9 +91,63 @@ class PaddleOCRWrapper:
             return full_text
             
         except Exception as e:
-            logging.error(f"PaddleOCR 识别失败 {image_path}: {e}")
+            logging.error(f"PaddleOCR 识别失败 {image_path if isinstance(image_path, str) else '图像数组'}: {e}")
             return None
 
+    def _extract_texts(self, res):
+        """从单张图片的识别结果中提取文本行 - 使用 rec_texts 而不是 boxes"""
+        if hasattr(res, 'rec_texts'):
+            return list(res.rec_texts)
+        if isinstance(res, dict) and 'rec_texts' in res:
+            return list(res['rec_texts'])
+        return []
+
+    def recognize_many(self, images, batch_size=PADDLE_OCR_BATCH_SIZE):
+        """
+        批量识别多张图片中的文字，按输入顺序逐张返回结果
+
+        每次向推理引擎送入 batch_size 张图片；引擎支持 predict_iter 时每张图片识别完成即返回。
+
+        Args:
+            images (iterable): 图片文件路径或 BGR 图像数组，可以是生成器
+            batch_size (int): 每批图片数
+
+        Yields:
+            str: 每张图片识别出的文字内容，失败时为 None
+        """
+        if not PADDLE_OCR_AVAILABLE or not self.ocr_engine:
+            logging.error("PaddleOCR 不可用")
+            for _ in images:
+                yield None
+            return
+
+        batch_size = max(1, batch_size)
+        batch = []
+        for image in images:
+            batch.append(image)
+            if len(batch) >= batch_size:
+                yield from self._recognize_batch(batch)
+                batch = []
+        if batch:
+            yield from self._recognize_batch(batch)
+
+    def _recognize_batch(self, batch):
+        """识别一批图片，批量推理失败时对剩余图片逐张重试"""
+        predict = getattr(self.ocr_engine, 'predict_iter', None) or self.ocr_engine.predict
+        done = 0
+        try:
+            for res in predict(input=batch):
+                yield "\n".join(self._extract_texts(res))
+                done += 1
+                if done == len(batch):
+                    break
+        except Exception as e:
+            logging.warning(f"PaddleOCR 批量识别失败，剩余 {len(batch) - done} 张逐张重试: {e}")
+        # 出错的图片或引擎返回数量不足时逐张识别，单张失败不影响同批其他图片
+        for image in batch[done:]:
+            yield self.recognize_text(image)
+        logging.info(f"PaddleOCR 批量识别完成 {len(batch)} 张")
+
 
 def test_paddle_ocr(image_path):
     """测试 PaddleOCR 功能"""
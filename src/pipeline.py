@@ -0,0 +1,357 @@
+import os
+import sys
+import time
+import queue
+import logging
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.insert(0, project_root)
+
+from config.settings import (
+    PIPELINE_PREPROCESS_WORKERS, PIPELINE_OCR_WORKERS, PIPELINE_CHAT_WORKERS,
+    PIPELINE_OCR_QUEUE_SIZE, PIPELINE_CHAT_QUEUE_SIZE, PIPELINE_WRITE_QUEUE_SIZE,
+    CHAT_BATCH_SIZE, PIPELINE_CHAT_BATCH_WAIT, PADDLE_OCR_BATCH_SIZE, JOB_CHECKPOINT_EVERY
+)
+from src.metrics import get_metrics, image_scope
+
+# 队列结束标记
+_SENTINEL = object()
+
+
+class _Job:
+    """流水线中单张截图的处理状态"""
+
+    def __init__(self, index, screenshot_path):
+        self.index = index
+        self.screenshot_path = screenshot_path
+        self.image_filename = os.path.basename(screenshot_path)
+        self.processed_image = None
+        self.text_content = None
+        self.running_data = None
+        self.error = None
+        self.dedup_key = None
+        self.duplicate_of = None
+        # 最后进入的阶段及各阶段耗时（秒），记入任务日志
+        self.stage = None
+        self.timings = {}
+
+
+class ScreenshotPipeline:
+    """
+    分阶段并发处理截图：预处理（进程池） -> OCR -> 结构化提取 -> 写入存储
+
+    单阶段（vision）模式下OCR和结构化提取合并为一个分析阶段，由多模态模型完成。
+
+    每个阶段拥有独立的并发数和有界队列，写入阶段按输入顺序落盘，
+    保证输出行顺序与截图文件顺序一致。
+    """
+
+    def __init__(self, image_processor, ai_analyzer, record_writer,
+                 preprocess_workers=PIPELINE_PREPROCESS_WORKERS,
+                 ocr_workers=PIPELINE_OCR_WORKERS,
+                 chat_workers=PIPELINE_CHAT_WORKERS,
+                 ocr_queue_size=PIPELINE_OCR_QUEUE_SIZE,
+                 chat_queue_size=PIPELINE_CHAT_QUEUE_SIZE,
+                 write_queue_size=PIPELINE_WRITE_QUEUE_SIZE,
+                 chat_batch_size=CHAT_BATCH_SIZE, image_index=None, record_deduplicator=None,
+                 ocr_batch_size=PADDLE_OCR_BATCH_SIZE, job_journal=None,
+                 checkpoint_every=JOB_CHECKPOINT_EVERY):
+        self.image_processor = image_processor
+        self.ai_analyzer = ai_analyzer
+        self.record_writer = record_writer
+        self.image_index = image_index
+        self.record_deduplicator = record_deduplicator
+        self.job_journal = job_journal
+        self.checkpoint_every = max(1, checkpoint_every)
+        self.preprocess_workers = max(1, preprocess_workers)
+        self.ocr_workers = max(1, ocr_workers)
+        self.chat_workers = max(1, chat_workers)
+        self.ocr_queue_size = ocr_queue_size
+        self.chat_queue_size = chat_queue_size
+        self.write_queue_size = write_queue_size
+        self.chat_batch_size = max(1, chat_batch_size)
+        # 仅本地PaddleOCR按批推理，API方式每张图片一个请求
+        self.ocr_batch_size = max(1, ocr_batch_size)
+
+        # 单个本地PaddleOCR引擎不是线程安全的，需要串行调用；进程池可以并发调用
+        self._ocr_lock = None
+        if ai_analyzer.use_paddle_ocr and not getattr(ai_analyzer.paddle_ocr, 'thread_safe', False):
+            self._ocr_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._written = 0
+        self.stats = {'total': 0, 'written': 0, 'failed': 0, 'duplicates': 0}
+
+    def _run_stage(self, name, func, in_queue, out_queue, workers, batch_size=None):
+        """
+        启动一个阶段的工作线程，所有线程退出后向下游发送结束标记
+
+        batch_size 为 None 时 func 每次处理一个任务；否则每次最多凑齐 batch_size 个任务，
+        以列表形式传给 func。
+        """
+        remaining = [workers]
+        remaining_lock = threading.Lock()
+
+        def collect(first):
+            """在等待时限内尽量凑满一批，返回 (任务列表, 是否已收到结束标记)"""
+            jobs = [first]
+            while len(jobs) < batch_size:
+                try:
+                    job = in_queue.get(timeout=PIPELINE_CHAT_BATCH_WAIT)
+                except queue.Empty:
+                    break
+                if job is _SENTINEL:
+                    in_queue.put(_SENTINEL)
+                    return jobs, True
+                jobs.append(job)
+            return jobs, False
+
+        def worker():
+            while True:
+                job = in_queue.get()
+                if job is _SENTINEL:
+                    # 让同阶段的其他线程也能收到结束标记
+                    in_queue.put(_SENTINEL)
+                    break
+
+                finished = False
+                if batch_size is None:
+                    jobs = [job]
+                    runnable = job if job.error is None else None
+                else:
+                    jobs, finished = collect(job)
+                    runnable = [j for j in jobs if j.error is None] or None
+
+                if runnable is not None:
+                    started = time.perf_counter()
+                    for j in jobs:
+                        if j.error is None:
+                            j.stage = name
+                    try:
+                        # 逐个处理时，阶段内记录的请求、解析等耗时归属于该截图
+                        with image_scope(job.image_filename) if batch_size is None else nullcontext():
+                            func(runnable)
+                    except Exception as e:
+                        for j in jobs:
+                            if j.error is None:
+                                j.error = f"{name}阶段异常: {e}"
+                    # 按批处理时记录整批的耗时
+                    elapsed = time.perf_counter() - started
+                    for j in jobs:
+                        if j.stage == name:
+                            j.timings[name] = elapsed
+                for j in jobs:
+                    out_queue.put(j)
+                if finished:
+                    break
+
+            with remaining_lock:
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    out_queue.put(_SENTINEL)
+
+        threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=worker, name=f"{name}-{i}", daemon=True)
+            thread.start()
+            threads.append(thread)
+        return threads
+
+    def _preprocess(self, executor):
+        def stage(job):
+            future = executor.submit(self.image_processor.preprocess_image, job.screenshot_path)
+            job.processed_image = future.result()
+            if not job.processed_image:
+                job.error = "图像处理失败"
+                return
+            # 预处理在子进程中执行，耗时由子进程测量
+            get_metrics().record('preprocess', job.processed_image.elapsed, bytes=len(job.processed_image.data))
+            # 内容重复（含重命名、重新编码）的截图在OCR之前拒绝
+            if self.image_index:
+                with get_metrics().span('dedup') as span:
+                    job.dedup_key, job.duplicate_of = self.image_index.check_and_reserve(
+                        job.processed_image, job.image_filename)
+                    span.set(duplicate=bool(job.duplicate_of))
+                if job.duplicate_of:
+                    job.error = "内容重复"
+        return stage
+
+    def _ocr(self, job):
+        with self._ocr_lock or nullcontext():
+            job.text_content = self.ai_analyzer.call_ocr_model(job.processed_image)
+        # 预处理后的图片只在OCR阶段使用，尽早释放内存
+        job.processed_image = None
+        if not job.text_content:
+            job.error = "OCR识别失败"
+
+    def _ocr_batch(self, jobs):
+        """本地PaddleOCR按批推理"""
+        with self._ocr_lock or nullcontext():
+            texts = self.ai_analyzer.call_ocr_model_many([job.processed_image for job in jobs])
+        for job, text_content in zip(jobs, texts):
+            job.text_content = text_content
+            job.processed_image = None
+            if not text_content:
+                job.error = "OCR识别失败"
+
+    def _vision(self, job):
+        """单阶段：多模态模型直接从截图中提取结构化信息"""
+        job.running_data = self.ai_analyzer.call_vision_model(job.processed_image)
+        job.processed_image = None
+        if not job.running_data:
+            job.error = "结构化信息提取失败"
+
+    def _chat(self, job):
+        job.running_data = self.ai_analyzer.call_chat_model(job.text_content)
+        if not job.running_data:
+            job.error = "结构化信息提取失败"
+
+    def _chat_batch(self, jobs):
+        results = self.ai_analyzer.call_chat_model_batch([job.text_content for job in jobs], self.chat_batch_size)
+        for job, running_data in zip(jobs, results):
+            job.running_data = running_data
+            if not running_data:
+                job.error = "结构化信息提取失败"
+
+    def _write_job(self, job):
+        """写入一条结果，返回任务状态：done / skipped / failed"""
+        if job.duplicate_of:
+            matched_file, distance = job.duplicate_of
+            logging.warning(f"发现重复截图，跳过: {job.image_filename} (与 {matched_file} 相同，距离 {distance})")
+            with self._stats_lock:
+                self.stats['duplicates'] += 1
+            return 'skipped'
+
+        # 记录级去重：同一次跑步的不同截图
+        if not job.error and self.record_deduplicator \
+                and not self.record_deduplicator.should_write(job.running_data, job.image_filename):
+            if job.dedup_key:
+                self.image_index.commit(job.dedup_key)
+            with self._stats_lock:
+                self.stats['duplicates'] += 1
+            return 'skipped'
+
+        started = time.perf_counter()
+        if not job.error and self.record_writer.append_record(job.running_data, job.image_filename):
+            job.stage = "写入"
+            job.timings[job.stage] = time.perf_counter() - started
+            get_metrics().record('write', job.timings[job.stage], image=job.image_filename)
+            if self.record_deduplicator:
+                self.record_deduplicator.record_written(job.running_data, job.image_filename)
+            logging.info(f"成功添加记录: {job.running_data.get('date')} (来自 {job.image_filename})")
+            if job.dedup_key:
+                self.image_index.commit(job.dedup_key)
+            with self._stats_lock:
+                self.stats['written'] += 1
+            return 'done'
+
+        return self._fail_job(job)
+
+    def _fail_job(self, job):
+        """记录失败：释放截图索引中的预约，使其之后可以重试"""
+        logging.error(f"{job.error or '写入记录失败'}: {job.screenshot_path}")
+        if job.dedup_key:
+            try:
+                self.image_index.release(job.dedup_key)
+            except Exception as e:
+                logging.error(f"释放截图索引预约失败: {job.image_filename} - {e}")
+        with self._stats_lock:
+            self.stats['failed'] += 1
+        return 'failed'
+
+    def _write(self, job):
+        # 写入线程只有一个，任何异常都只让当前任务失败，不能中断后续任务的写入
+        try:
+            status = self._write_job(job)
+        except Exception as e:
+            job.error = f"写入阶段出错: {e}"
+            status = self._fail_job(job)
+        if not self.job_journal:
+            return
+        error = None
+        if status == 'failed':
+            error = job.error or "写入记录失败"
+        elif status == 'skipped':
+            error = f"与 {job.duplicate_of[0]} 内容重复" if job.duplicate_of else "与已有记录重复"
+        try:
+            self.job_journal.finish(job.image_filename, status, error, stage=job.stage, timings=job.timings,
+                                    duplicate_of=job.duplicate_of[0] if job.duplicate_of else None)
+
+            # 定期写盘并提交任务日志，中断后从最近的检查点继续
+            self._written += 1
+            if self._written % self.checkpoint_every == 0 and self.record_writer.flush():
+                if self.image_index:
+                    self.image_index.persist()
+                self.job_journal.checkpoint()
+        except Exception as e:
+            logging.error(f"更新任务日志失败: {job.image_filename} - {e}")
+
+    def _run_writer(self, write_queue):
+        """单线程写入，按输入顺序重排后落盘"""
+        pending = {}
+        next_index = 0
+        while True:
+            job = write_queue.get()
+            if job is _SENTINEL:
+                break
+            pending[job.index] = job
+            while next_index in pending:
+                self._write(pending.pop(next_index))
+                next_index += 1
+
+        # 理论上不会残留，防御性地按顺序写出
+        for index in sorted(pending):
+            self._write(pending[index])
+
+    def run(self, screenshot_files):
+        """处理给定的截图列表，返回统计信息"""
+        screenshot_files = sorted(screenshot_files)
+        self.stats['total'] = len(screenshot_files)
+        if not screenshot_files:
+            return self.stats
+
+        input_queue = queue.Queue(maxsize=self.preprocess_workers * 2)
+        ocr_queue = queue.Queue(maxsize=self.ocr_queue_size)
+        chat_queue = queue.Queue(maxsize=self.chat_queue_size)
+        write_queue = queue.Queue(maxsize=self.write_queue_size)
+
+        with ProcessPoolExecutor(max_workers=self.preprocess_workers) as executor:
+            threads = []
+            threads += self._run_stage("预处理", self._preprocess(executor), input_queue, ocr_queue,
+                                       self.preprocess_workers)
+            if self.ai_analyzer.analysis_mode == 'vision':
+                # 分析阶段直接把结果交给写入阶段，并发数取OCR和提取两阶段之和
+                threads += self._run_stage("分析", self._vision, ocr_queue, write_queue,
+                                           self.ocr_workers + self.chat_workers)
+            else:
+                if self.ai_analyzer.use_paddle_ocr and self.ocr_batch_size > 1:
+                    threads += self._run_stage("OCR", self._ocr_batch, ocr_queue, chat_queue, self.ocr_workers,
+                                               batch_size=self.ocr_batch_size)
+                else:
+                    threads += self._run_stage("OCR", self._ocr, ocr_queue, chat_queue, self.ocr_workers)
+                if self.chat_batch_size > 1:
+                    threads += self._run_stage("提取", self._chat_batch, chat_queue, write_queue, self.chat_workers,
+                                               batch_size=self.chat_batch_size)
+                else:
+                    threads += self._run_stage("提取", self._chat, chat_queue, write_queue, self.chat_workers)
+            writer = threading.Thread(target=self._run_writer, args=(write_queue,), name="写入", daemon=True)
+            writer.start()
+
+            for index, screenshot_path in enumerate(screenshot_files):
+                logging.info(f"提交文件: {screenshot_path}")
+                if self.job_journal:
+                    self.job_journal.start(screenshot_path)
+                input_queue.put(_Job(index, screenshot_path))
+            input_queue.put(_SENTINEL)
+
+            writer.join()
+            for thread in threads:
+                thread.join()
+
+        logging.info(f"流水线处理完成: 共 {self.stats['total']} 个, 成功 {self.stats['written']} 个, "
+                     f"重复 {self.stats['duplicates']} 个, 失败 {self.stats['failed']} 个")
+        return self.stats
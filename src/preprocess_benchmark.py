@@ -0,0 +1,152 @@
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.insert(0, project_root)
+
+from config.settings import OUTPUT_DIR, PREPROCESS_QUALITY
+from src.image_processor import ImageProcessor, PREPROCESS_MODES
+from src.record_dedup import parse_duration, normalize_date, parse_distance
+from src.rule_extractor import FIELDS
+
+
+def field_matches(field, expected, actual):
+    """按字段类型比较提取结果与标注值"""
+    if expected is None or expected == '':
+        return actual is None or actual == ''
+    if field in ('distance_km', 'calories'):
+        expected, actual = parse_distance(expected), parse_distance(actual)
+        tolerance = 0.01 if field == 'distance_km' else 1
+        return actual is not None and abs(expected - actual) <= tolerance
+    if field == 'duration':
+        return parse_duration(actual) is not None and parse_duration(expected) == parse_duration(actual)
+    if field == 'date':
+        return normalize_date(expected) == normalize_date(actual)
+    # 配速只比较其中的数字，忽略 ' " : /km 等写法差异
+    return [int(n) for n in re.findall(r'\d+', str(expected))] == \
+        [int(n) for n in re.findall(r'\d+', str(actual or ''))]
+
+
+def run_config(image_processor, image_files, labels, analyzer=None):
+    """
+    用一组预处理参数处理样本集
+
+    Returns:
+        dict: 载荷大小、预处理耗时，以及（analyzer 不为 None 时）各字段准确率
+    """
+    total_bytes = 0
+    preprocess_time = 0.0
+    processed = 0
+    field_correct = {field: 0 for field in FIELDS}
+    records_correct = 0
+    labeled = 0
+    failures = 0
+    started = time.perf_counter()
+
+    for image_path in image_files:
+        processed_image = image_processor.preprocess_image(image_path)
+        if not processed_image:
+            failures += 1
+            continue
+        processed += 1
+        total_bytes += len(processed_image.data)
+        preprocess_time += processed_image.elapsed
+
+        expected = labels.get(os.path.basename(image_path))
+        if analyzer is None or expected is None:
+            continue
+        labeled += 1
+        running_data = analyzer.analyze_running_screenshot(processed_image) or {}
+        if not running_data:
+            failures += 1
+        matches = [field_matches(field, expected.get(field), running_data.get(field)) for field in FIELDS]
+        for field, matched in zip(FIELDS, matches):
+            field_correct[field] += matched
+        records_correct += all(matches)
+
+    result = {
+        'images': processed,
+        'failures': failures,
+        'total_bytes': total_bytes,
+        'avg_bytes': round(total_bytes / processed) if processed else 0,
+        'avg_preprocess_ms': round(preprocess_time / processed * 1000, 1) if processed else 0,
+        'elapsed_s': round(time.perf_counter() - started, 2),
+    }
+    if analyzer is not None:
+        result['labeled'] = labeled
+        result['field_accuracy'] = {
+            field: round(correct / labeled, 4) if labeled else None for field, correct in field_correct.items()
+        }
+        result['field_accuracy_overall'] = round(sum(field_correct.values()) / (labeled * len(FIELDS)), 4) \
+            if labeled else None
+        result['record_accuracy'] = round(records_correct / labeled, 4) if labeled else None
+    return result
+
+
+def print_results(results):
+    """以表格形式输出对比结果"""
+    print(f"{'配置':<22}{'图片数':>8}{'平均字节':>12}{'预处理ms':>12}{'字段准确率':>12}{'记录准确率':>12}")
+    for name, result in results.items():
+        field_accuracy = result.get('field_accuracy_overall')
+        record_accuracy = result.get('record_accuracy')
+        print(f"{name:<24}{result['images']:>8}{result['avg_bytes']:>12}{result['avg_preprocess_ms']:>12}"
+              f"{'-' if field_accuracy is None else f'{field_accuracy:.1%}':>14}"
+              f"{'-' if record_accuracy is None else f'{record_accuracy:.1%}':>14}")
+
+
+def main():
+    """对比不同预处理参数下的载荷大小与提取准确率"""
+    parser = argparse.ArgumentParser(description="预处理载荷大小与提取准确率对比工具")
+    parser.add_argument("sample_dir", help="样本截图目录")
+    parser.add_argument("--labels", help="标注文件（JSON，文件名 -> 各字段正确值），不提供时只统计载荷大小")
+    parser.add_argument("--modes", nargs="+", choices=PREPROCESS_MODES, default=list(PREPROCESS_MODES),
+                        help="要对比的预处理模式")
+    parser.add_argument("--qualities", nargs="+", type=int, default=[PREPROCESS_QUALITY], help="要对比的JPEG质量")
+    parser.add_argument("--paddle", action="store_true", help="使用本地PaddleOCR识别")
+    parser.add_argument("--output", default=os.path.join(OUTPUT_DIR, "preprocess_benchmark.json"),
+                        help="结果JSON文件路径")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    labels = {}
+    if args.labels:
+        with open(args.labels, 'r', encoding='utf-8') as labels_file:
+            labels = json.load(labels_file)
+
+    analyzer = None
+    if labels:
+        from src.ai_analyzer import AIAnalyzer
+        analyzer = AIAnalyzer(use_paddle_ocr=args.paddle)
+
+    image_files = sorted(ImageProcessor(args.sample_dir).get_screenshot_files())
+    if not image_files:
+        print(f"未找到样本截图: {args.sample_dir}")
+        return
+
+    results = {}
+    for mode in args.modes:
+        for quality in args.qualities:
+            name = f"{mode}/q{quality}"
+            print(f"正在测试 {name} ...")
+            # 不使用预处理磁盘缓存，保证每组参数都实际执行预处理
+            image_processor = ImageProcessor(args.sample_dir, cache_dir=None, quality=quality, mode=mode,
+                                             ocr_quality=quality)
+            results[name] = run_config(image_processor, image_files, labels, analyzer)
+
+    print_results(results)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as output_file:
+        json.dump({'sample_dir': args.sample_dir, 'results': results}, output_file, ensure_ascii=False, indent=2)
+    print(f"结果已保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
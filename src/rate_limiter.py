@@ -0,0 +1,268 @@
+import os
+import sys
+import time
+import random
+import logging
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.insert(0, project_root)
+
+from config.settings import (
+    RATE_LIMITS, RATE_LIMIT_DEFAULT, RATE_LIMIT_MAX_RETRIES,
+    RATE_LIMIT_BACKOFF_BASE, RATE_LIMIT_BACKOFF_MAX
+)
+
+# 触发退避重试的HTTP状态码
+THROTTLE_STATUS_CODES = (429, 503)
+
+# 单张图片按固定token数估算（API不会预先告知图片的token开销）
+IMAGE_TOKEN_ESTIMATE = 1000
+
+# 限流后速率下降比例、恢复步长及下限
+_DECREASE_FACTOR = 0.5
+_RECOVER_STEP = 0.05
+_MIN_RATE_SCALE = 0.1
+
+
+class TokenBucket:
+    """令牌桶：按 rate * scale 的速率补充令牌，允许预约（余额可为负，调用方按返回值等待）"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        # 限流后的降速比例，补充和等待时间都按降速后的速率计算
+        self.scale = 1.0
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate * self.scale)
+        self.updated_at = now
+
+    def set_scale(self, scale):
+        """调整降速比例，此前经过的时间仍按原速率补充"""
+        self._refill(time.monotonic())
+        self.scale = scale
+
+    def reserve(self, amount):
+        """预约 amount 个令牌，返回需要等待的秒数"""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / (self.rate * self.scale)
+
+    def refund(self, amount):
+        """归还（或追加扣除，amount 为负时）令牌"""
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class _ModelLimit:
+    """单个模型的请求数/令牌数限额及自适应状态"""
+
+    def __init__(self, requests_per_second, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_second, max(1.0, requests_per_second))
+        self.tokens = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute) if tokens_per_minute else None
+        self.rate_scale = 1.0
+        self.blocked_until = 0.0
+
+    def set_rate_scale(self, rate_scale):
+        self.rate_scale = rate_scale
+        self.requests.set_scale(rate_scale)
+        if self.tokens:
+            self.tokens.set_scale(rate_scale)
+
+
+class RateLimiter:
+    """
+    按模型限流的共享速率限制器
+
+    - 每个模型一个请求令牌桶和一个token令牌桶（配置见 RATE_LIMITS）
+    - 收到 429/503 时按 Retry-After 或带抖动的指数退避暂停该模型，并降低速率
+    - 请求成功后逐步恢复速率
+    """
+
+    def __init__(self, limits=None, default_limit=None, max_retries=RATE_LIMIT_MAX_RETRIES,
+                 backoff_base=RATE_LIMIT_BACKOFF_BASE, backoff_max=RATE_LIMIT_BACKOFF_MAX):
+        self.limits = limits if limits is not None else RATE_LIMITS
+        self.default_limit = default_limit if default_limit is not None else RATE_LIMIT_DEFAULT
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _get_model(self, model):
+        state = self._models.get(model)
+        if state is None:
+            config = self.limits.get(model, self.default_limit)
+            state = _ModelLimit(config.get("requests_per_second", 1.0), config.get("tokens_per_minute"))
+            self._models[model] = state
+        return state
+
+    def reserve(self, model, tokens=0):
+        """为一次请求预约配额，返回需要等待的秒数（同步和异步调用方共用）"""
+        with self._lock:
+            state = self._get_model(model)
+            wait = state.requests.reserve(1)
+            if state.tokens and tokens:
+                wait = max(wait, state.tokens.reserve(tokens))
+            wait = max(wait, state.blocked_until - time.monotonic())
+        return max(0.0, wait)
+
+    def acquire(self, model, tokens=0):
+        """阻塞直到该模型有可用配额"""
+        wait = self.reserve(model, tokens)
+        if wait > 0:
+            logging.info(f"速率限制: 模型 {model} 等待 {wait:.2f} 秒")
+            time.sleep(wait)
+
+    async def acquire_async(self, model, tokens=0):
+        """acquire 的协程版本，等待期间不阻塞事件循环"""
+        # asyncio 只在异步模式下需要，不在模块级导入以加快同步模式的启动
+        import asyncio
+        wait = self.reserve(model, tokens)
+        if wait > 0:
+            logging.info(f"速率限制: 模型 {model} 等待 {wait:.2f} 秒")
+            await asyncio.sleep(wait)
+
+    def record_usage(self, model, estimated_tokens, actual_tokens):
+        """用响应中的实际token用量修正预估值"""
+        if actual_tokens is None:
+            return
+        with self._lock:
+            state = self._get_model(model)
+            if state.tokens:
+                state.tokens.refund(estimated_tokens - actual_tokens)
+
+    def on_success(self, model):
+        """请求成功后逐步恢复速率"""
+        with self._lock:
+            state = self._get_model(model)
+            if state.rate_scale < 1.0:
+                state.set_rate_scale(min(1.0, state.rate_scale + _RECOVER_STEP))
+
+    def on_throttled(self, model, attempt, retry_after=None):
+        """收到限流响应：降低速率并暂停该模型，返回建议等待秒数"""
+        delay = self.backoff_delay(attempt, retry_after)
+        with self._lock:
+            state = self._get_model(model)
+            state.set_rate_scale(max(_MIN_RATE_SCALE, state.rate_scale * _DECREASE_FACTOR))
+            state.blocked_until = max(state.blocked_until, time.monotonic() + delay)
+        logging.warning(f"模型 {model} 触发限流，{delay:.2f} 秒后重试（第 {attempt + 1} 次）")
+        return delay
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """计算退避时间：优先使用 Retry-After，否则使用带完全抖动的指数退避"""
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.backoff_base)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def request(self, model, send, estimated_tokens=0):
+        """
+        在速率限制下发送请求，遇到限流时自动退避重试
+
+        Args:
+            model (str): 模型名称
+            send (callable): 无参函数，发送请求并返回 requests.Response
+            estimated_tokens (int): 本次请求预估的token数
+
+        Returns:
+            requests.Response: 最后一次请求的响应
+        """
+        response = None
+        for attempt in range(self.max_retries + 1):
+            self.acquire(model, estimated_tokens)
+            response = send()
+            if response.status_code not in THROTTLE_STATUS_CODES:
+                self.on_success(model)
+                return response
+            # 被拒绝的请求没有消耗token，退还预估量，重试时重新预约
+            self.record_usage(model, estimated_tokens, 0)
+            if attempt == self.max_retries:
+                break
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            # 被限流的响应不再使用，归还连接（流式请求不关闭会一直占用连接池）
+            response.close()
+            time.sleep(self.on_throttled(model, attempt, retry_after))
+        logging.error(f"模型 {model} 重试 {self.max_retries} 次后仍被限流")
+        return response
+
+    async def request_async(self, model, send, estimated_tokens=0):
+        """request 的协程版本，send 为返回可等待对象的无参函数（如 httpx.AsyncClient.post）"""
+        import asyncio
+        response = None
+        for attempt in range(self.max_retries + 1):
+            await self.acquire_async(model, estimated_tokens)
+            response = await send()
+            if response.status_code not in THROTTLE_STATUS_CODES:
+                self.on_success(model)
+                return response
+            # 被拒绝的请求没有消耗token，退还预估量，重试时重新预约
+            self.record_usage(model, estimated_tokens, 0)
+            if attempt == self.max_retries:
+                break
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            await response.aclose()
+            await asyncio.sleep(self.on_throttled(model, attempt, retry_after))
+        logging.error(f"模型 {model} 重试 {self.max_retries} 次后仍被限流")
+        return response
+
+
+def parse_retry_after(value):
+    """解析 Retry-After 头（秒数或HTTP日期），无法解析时返回 None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(payload):
+    """粗略估算请求载荷的token数（中文约一字一token，图片按固定值计）"""
+    total = 0
+    for message in payload.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            total += len(content)
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                total += len(part.get("text", ""))
+            elif part.get("type") == "image_url":
+                total += IMAGE_TOKEN_ESTIMATE
+    return total + payload.get("max_tokens", 0)
+
+
+def response_tokens(result):
+    """从响应JSON中读取实际token用量"""
+    usage = result.get("usage") if isinstance(result, dict) else None
+    if not usage:
+        return None
+    return usage.get("total_tokens")
+
+
+_shared_limiter = None
+_shared_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """获取进程内共享的速率限制器"""
+    global _shared_limiter
+    with _shared_lock:
+        if _shared_limiter is None:
+            _shared_limiter = RateLimiter()
+        return _shared_limiter
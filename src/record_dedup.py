@@ -0,0 +1,140 @@
+import os
+import sys
+import math
+import logging
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.insert(0, project_root)
+
+from config.settings import RECORD_DEDUP_ACTION, RECORD_DEDUP_DISTANCE_TOLERANCE, RECORD_DEDUP_DURATION_TOLERANCE
+
+RECORD_DEDUP_ACTIONS = ('skip', 'merge', 'flag')
+
+
+def parse_duration(duration):
+    """把 HH:MM:SS / MM:SS 转换为秒数，无法解析时返回 None"""
+    if not duration:
+        return None
+    try:
+        parts = [int(float(p)) for p in str(duration).split(':')]
+    except (ValueError, OverflowError):
+        return None
+    if not 1 <= len(parts) <= 3:
+        return None
+    while len(parts) < 3:
+        parts.insert(0, 0)
+    return parts[0] * 3600 + parts[1] * 60 + parts[2]
+
+
+def normalize_date(date):
+    """统一日期格式，兼容Excel中被识别为日期类型的单元格"""
+    if not date:
+        return None
+    if hasattr(date, 'strftime'):
+        return date.strftime('%Y-%m-%d')
+    return str(date).strip()
+
+
+def parse_distance(distance):
+    """转换为公里数，无法解析或不是有限的非负数（如 nan、inf）时返回 None"""
+    try:
+        value = float(distance) if distance is not None and distance != '' else None
+    except (TypeError, ValueError):
+        return None
+    if value is None or not math.isfinite(value) or value < 0:
+        return None
+    return value
+
+
+class RecordIndex:
+    """
+    按 (日期, 距离桶) 索引的跑步记录
+
+    距离桶宽度等于距离容差，查找时只需检查相邻的三个桶，
+    不随已有记录数量增长而变慢。
+    """
+
+    def __init__(self, distance_tolerance=RECORD_DEDUP_DISTANCE_TOLERANCE,
+                 duration_tolerance=RECORD_DEDUP_DURATION_TOLERANCE):
+        self.distance_tolerance = distance_tolerance
+        self.duration_tolerance = duration_tolerance
+        self._buckets = {}
+
+    def _key(self, date, distance):
+        return date, int(distance // self.distance_tolerance)
+
+    def add(self, running_data, image_file):
+        """加入一条记录，缺少日期或距离的记录不参与去重"""
+        date = normalize_date(running_data.get('date'))
+        distance = parse_distance(running_data.get('distance_km'))
+        if not date or distance is None:
+            return
+        duration = parse_duration(running_data.get('duration'))
+        self._buckets.setdefault(self._key(date, distance), []).append((distance, duration, image_file))
+
+    def find_match(self, running_data):
+        """查找同一天、距离和时长都在容差内的已有记录，返回其文件名或 None"""
+        date = normalize_date(running_data.get('date'))
+        distance = parse_distance(running_data.get('distance_km'))
+        if not date or distance is None:
+            return None
+        duration = parse_duration(running_data.get('duration'))
+
+        date_key, bucket = self._key(date, distance)
+        for neighbor in (bucket - 1, bucket, bucket + 1):
+            for other_distance, other_duration, image_file in self._buckets.get((date_key, neighbor), ()):
+                if abs(other_distance - distance) > self.distance_tolerance:
+                    continue
+                # 任一方缺少时长时仅按距离判断
+                if duration is not None and other_duration is not None \
+                        and abs(other_duration - duration) > self.duration_tolerance:
+                    continue
+                return image_file
+        return None
+
+
+class RecordDeduplicator:
+    """
+    结构化提取之后、写入之前的记录级去重
+
+    同一次跑步的不同截图（如汇总页和分享卡片）会提取出相同的记录，按 action 处理：
+    - skip: 丢弃新记录
+    - merge: 用新记录补全已有记录中为空的字段，不新增行
+    - flag: 仍然写入，仅在日志中标记
+    """
+
+    def __init__(self, record_writer, action=RECORD_DEDUP_ACTION, index=None):
+        if action not in RECORD_DEDUP_ACTIONS:
+            raise ValueError(f"不支持的记录去重方式: {action}，可选 {RECORD_DEDUP_ACTIONS}")
+        self.record_writer = record_writer
+        self.action = action
+        self.index = index or RecordIndex()
+        count = 0
+        for record in record_writer.iter_records():
+            self.index.add(record, record.get('image_file'))
+            count += 1
+        logging.info(f"记录去重索引已加载 {count} 条记录")
+
+    def should_write(self, running_data, image_filename):
+        """判断新记录是否需要写入；重复时按 action 处理"""
+        matched_file = self.index.find_match(running_data)
+        if not matched_file:
+            return True
+
+        if self.action == 'flag':
+            logging.warning(f"疑似重复记录: {image_filename} 与 {matched_file} 相同，仍然写入")
+            return True
+        if self.action == 'merge':
+            if self.record_writer.update_record(matched_file, running_data):
+                logging.warning(f"重复记录已合并: {image_filename} -> {matched_file}")
+            else:
+                logging.warning(f"发现重复记录，无新字段可合并，跳过: {image_filename} (与 {matched_file} 相同)")
+            return False
+        logging.warning(f"发现重复记录，跳过: {image_filename} (与 {matched_file} 相同)")
+        return False
+
+    def record_written(self, running_data, image_filename):
+        """新记录写入后加入索引"""
+        self.index.add(running_data, image_filename)
@@ -0,0 +1,57 @@
+import os
+
+
+class RecordWriter:
+    """
+    跑步记录存储后端的公共接口
+
+    ExcelWriter、SQLiteWriter、ParquetWriter 均实现该接口，主流程和流水线只依赖这里的方法。
+    """
+
+    # 输出列及与之一一对应的跑步数据字段名
+    columns = ['Image File', 'Distance (km)', 'Duration', 'Pace', 'Date', 'Calories']
+    fields = ['image_file', 'distance_km', 'duration', 'pace', 'date', 'calories']
+
+    def record_to_row(self, running_data, image_filename):
+        """按列顺序把跑步数据转换为一行"""
+        return [image_filename] + [running_data.get(field) for field in self.fields[1:]]
+
+    def create_or_load(self):
+        """创建或加载存储，返回是否新建"""
+        raise NotImplementedError
+
+    def append_record(self, running_data, image_filename=None):
+        """追加一条记录，返回是否成功"""
+        raise NotImplementedError
+
+    def is_duplicate_record(self, image_filename):
+        """检查是否为重复记录（基于文件名判断）"""
+        raise NotImplementedError
+
+    def filter_new(self, paths):
+        """批量过滤出尚未处理的截图（同名文件只保留第一个）"""
+        new_paths = []
+        seen = set()
+        for path in paths:
+            image_filename = os.path.basename(path)
+            if image_filename in seen or self.is_duplicate_record(image_filename):
+                continue
+            seen.add(image_filename)
+            new_paths.append(path)
+        return new_paths
+
+    def iter_records(self):
+        """遍历已有记录，以字段名字典形式返回"""
+        raise NotImplementedError
+
+    def update_record(self, image_filename, running_data):
+        """用新数据补全已有记录中为空的字段，返回是否有字段被更新"""
+        raise NotImplementedError
+
+    def flush(self):
+        """写出缓冲中的记录，返回是否成功"""
+        return True
+
+    def close(self):
+        """写出剩余记录并释放资源，返回是否成功"""
+        return self.flush()
@@ -0,0 +1,196 @@
+import re
+import logging
+
+# 所有字段，与 JSON_FORMAT_EXAMPLE 保持一致
+FIELDS = ('date', 'distance_km', 'duration', 'pace', 'calories')
+
+# 通用字段规则（按顺序尝试，带标签的规则优先）
+_GENERIC_PATTERNS = {
+    'date': [
+        r'(20\d{2})\s*[-/.年]\s*(\d{1,2})\s*[-/.月]\s*(\d{1,2})',
+    ],
+    'distance_km': [
+        r'(?:距离|里程|总距离|Distance)\D{0,6}?(\d+(?:\.\d+)?)',
+        r'(\d+(?:\.\d+)?)\s*(?:公里|千米|km|KM|Km)(?!\s*/)',
+    ],
+    'duration': [
+        r'(?:用时|时长|运动时间|总时间|总用时|Time|Duration)\D{0,6}?(\d{1,2}:\d{2}(?::\d{2})?)',
+        r'(?<![\d:])(\d{1,2}:\d{2}:\d{2})(?![\d:])',
+    ],
+    'pace': [
+        r'(?:配速|平均配速|Pace|Avg Pace)\D{0,6}?(\d{1,2})\s*[:\'′’]\s*(\d{2})',
+        r'(?<!\d)(\d{1,2})\s*[\'′’]\s*(\d{2})\s*(?:"|″|”|\'\')',
+    ],
+    'calories': [
+        r'(?:卡路里|消耗|热量|Calories)\D{0,6}?(\d+(?:\.\d+)?)',
+        r'(\d+(?:\.\d+)?)\s*(?:千卡|大卡|kcal|Kcal|KCAL|Cal)',
+    ],
+}
+
+# 常见跑步App的版式规则：命中关键词后优先使用专属规则，再回退到通用规则
+APP_TEMPLATES = [
+    {
+        'name': 'Keep',
+        'keywords': ('Keep', 'keep'),
+        'patterns': {
+            # Keep 的主数字与单位常被识别为两行
+            'distance_km': [r'(\d+\.\d{2})\s*\n\s*公里'],
+        },
+    },
+    {
+        'name': '咕咚',
+        'keywords': ('咕咚', 'Codoon', 'codoon'),
+        'patterns': {
+            'duration': [r'(?:运动时长|时长)\s*\n?\s*(\d{1,2}:\d{2}(?::\d{2})?)'],
+        },
+    },
+    {
+        'name': '悦跑圈',
+        'keywords': ('悦跑圈', 'Joyrun', 'joyrun'),
+        'patterns': {},
+    },
+    {
+        'name': 'Nike Run Club',
+        'keywords': ('Nike', 'NRC', 'Run Club'),
+        'patterns': {
+            'distance_km': [r'(\d+\.\d{2})\s*\n?\s*(?:公里|Kilometers|KM)'],
+        },
+    },
+    {
+        'name': 'Garmin Connect',
+        'keywords': ('Garmin', 'GARMIN', '佳明'),
+        'patterns': {},
+    },
+    {
+        'name': '华为运动健康',
+        'keywords': ('华为', 'HUAWEI', 'Huawei', '运动健康'),
+        'patterns': {},
+    },
+    {
+        'name': '小米运动',
+        'keywords': ('小米', 'Zepp', 'Mi Fitness'),
+        'patterns': {},
+    },
+]
+
+# 距离 × 配速 与 时长 的允许偏差比例
+_CONSISTENCY_TOLERANCE = 0.05
+
+
+def _compile(patterns):
+    return {field: [re.compile(p) for p in rules] for field, rules in patterns.items()}
+
+
+def _duration_seconds(duration):
+    parts = [int(p) for p in duration.split(':')]
+    while len(parts) < 3:
+        parts.insert(0, 0)
+    return parts[0] * 3600 + parts[1] * 60 + parts[2]
+
+
+def _pace_seconds(pace):
+    minutes, seconds = pace.split('/')[0].split(':')
+    return int(minutes) * 60 + int(seconds)
+
+
+def _to_number(value):
+    number = float(value)
+    return int(number) if number.is_integer() else number
+
+
+class RuleBasedExtractor:
+    """
+    基于正则规则的本地结构化提取器
+
+    针对常见跑步App的OCR文字直接提取跑步数据，返回与 JSON_FORMAT_EXAMPLE 相同的字段，
+    并给出置信度。字段缺失或置信度不足时由调用方回退到对话模型。
+    """
+
+    def __init__(self, templates=APP_TEMPLATES):
+        self.generic_patterns = _compile(_GENERIC_PATTERNS)
+        self.templates = [
+            {'name': t['name'], 'keywords': t['keywords'], 'patterns': _compile(t['patterns'])}
+            for t in templates
+        ]
+
+    def detect_template(self, text_content):
+        """根据关键词识别截图来源App"""
+        for template in self.templates:
+            if any(keyword in text_content for keyword in template['keywords']):
+                return template
+        return None
+
+    def _match(self, field, text_content, template):
+        rules = list(template['patterns'].get(field, [])) if template else []
+        rules += self.generic_patterns[field]
+        for rule in rules:
+            match = rule.search(text_content)
+            if match:
+                value = self._normalize(field, match)
+                if value is not None:
+                    return value
+        return None
+
+    def _normalize(self, field, match):
+        """将匹配结果转换为 JSON_FORMAT_EXAMPLE 中的格式"""
+        try:
+            if field == 'date':
+                year, month, day = (int(g) for g in match.groups())
+                if not (1 <= month <= 12 and 1 <= day <= 31):
+                    return None
+                return f"{year:04d}-{month:02d}-{day:02d}"
+            if field == 'distance_km':
+                distance = float(match.group(1))
+                return distance if 0 < distance < 500 else None
+            if field == 'duration':
+                total = _duration_seconds(match.group(1))
+                hours, rest = divmod(total, 3600)
+                minutes, seconds = divmod(rest, 60)
+                return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+            if field == 'pace':
+                minutes, seconds = int(match.group(1)), int(match.group(2))
+                if seconds >= 60:
+                    return None
+                return f"{minutes:02d}:{seconds:02d}/km"
+            if field == 'calories':
+                return _to_number(match.group(1))
+        except (ValueError, TypeError):
+            return None
+        return None
+
+    def confidence(self, running_data, template, required_fields):
+        """计算置信度：必填字段覆盖率，结合 距离×配速≈时长 的一致性校验"""
+        found = sum(1 for field in required_fields if running_data.get(field) is not None)
+        score = found / len(required_fields) if required_fields else 1.0
+
+        distance = running_data.get('distance_km')
+        duration = running_data.get('duration')
+        pace = running_data.get('pace')
+        if distance and duration and pace:
+            expected = distance * _pace_seconds(pace)
+            actual = _duration_seconds(duration)
+            if actual and abs(expected - actual) / actual > _CONSISTENCY_TOLERANCE:
+                score *= 0.6
+
+        if template is None:
+            score *= 0.9
+        return round(score, 3)
+
+    def extract(self, text_content, required_fields=FIELDS):
+        """
+        从OCR文字中提取跑步数据
+
+        Args:
+            text_content (str): OCR识别出的文字
+            required_fields (tuple): 计算置信度时要求存在的字段
+
+        Returns:
+            tuple: (跑步数据字典, 置信度, 缺失的必填字段列表)
+        """
+        template = self.detect_template(text_content)
+        running_data = {field: self._match(field, text_content, template) for field in FIELDS}
+        missing = [field for field in required_fields if running_data[field] is None]
+        confidence = self.confidence(running_data, template, required_fields)
+        logging.info(f"规则提取: 模板 {template['name'] if template else '通用'}, "
+                     f"置信度 {confidence}, 缺失字段 {missing}")
+        return running_data, confidence, missing
@@ -0,0 +1,118 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import statistics
+import subprocess
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.insert(0, project_root)
+
+from config.settings import SCREENSHOTS_DIR
+
+# 只测导入的模块（test_api 运行时会实际调用API，因此只测导入耗时）
+IMPORT_TARGETS = ('src.main', 'src.test_api', 'src.ai_analyzer', 'src.paddle_ocr')
+
+
+def time_command(command, cwd, runs):
+    """
+    多次运行命令，返回墙钟耗时（秒）的中位数、最小值和最大值
+    """
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(command, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        timings.append(time.perf_counter() - started)
+    return {
+        'median_s': round(statistics.median(timings), 3),
+        'min_s': round(min(timings), 3),
+        'max_s': round(max(timings), 3),
+    }
+
+
+def slowest_imports(module, top):
+    """
+    用 python -X importtime 统计导入某模块时累计耗时最多的子模块（累计耗时包含其下层导入）
+
+    Returns:
+        list: [(模块名, 累计耗时ms), ...]，按耗时降序
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=project_root, capture_output=True, text=True, check=False
+    )
+    entries = []
+    for line in result.stderr.splitlines():
+        # 格式: import time: self [us] | cumulative | imported package，包名前的缩进表示嵌套层级
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((depth, name.strip(), int(cumulative)))
+
+    # 子模块先于其父模块输出：目标模块之前、上一个顶层导入之后的条目即其导入子树
+    imports = []
+    for depth, name, cumulative in reversed(entries):
+        if depth == 0 and imports:
+            break
+        if depth == 0 and name == module:
+            imports.append(None)
+        elif imports:
+            imports.append((name, round(cumulative / 1000, 1)))
+    imports = [item for item in imports if item]
+    imports.sort(key=lambda item: item[1], reverse=True)
+    return imports[:top]
+
+
+def main():
+    """测量命令行启动耗时和各模块导入耗时"""
+    parser = argparse.ArgumentParser(description="启动耗时测试工具")
+    parser.add_argument("--runs", type=int, default=5, help="每项测试运行次数，取中位数")
+    parser.add_argument("--top", type=int, default=10, help="每个模块列出的最慢导入数")
+    parser.add_argument("--output", help="结果JSON文件路径，不提供时只输出到终端")
+    args = parser.parse_args()
+
+    results = {'python': sys.version.split()[0], 'startup': {}, 'imports': {}}
+
+    # 在空截图目录下运行 main.py：只包含解释器启动、导入和目录扫描，不触发任何API调用
+    work_dir = tempfile.mkdtemp(prefix='startup_benchmark_')
+    try:
+        os.makedirs(os.path.join(work_dir, SCREENSHOTS_DIR))
+        print("正在测试 main.py 空目录启动 ...")
+        results['startup']['main.py'] = time_command(
+            [sys.executable, os.path.join(current_dir, 'main.py')], work_dir, args.runs
+        )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print("正在测试解释器本身启动 ...")
+    results['startup']['python'] = time_command([sys.executable, '-c', 'pass'], project_root, args.runs)
+
+    for module in IMPORT_TARGETS:
+        print(f"正在测试导入 {module} ...")
+        timing = time_command([sys.executable, '-c', f'import {module}'], project_root, args.runs)
+        timing['slowest'] = slowest_imports(module, args.top)
+        results['imports'][module] = timing
+
+    print(f"\n{'测试项':<24}{'中位数s':>10}{'最小s':>10}{'最大s':>10}")
+    for name, timing in list(results['startup'].items()) + list(results['imports'].items()):
+        print(f"{name:<26}{timing['median_s']:>10}{timing['min_s']:>10}{timing['max_s']:>10}")
+    for module, timing in results['imports'].items():
+        print(f"\n{module} 最慢的导入:")
+        for name, cumulative in timing['slowest']:
+            print(f"  {name:<40}{cumulative:>8} ms")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(results, output_file, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
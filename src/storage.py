@@ -0,0 +1,427 @@
+import os
+import sys
+import time
+import sqlite3
+import logging
+import tempfile
+import threading
+import importlib.util
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.insert(0, project_root)
+
+from config.settings import (
+    STORAGE_BACKEND, OUTPUT_FILE, SQLITE_OUTPUT_FILE, PARQUET_OUTPUT_DIR, STORAGE_FLUSH_EVERY, EXPORT_EXCEL_FILE
+)
+from src.record_writer import RecordWriter
+from src.excel_writer import ExcelWriter
+
+# pyarrow 为Parquet后端可选依赖，只检查是否已安装，创建Parquet后端时才导入
+PYARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+STORAGE_BACKENDS = ('excel', 'sqlite', 'parquet')
+
+# 数值列，其余列按字符串存储
+NUMERIC_FIELDS = ('distance_km', 'calories')
+
+# 写入导出文件属性中的标记，只有带该标记的工作簿才允许被导出覆盖
+EXPORT_MARKER = 'runflow-export'
+
+
+def _to_float(value):
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def load_excel_records(excel_file):
+    """
+    读取Excel后端已有的记录，用于新建SQLite/Parquet存储时导入
+
+    Returns:
+        list: 字段名字典形式的记录，文件不存在时为空列表
+    """
+    if not excel_file or not os.path.exists(excel_file):
+        return []
+    try:
+        return list(ExcelWriter(excel_file).iter_records())
+    except Exception as e:
+        logging.error(f"读取已有Excel记录失败: {excel_file} - {e}")
+        return []
+
+
+class SQLiteWriter(RecordWriter):
+    """
+    SQLite存储后端
+
+    追加写入在同一事务中进行，每 flush_every 行提交一次；image_file 列建有唯一索引，
+    重复检查为索引查询，不需要把已有记录加载到内存。新建数据库时导入 seed_excel 中的已有记录。
+    """
+
+    def __init__(self, db_path=SQLITE_OUTPUT_FILE, flush_every=STORAGE_FLUSH_EVERY, seed_excel=None):
+        self.db_path = db_path
+        self.flush_every = max(1, flush_every)
+        self.seed_excel = seed_excel
+        self._conn = None
+        self._pending = 0
+        self._lock = threading.RLock()
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS records ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " image_file TEXT,"
+                " distance_km REAL,"
+                " duration TEXT,"
+                " pace TEXT,"
+                " date TEXT,"
+                " calories REAL,"
+                " created_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_records_image_file ON records (image_file) "
+                "WHERE image_file IS NOT NULL"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_records_date ON records (date, distance_km)")
+            self._conn.commit()
+        return self._conn
+
+    def create_or_load(self):
+        """创建或打开数据库，返回是否新建"""
+        created = not os.path.exists(self.db_path)
+        with self._lock:
+            self._connect()
+            if created:
+                self._import_records(load_excel_records(self.seed_excel))
+        return created
+
+    def _import_records(self, records):
+        """导入已有记录（同名文件只保留第一条）"""
+        if not records:
+            return
+        self._connect().executemany(
+            f"INSERT OR IGNORE INTO records ({', '.join(self.fields)}, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [[record.get(field) for field in self.fields] + [time.time()] for record in records]
+        )
+        self._conn.commit()
+        logging.info(f"已从 {self.seed_excel} 导入 {len(records)} 条已有记录")
+
+    def append_record(self, running_data, image_filename=None):
+        """在当前事务中插入一条记录，累计 flush_every 行后提交"""
+        row = self.record_to_row(running_data, image_filename)
+        with self._lock:
+            try:
+                self._connect().execute(
+                    f"INSERT INTO records ({', '.join(self.fields)}, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    row + [time.time()]
+                )
+            except sqlite3.Error as e:
+                logging.error(f"写入SQLite失败: {e}")
+                return False
+            self._pending += 1
+            if self._pending >= self.flush_every:
+                return self.flush()
+        return True
+
+    def is_duplicate_record(self, image_filename):
+        """检查是否为重复记录（基于文件名判断）"""
+        if not image_filename:
+            return False
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT 1 FROM records WHERE image_file = ? LIMIT 1", (image_filename,)
+            ).fetchone()
+        return row is not None
+
+    def iter_records(self):
+        """按写入顺序遍历记录（含未提交的行）"""
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT {', '.join(self.fields)} FROM records ORDER BY id"
+            ).fetchall()
+        for row in rows:
+            yield dict(zip(self.fields, row))
+
+    def update_record(self, image_filename, running_data):
+        """用新数据补全已有记录中为空的字段"""
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                f"SELECT {', '.join(self.fields)} FROM records WHERE image_file = ?", (image_filename,)
+            ).fetchone()
+            if row is None:
+                return False
+            updates = {
+                field: running_data.get(field)
+                for field, value in zip(self.fields, row)
+                if field != 'image_file' and value in (None, '') and running_data.get(field) is not None
+            }
+            if not updates:
+                return False
+            try:
+                conn.execute(
+                    f"UPDATE records SET {', '.join(f'{field} = ?' for field in updates)} WHERE image_file = ?",
+                    list(updates.values()) + [image_filename]
+                )
+            except sqlite3.Error as e:
+                logging.error(f"更新SQLite记录失败: {e}")
+                return False
+            self._pending += 1
+        return True
+
+    def flush(self):
+        """提交当前事务"""
+        with self._lock:
+            if self._conn is None:
+                return True
+            try:
+                self._conn.commit()
+                self._pending = 0
+                return True
+            except sqlite3.Error as e:
+                logging.error(f"提交SQLite事务失败: {e}")
+                return False
+
+    def close(self):
+        """提交剩余记录并关闭连接"""
+        with self._lock:
+            if not self.flush():
+                return False
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        return True
+
+
+class ParquetWriter(RecordWriter):
+    """
+    Parquet存储后端（需要安装 pyarrow）
+
+    记录保存在一个目录中，每次写盘生成一个新的分片文件，追加不需要重写已有数据；
+    重复检查只读取 image_file 一列。新建存储时把 seed_excel 中的已有记录写为第一个分片。
+    """
+
+    def __init__(self, output_dir=PARQUET_OUTPUT_DIR, flush_every=STORAGE_FLUSH_EVERY, seed_excel=None):
+        if not PYARROW_AVAILABLE:
+            raise ImportError("Parquet存储后端需要安装 pyarrow: pip install pyarrow")
+        import pyarrow
+        import pyarrow.parquet
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.output_dir = output_dir
+        self.flush_every = max(1, flush_every)
+        self.seed_excel = seed_excel
+        self._buffer = []
+        self._known_files = None
+        self._lock = threading.RLock()
+        self.schema = self._pa.schema([
+            (field, self._pa.float64() if field in NUMERIC_FIELDS else self._pa.string()) for field in self.fields
+        ])
+
+    def _part_files(self):
+        if not os.path.isdir(self.output_dir):
+            return []
+        return sorted(
+            os.path.join(self.output_dir, name) for name in os.listdir(self.output_dir)
+            if name.startswith('part-') and name.endswith('.parquet')
+        )
+
+    def _normalize(self, record):
+        """按schema转换字段类型"""
+        normalized = {}
+        for field in self.fields:
+            value = record.get(field)
+            if field in NUMERIC_FIELDS:
+                normalized[field] = _to_float(value)
+                if value not in (None, '') and normalized[field] is None:
+                    logging.warning(f"无法转换为数值，已置空: {field}={value!r}")
+            else:
+                normalized[field] = None if value is None else str(value)
+        return normalized
+
+    def _write_part(self, path, records):
+        """先写临时文件再重命名，避免写入中途崩溃留下损坏的分片"""
+        table = self._pa.Table.from_pylist(records, schema=self.schema)
+        # 以 . 开头的临时文件不会被当作分片读取
+        fd, temp_path = tempfile.mkstemp(suffix='.parquet', prefix='.tmp_', dir=self.output_dir)
+        os.close(fd)
+        try:
+            self._pq.write_table(table, temp_path)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def create_or_load(self):
+        """创建输出目录并加载已有文件名索引，返回是否新建"""
+        created = not os.path.isdir(self.output_dir)
+        os.makedirs(self.output_dir, exist_ok=True)
+        if not self._part_files():
+            records = load_excel_records(self.seed_excel)
+            if records:
+                self._write_part(os.path.join(self.output_dir, "part-000000.parquet"),
+                                 [self._normalize(record) for record in records])
+                logging.info(f"已从 {self.seed_excel} 导入 {len(records)} 条已有记录")
+        self._load_known_files()
+        return created
+
+    def _load_known_files(self):
+        known_files = set()
+        for path in self._part_files():
+            column = self._pq.read_table(path, columns=['image_file']).column('image_file')
+            known_files.update(name for name in column.to_pylist() if name)
+        with self._lock:
+            known_files.update(record['image_file'] for record in self._buffer if record['image_file'])
+            self._known_files = known_files
+        logging.info(f"已加载 {len(known_files)} 条已处理文件名")
+
+    def append_record(self, running_data, image_filename=None):
+        """将记录加入写入缓冲，缓冲满时写出一个分片"""
+        record = self._normalize(dict(running_data, image_file=image_filename))
+        with self._lock:
+            self._buffer.append(record)
+            if image_filename and self._known_files is not None:
+                self._known_files.add(image_filename)
+            if len(self._buffer) >= self.flush_every:
+                return self.flush()
+        return True
+
+    def is_duplicate_record(self, image_filename):
+        """检查是否为重复记录（基于文件名判断）"""
+        if not image_filename:
+            return False
+        if self._known_files is None:
+            self._load_known_files()
+        with self._lock:
+            return image_filename in self._known_files
+
+    def iter_records(self):
+        """按写入顺序遍历记录（含缓冲中的行）"""
+        for path in self._part_files():
+            for record in self._pq.read_table(path).to_pylist():
+                yield record
+        with self._lock:
+            buffered = [dict(record) for record in self._buffer]
+        for record in buffered:
+            yield record
+
+    def update_record(self, image_filename, running_data):
+        """用新数据补全已有记录中为空的字段，已落盘的记录会重写其所在分片"""
+        def fill(record):
+            updated = False
+            for field in self.fields:
+                if field == 'image_file':
+                    continue
+                if record.get(field) in (None, '') and running_data.get(field) is not None:
+                    record[field] = running_data.get(field)
+                    updated = True
+            return updated
+
+        with self._lock:
+            for position, record in enumerate(self._buffer):
+                if record['image_file'] == image_filename:
+                    updated = fill(record)
+                    self._buffer[position] = self._normalize(record)
+                    return updated
+            try:
+                # 合并很少发生，逐个分片查找
+                for path in self._part_files():
+                    records = self._pq.read_table(path).to_pylist()
+                    for position, record in enumerate(records):
+                        if record['image_file'] == image_filename:
+                            if not fill(record):
+                                return False
+                            records[position] = self._normalize(record)
+                            self._write_part(path, records)
+                            return True
+            except Exception as e:
+                logging.error(f"更新Parquet记录失败: {e}")
+        return False
+
+    def flush(self):
+        """把缓冲中的记录写成一个新的分片"""
+        with self._lock:
+            if not self._buffer:
+                return True
+            try:
+                os.makedirs(self.output_dir, exist_ok=True)
+                parts = self._part_files()
+                index = int(os.path.basename(parts[-1])[5:-8]) + 1 if parts else 0
+                self._write_part(os.path.join(self.output_dir, f"part-{index:06d}.parquet"), self._buffer)
+                self._buffer = []
+                return True
+            except Exception as e:
+                logging.error(f"写入Parquet失败: {e}")
+                return False
+
+
+def create_writer(backend=STORAGE_BACKEND):
+    """
+    按名称创建存储后端
+
+    Args:
+        backend (str): excel / sqlite / parquet
+
+    Returns:
+        RecordWriter: 存储后端实例（尚未调用 create_or_load）
+    """
+    if backend == 'excel':
+        return ExcelWriter(OUTPUT_FILE)
+    # 从Excel后端切换过来时导入已有记录，保留按文件名去重
+    if backend == 'sqlite':
+        return SQLiteWriter(SQLITE_OUTPUT_FILE, seed_excel=OUTPUT_FILE)
+    if backend == 'parquet':
+        return ParquetWriter(PARQUET_OUTPUT_DIR, seed_excel=OUTPUT_FILE)
+    raise ValueError(f"不支持的存储后端: {backend}，可选 {STORAGE_BACKENDS}")
+
+
+def _is_export_file(path):
+    """判断已有的工作簿是否由 export_to_excel 生成"""
+    from openpyxl import load_workbook
+    try:
+        workbook = load_workbook(path, read_only=True)
+    except Exception:
+        return False
+    try:
+        return workbook.properties.keywords == EXPORT_MARKER
+    finally:
+        workbook.close()
+
+
+def export_to_excel(record_writer, output_file=EXPORT_EXCEL_FILE):
+    """
+    把存储后端中的全部记录导出为Excel
+
+    只覆盖之前导出生成的文件，不会覆盖Excel后端的记录文件或其他工作簿。
+
+    Returns:
+        int: 导出的记录数
+
+    Raises:
+        FileExistsError: output_file 已存在且不是导出生成的文件
+    """
+    from openpyxl import Workbook
+    if os.path.exists(output_file) and not _is_export_file(output_file):
+        raise FileExistsError(f"{output_file} 已存在且不是导出生成的文件，拒绝覆盖")
+    workbook = Workbook(write_only=True)
+    workbook.properties.keywords = EXPORT_MARKER
+    worksheet = workbook.create_sheet()
+    worksheet.append(record_writer.columns)
+    count = 0
+    for record in record_writer.iter_records():
+        worksheet.append([record.get(field) for field in record_writer.fields])
+        count += 1
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    ExcelWriter(output_file)._save_atomic(workbook)
+    logging.info(f"已导出 {count} 条记录到 {output_file}")
+    return count
@@ -2,8 +2,6 @@ import os
 import sys
 import base64
 import json
-import time
-import requests
 from dotenv import load_dotenv
 
 # 添加项目根目录到Python路径
@@ -12,6 +10,7 @@ project_root = os.path.dirname(current_dir)
 sys.path.insert(0, project_root)
 
 from config.settings import SILICONFLOW_API_KEY, OCR_MODEL, CHAT_MODEL, OCR_PROMPT, ANALYSIS_PROMPT, JSON_FORMAT_EXAMPLE
+from src.api_client import get_client
 
 def test_api_connection():
     """测试硅基流动API连接"""
@@ -37,13 +36,8 @@ def test_api_connection():
             ]
         }
         
-        headers = {
-            "Authorization": f"Bearer {SILICONFLOW_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        api_url = "https://api.siliconflow.cn/v1/chat/completions"
-        response = requests.post(api_url, headers=headers, json=payload)
+        client = get_client()
+        response = client.chat_completion(payload)
         
         if response.status_code == 200:
             result = response.json()
@@ -111,13 +105,8 @@ def test_ocr_api_call(image_path):
             ]
         }
         
-        headers = {
-            "Authorization": f"Bearer {SILICONFLOW_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        api_url = "https://api.siliconflow.cn/v1/chat/completions"
-        response = requests.post(api_url, headers=headers, json=payload)
+        client = get_client()
+        response = client.chat_completion(payload)
         
         if response.status_code == 200:
             result = response.json()
@@ -170,13 +159,8 @@ def test_two_stage_analysis(image_path):
             ]
         }
         
-        headers = {
-            "Authorization": f"Bearer {SILICONFLOW_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        api_url = "https://api.siliconflow.cn/v1/chat/completions"
-        ocr_response = requests.post(api_url, headers=headers, json=ocr_payload)
+        client = get_client()
+        ocr_response = client.chat_completion(ocr_payload)
         
         if ocr_response.status_code != 200:
             print(f"OCR调用失败，状态码: {ocr_response.status_code}")
@@ -188,7 +172,6 @@ def test_two_stage_analysis(image_path):
         print(f"OCR识别成功，文字长度: {len(text_content)} 字符")
         print(f"OCR识别结果: {text_content}")
         
-        time.sleep(3)  # 可选：等待一段时间以防止速率限制
         # 第二阶段：对话模型分析
         print("第二阶段：对话模型分析...")
         # 使用安全的字符串替换方式
@@ -207,7 +190,7 @@ def test_two_stage_analysis(image_path):
             "response_format": {"type": "json_object"}
         }
         
-        analysis_response = requests.post(api_url, headers=headers, json=analysis_payload)
+        analysis_response = client.chat_completion(analysis_payload)
         
         if analysis_response.status_code == 200:
             analysis_result = analysis_response.json()
@@ -0,0 +1,167 @@
+import os
+import sys
+import time
+import logging
+import threading
+import importlib.util
+
+# 添加项目根目录到Python路径
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.insert(0, project_root)
+
+from config.settings import WATCH_BACKEND, WATCH_POLL_INTERVAL, WATCH_SETTLE_SECONDS, WATCH_RESCAN_INTERVAL
+
+# watchdog 为可选依赖（系统文件通知），未安装时轮询目录
+WATCHDOG_AVAILABLE = importlib.util.find_spec("watchdog") is not None
+
+WATCH_BACKENDS = ('auto', 'poll')
+
+
+class ScreenshotWatcher:
+    """
+    监视截图目录，按批返回新出现且已写入完成的截图
+
+    安装了 watchdog 时通过系统文件通知（Linux 上为 inotify）得知文件变化，并定期全量扫描兜底；
+    否则定期扫描目录。文件大小和修改时间在 settle_seconds 内保持不变才视为写入完成，
+    不会读到上传或复制到一半的文件。
+    """
+
+    def __init__(self, image_processor, backend=WATCH_BACKEND, poll_interval=WATCH_POLL_INTERVAL,
+                 settle_seconds=WATCH_SETTLE_SECONDS, rescan_interval=WATCH_RESCAN_INTERVAL):
+        if backend not in WATCH_BACKENDS:
+            raise ValueError(f"不支持的监视方式: {backend}，可选 {WATCH_BACKENDS}")
+        self.image_processor = image_processor
+        self.screenshots_dir = image_processor.screenshots_dir
+        self.use_watchdog = backend == 'auto' and WATCHDOG_AVAILABLE
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.rescan_interval = rescan_interval
+        # 路径 -> (大小, 修改时间, 最近一次变化的时间)
+        self._candidates = {}
+        # 已返回给调用方的路径 -> (大小, 修改时间)
+        self._seen = {}
+        self._changed = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._observer = None
+
+    def _notify(self, path):
+        """系统通知回调（在 watchdog 线程中执行），只记录路径，由监视循环统一检查"""
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.screenshots_dir):
+            return
+        if not self.image_processor.is_screenshot_file(os.path.basename(path)):
+            return
+        with self._lock:
+            self._changed.add(os.path.join(self.screenshots_dir, os.path.basename(path)))
+        self._wakeup.set()
+
+    def _start_observer(self):
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory:
+                    return
+                # 上传工具常先写临时文件再重命名，重命名事件取目标路径
+                for path in (event.src_path, getattr(event, 'dest_path', None)):
+                    if path:
+                        watcher._notify(os.fsdecode(path))
+
+        self._observer = Observer()
+        self._observer.schedule(Handler(), self.screenshots_dir, recursive=False)
+        self._observer.daemon = True
+        self._observer.start()
+
+    def _scan(self):
+        """全量扫描目录中的截图"""
+        try:
+            return set(self.image_processor.get_screenshot_files())
+        except OSError as e:
+            logging.error(f"扫描截图目录失败: {e}")
+            return set()
+
+    def _check(self, paths, now):
+        """更新候选文件的状态，返回已写入完成的新文件"""
+        ready = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # 文件已删除或被重命名，之后同名文件重新出现时再处理
+                self._candidates.pop(path, None)
+                self._seen.pop(path, None)
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if self._seen.get(path) == signature:
+                continue
+            previous = self._candidates.get(path)
+            if previous is None or previous[:2] != signature:
+                self._candidates[path] = signature + (now,)
+                continue
+            if stat.st_size > 0 and now - previous[2] >= self.settle_seconds:
+                del self._candidates[path]
+                self._seen[path] = signature
+                ready.append(path)
+        return ready
+
+    def watch(self):
+        """
+        持续监视截图目录，每发现一批写入完成的截图就返回一次（按文件名排序）
+
+        启动时目录中已有的截图作为第一批返回；没有新文件时每次全量扫描后返回空列表，
+        便于调用方处理定时任务（如重试失败的截图）。调用 stop() 后结束。
+        """
+        if self.use_watchdog:
+            self._start_observer()
+            logging.info(f"开始监视截图目录（系统文件通知）: {self.screenshots_dir}")
+        else:
+            logging.info(f"开始监视截图目录（每 {self.poll_interval} 秒轮询）: {self.screenshots_dir}")
+
+        last_scan = None
+        try:
+            while not self._stopped.is_set():
+                now = time.monotonic()
+                with self._lock:
+                    paths = self._changed
+                    self._changed = set()
+                self._wakeup.clear()
+                scanned = not self.use_watchdog or last_scan is None or now - last_scan >= self.rescan_interval
+                if scanned:
+                    paths |= self._scan()
+                    last_scan = now
+                # 尚未写完的文件需要继续检查
+                paths |= set(self._candidates)
+
+                ready = self._check(paths, now)
+                if ready or scanned:
+                    yield sorted(ready)
+                if ready:
+                    continue
+
+                # 使用系统通知时，没有待确认的文件就一直等到下一次通知或全量扫描
+                if self.use_watchdog and not self._candidates:
+                    timeout = max(0.0, last_scan + self.rescan_interval - time.monotonic())
+                else:
+                    timeout = self.poll_interval
+                self._wakeup.wait(timeout)
+                # 收到通知后文件多半还在写入，稍等一个检查间隔再确认
+                if self.use_watchdog and self._wakeup.is_set():
+                    self._stopped.wait(min(self.poll_interval, self.settle_seconds))
+        finally:
+            self._stop_observer()
+
+    def _stop_observer(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+
+    def stop(self):
+        """停止监视（可在其他线程或信号处理函数中调用）"""
+        self._stopped.set()
+        self._wakeup.set()
@@ -0,0 +1,80 @@
+import os
+import sys
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from PIL import Image, ImageDraw
+
+from src.image_index import ImageDedupIndex, hamming_distance
+
+
+def render_screenshot(path, date, distance, duration):
+    """同一App版式，只有数字不同"""
+    image = Image.new('RGB', (1080, 2340), (245, 245, 245))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, 1080, 90), fill=(40, 160, 90))
+    draw.rectangle((0, 90, 1080, 1170), fill=(210, 225, 210))
+    for row, (label, value) in enumerate((('Date', date), ('Distance', f"{distance} km"), ('Time', duration))):
+        top = 1250 + row * 220
+        draw.rectangle((40, top, 1040, top + 180), outline=(40, 160, 90), width=4)
+        draw.text((80, top + 40), label, fill=(40, 160, 90))
+        draw.text((80, top + 100), value, fill='black')
+    image.save(path)
+    return path
+
+
+def test_same_layout_different_runs_are_not_skipped(tmp_path):
+    first = render_screenshot(str(tmp_path / 'run1.png'), '2024-05-01', 5.21, '00:30:02')
+    second = render_screenshot(str(tmp_path / 'run2.png'), '2024-05-08', 10.47, '00:58:40')
+    index = ImageDedupIndex(db_path=str(tmp_path / 'index.sqlite'), max_distance=3)
+    try:
+        # 两张截图的感知哈希落在近似阈值内
+        assert hamming_distance(index.compute_hashes(first)[1], index.compute_hashes(second)[1]) <= 3
+
+        key, duplicate = index.check_and_reserve(first, 'run1.png')
+        assert key and duplicate is None
+        index.commit(key)
+
+        key, duplicate = index.check_and_reserve(second, 'run2.png')
+        assert key and duplicate is None
+    finally:
+        index.close()
+
+
+def test_identical_content_is_skipped(tmp_path):
+    first = render_screenshot(str(tmp_path / 'run1.png'), '2024-05-01', 5.21, '00:30:02')
+    with open(first, 'rb') as source, open(tmp_path / 'renamed.png', 'wb') as target:
+        target.write(source.read())
+    index = ImageDedupIndex(db_path=str(tmp_path / 'index.sqlite'), max_distance=3)
+    try:
+        key, _ = index.check_and_reserve(first, 'run1.png')
+        index.commit(key)
+        key, duplicate = index.check_and_reserve(str(tmp_path / 'renamed.png'), 'renamed.png')
+        assert key is None
+        assert duplicate == ('run1.png', 0)
+    finally:
+        index.close()
+
+
+def test_reencoded_copy_is_skipped(tmp_path):
+    first = render_screenshot(str(tmp_path / 'run1.png'), '2024-05-01', 5.21, '00:30:02')
+    with Image.open(first) as image:
+        image.save(tmp_path / 'run1.jpg', quality=75)
+    db_path = str(tmp_path / 'index.sqlite')
+    index = ImageDedupIndex(db_path=db_path, max_distance=3)
+    try:
+        key, _ = index.check_and_reserve(first, 'run1.png')
+        index.commit(key)
+        index.persist()
+    finally:
+        index.close()
+
+    # 重新加载索引后，另存为JPEG的副本在OCR之前被拒绝
+    index = ImageDedupIndex(db_path=db_path, max_distance=3)
+    try:
+        key, duplicate = index.check_and_reserve(str(tmp_path / 'run1.jpg'), 'run1.jpg')
+        assert key is None
+        assert duplicate[0] == 'run1.png'
+    finally:
+        index.close()
@@ -0,0 +1,41 @@
+import os
+import sys
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from src.job_journal import JobJournal
+
+
+class Store:
+    def __init__(self, *image_files):
+        self.image_files = set(image_files)
+
+    def is_duplicate_record(self, image_filename):
+        return image_filename in self.image_files
+
+
+def test_skipped_job_is_requeued_when_its_original_fails(tmp_path):
+    screenshots = []
+    for name in ('run1.png', 'run1_copy.png'):
+        path = tmp_path / name
+        path.write_bytes(b'')
+        screenshots.append(str(path))
+    journal = JobJournal(db_path=str(tmp_path / 'journal.sqlite'), max_attempts=1)
+    try:
+        for path in screenshots:
+            journal.start(path)
+        # 副本在原截图处理完成前因内容重复被跳过，随后原截图失败
+        journal.finish('run1_copy.png', 'skipped', "与 run1.png 内容重复", duplicate_of='run1.png')
+        journal.finish('run1.png', 'failed', "AI分析失败")
+        journal.checkpoint()
+
+        assert journal.plan(screenshots, Store()) == [screenshots[1]]
+        assert journal.due_retries() == [screenshots[1]]
+
+        # 原截图成功时副本保持跳过
+        journal.start(screenshots[0])
+        journal.finish('run1.png', 'done')
+        assert journal.plan(screenshots, Store('run1.png')) == []
+    finally:
+        journal.close()
@@ -0,0 +1,21 @@
+import os
+import sys
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from src.metrics import Metrics
+
+
+def test_trace_file_is_rotated_by_size(tmp_path):
+    trace_file = str(tmp_path / 'trace.jsonl')
+    metrics = Metrics(trace_file=trace_file, prometheus_file=None, trace_max_size_mb=0.001, trace_backups=2)
+    for _ in range(10):
+        for _ in range(50):
+            metrics.record('chat', 0.1, image='run.png')
+        metrics.flush()
+
+    assert sorted(os.listdir(tmp_path)) == ['trace.jsonl', 'trace.jsonl.1', 'trace.jsonl.2']
+    for name in os.listdir(tmp_path):
+        # 单次写入可能超过上限，但不会超过上限加一批的大小
+        assert os.path.getsize(tmp_path / name) < 2 * 0.001 * 1024 * 1024 + 50 * 200
@@ -0,0 +1,58 @@
+import os
+import queue
+import sys
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from src.pipeline import ScreenshotPipeline, _Job, _SENTINEL
+
+
+class FakeAnalyzer:
+    use_paddle_ocr = False
+    paddle_ocr = None
+    analysis_mode = 'two_stage'
+
+
+class FailingDeduplicator:
+    def should_write(self, running_data, image_filename):
+        raise ValueError("cannot convert float NaN to integer")
+
+
+class FakeImageIndex:
+    def __init__(self):
+        self.released = []
+
+    def release(self, key):
+        self.released.append(key)
+
+
+class FakeJournal:
+    def __init__(self):
+        self.finished = {}
+
+    def finish(self, image_file, status, error=None, stage=None, timings=None, duplicate_of=None):
+        self.finished[image_file] = status
+
+    def checkpoint(self):
+        pass
+
+
+def test_writer_keeps_draining_after_exceptions():
+    image_index = FakeImageIndex()
+    job_journal = FakeJournal()
+    pipeline = ScreenshotPipeline(None, FakeAnalyzer(), record_writer=None, image_index=image_index,
+                                  record_deduplicator=FailingDeduplicator(), job_journal=job_journal)
+    write_queue = queue.Queue()
+    for index in range(3):
+        job = _Job(index, f"screenshots/run{index}.png")
+        job.running_data = {'distance_km': float('nan')}
+        job.dedup_key = f"key{index}"
+        write_queue.put(job)
+    write_queue.put(_SENTINEL)
+
+    pipeline._run_writer(write_queue)
+
+    assert pipeline.stats['failed'] == 3
+    assert image_index.released == ['key0', 'key1', 'key2']
+    assert set(job_journal.finished.values()) == {'failed'}
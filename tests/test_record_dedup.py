@@ -0,0 +1,22 @@
+import os
+import sys
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from src.record_dedup import RecordIndex, parse_distance, parse_duration
+
+
+def test_non_finite_values_are_not_parsed():
+    for value in ('nan', 'inf', '-inf', float('nan'), float('inf'), -1.5):
+        assert parse_distance(value) is None
+    assert parse_distance('5.21') == 5.21
+    assert parse_duration('inf:00') is None
+
+
+def test_non_finite_distance_does_not_break_the_index():
+    index = RecordIndex(distance_tolerance=0.1, duration_tolerance=60)
+    record = {'date': '2024-05-01', 'distance_km': float('nan'), 'duration': '00:30:00'}
+    index.add(record, 'run1.png')
+    assert index.find_match(record) is None
+    assert index.find_match(dict(record, distance_km='inf')) is None
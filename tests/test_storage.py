@@ -0,0 +1,51 @@
+import os
+import sys
+
+import pytest
+
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from src.excel_writer import ExcelWriter
+from src.storage import SQLiteWriter, export_to_excel
+
+
+def make_excel_store(path, image_files):
+    writer = ExcelWriter(path)
+    writer.create_or_load_excel()
+    for image_file in image_files:
+        writer.append_to_excel({'distance_km': 5.0, 'duration': '00:30:00', 'date': '2024-05-01'}, image_file)
+    writer.close()
+    return writer
+
+
+def test_new_sqlite_store_imports_existing_excel_records(tmp_path):
+    excel_file = str(tmp_path / 'running_records.xlsx')
+    make_excel_store(excel_file, ['run1.png', 'run2.png'])
+
+    writer = SQLiteWriter(str(tmp_path / 'running_records.sqlite'), seed_excel=excel_file)
+    try:
+        assert writer.create_or_load()
+        assert writer.is_duplicate_record('run1.png')
+        assert writer.filter_new(['a/run2.png', 'a/run3.png']) == ['a/run3.png']
+    finally:
+        writer.close()
+
+
+def test_export_refuses_to_overwrite_record_workbook(tmp_path):
+    excel_file = str(tmp_path / 'running_records.xlsx')
+    make_excel_store(excel_file, ['run1.png'])
+    writer = SQLiteWriter(str(tmp_path / 'running_records.sqlite'))
+    try:
+        writer.create_or_load()
+        with pytest.raises(FileExistsError):
+            export_to_excel(writer, excel_file)
+        assert [record['image_file'] for record in ExcelWriter(excel_file).iter_records()] == ['run1.png']
+
+        # 之前导出生成的文件可以覆盖
+        export_file = str(tmp_path / 'export.xlsx')
+        assert export_to_excel(writer, export_file) == 0
+        writer.append_record({'distance_km': 5.0}, 'run2.png')
+        assert export_to_excel(writer, export_file) == 1
+    finally:
+        writer.close()